@@ -0,0 +1,177 @@
+"""
+Times carrier lookups against a scratch database of synthetic carriers, 20,000 by default, comparing the indexed
+searches with the LIKE scans they replaced.
+
+Fragment searches, as used for autocomplete and partial names:
+    fts: search_carriers through the trigram FTS5 index
+    like: search_carriers' LIKE fallback, for SQLite builds without FTS5 trigram
+    old like: the LIKE scan the old find_carrier ran on long names, which stops at the first match
+Exact lookups, by a carrier's ID, short name, long name or channel:
+    nocase index: find_carrier_exact through the NOCASE indexes, with the carrier registry unloaded
+    registry: find_carrier_exact through the in-memory carrier registry
+    old like: the old find_carrier's LIKE scan on the same field
+
+Each is run for a mix of search terms: words shared by many carriers, parts of callsigns, carrier numbers, and terms
+which match nothing.
+
+Run from the repository root with: python -m bench.carrier_search [--carriers 20000] [--repeat 20] [--json]
+
+Depends on: database
+
+"""
+
+# import libraries
+import argparse
+from contextlib import redirect_stdout
+import json
+import os
+import random
+import time
+
+# the scratch database has to be set up before importing the bot's modules
+from bench import synthetic_db
+
+# import local modules
+from ptn.missionalertbot.database import database
+
+
+EXACT_FIELDS = ('cid', 'shortname', 'longname', 'discordchannel')
+
+
+# the old find_carrier, before the indexes and registry
+def old_find_carrier(searchterm, searchfield):
+    return database.carriers_conn.execute(
+        f"SELECT * FROM carriers WHERE {searchfield} LIKE (?)", (f'%{searchterm}%',)
+    ).fetchone()
+
+
+def fragment_terms(rows, rng, count):
+    """
+    Search terms as members type them: words shared by many carriers, callsign fragments, carrier numbers, and misses.
+
+    :param list[tuple] rows: The synthetic carriers' rows
+    :param random.Random rng: Source of the terms
+    :param int count: How many terms
+    :rtype: list[str]
+    """
+    terms = []
+    for index in range(count):
+        _, longname, cid, _, _, _ = rng.choice(rows)
+        kind = index % 4
+        if kind == 0:
+            terms.append(longname.split()[1].lower()[:5])
+        elif kind == 1:
+            terms.append(cid[:3])
+        elif kind == 2:
+            terms.append(longname.split()[-1])
+        else:
+            terms.append(f"qz{index}x")
+    return terms
+
+
+def time_queries(func, arguments, repeat):
+    """
+    Times func over every set of arguments, repeat times, and returns the mean time per call.
+
+    :param callable func: The lookup
+    :param list[tuple] arguments: Arguments for each call
+    :param int repeat: How many times to go through them
+    :returns: Mean microseconds per call
+    :rtype: float
+    """
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for args in arguments:
+            func(*args)
+    return (time.perf_counter() - started) / (repeat * len(arguments)) * 1e6
+
+
+def search_with_like(searchterm, limit):
+    database.carrier_fts_available = False
+    try:
+        return database.search_carriers(searchterm, limit)
+    finally:
+        database.carrier_fts_available = True
+
+
+def exact_without_registry(searchterm, searchfields):
+    database.carrier_registry.loaded = False
+    try:
+        return database.find_carrier_exact(searchterm, searchfields)
+    finally:
+        database.carrier_registry.loaded = True
+
+
+def run(carriers, repeat, terms=40, seed=1):
+    """
+    Builds the scratch database and times each lookup.
+
+    :param int carriers: How many synthetic carriers
+    :param int repeat: How many times to go through the terms for each lookup
+    :param int terms: How many fragment search terms, and how many exact ones
+    :param int seed: Seeds the carriers and the terms
+    :returns: Results for each lookup
+    :rtype: list[dict]
+    """
+    rows = synthetic_db.build(carriers, seed=seed)
+    if not database.carrier_fts_available:
+        raise RuntimeError("This SQLite build has no FTS5 trigram tokenizer, so there's no index to compare.")
+
+    rng = random.Random(seed)
+    fragments = fragment_terms(rows, rng, terms)
+    exact = []
+    for index in range(terms):
+        row = rng.choice(rows)
+        field = index % len(EXACT_FIELDS)
+        exact.append((EXACT_FIELDS[field], row[(2, 0, 1, 3)[field]].upper()))
+
+    # the indexed searches must find what the scans find
+    for term in fragments:
+        if ({carrier.pid for carrier in database.search_carriers(term, carriers)}
+                != {carrier.pid for carrier in search_with_like(term, carriers)}):
+            raise RuntimeError(f"The FTS5 and LIKE searches for '{term}' found different carriers.")
+    for field, term in exact:
+        if database.find_carrier_exact(term, (field,)).pid != exact_without_registry(term, (field,)).pid:
+            raise RuntimeError(f"The registry and NOCASE index found different carriers for {field} '{term}'.")
+
+    matches = sum(len(database.search_carriers(term, carriers)) for term in fragments) / len(fragments)
+    lookups = [
+        ('fragment', 'fts', database.search_carriers, [(term, 10) for term in fragments]),
+        ('fragment', 'like', search_with_like, [(term, 10) for term in fragments]),
+        ('fragment', 'old like', old_find_carrier, [(term, 'longname') for term in fragments]),
+        ('exact', 'nocase index', exact_without_registry, [(term, (field,)) for field, term in exact]),
+        ('exact', 'registry', database.find_carrier_exact, [(term, (field,)) for field, term in exact]),
+        ('exact', 'old like', old_find_carrier, [(term, field) for field, term in exact]),
+    ]
+    return [
+        {'search': search, 'lookup': lookup, 'carriers': carriers, 'terms': len(arguments),
+         'mean_matches': round(matches, 1) if search == 'fragment' else 1,
+         'us_per_query': round(time_queries(func, arguments, repeat), 1)}
+        for search, lookup, func, arguments in lookups
+    ]
+
+
+def format_results(results):
+    lines = [f"{'search':>10} {'lookup':>14} {'us/query':>10}"]
+    for result in results:
+        lines.append(f"{result['search']:>10} {result['lookup']:>14} {result['us_per_query']:>10}")
+    lines.append(f"{results[0]['carriers']} carriers, {results[0]['terms']} terms, "
+                 f"{results[0]['mean_matches']} fragment matches per term on average")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time indexed carrier searches against the LIKE scans they replaced.")
+    parser.add_argument('--carriers', type=int, default=20000, help="number of synthetic carriers")
+    parser.add_argument('--repeat', type=int, default=20, help="times to go through the search terms")
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    args = parser.parse_args()
+
+    # the bot logs every query, so keep that out of the results
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        results = run(args.carriers, args.repeat)
+    print(json.dumps(results, indent=4) if args.json else format_results(results))
+
+
+if __name__ == '__main__':
+    main()
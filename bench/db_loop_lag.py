@@ -0,0 +1,193 @@
+"""
+Measures how long the event loop is held up by the database while 50 /stock and /cco load commands run at once, with
+their queries run on the loop, as before they were moved to the database executor, and on the executor, as now.
+
+Each synthetic command makes the same database calls as the command it stands in for, against a scratch database of
+synthetic carriers, with a wait for Discord between them:
+    /stock: find_carrier by long name, find_mission_for_carrier, then recording the fetched market's stock history
+    /cco load: find_carrier by short name, the commodity search, find_mission_for_carrier, find_webhook_from_owner,
+        then updating the carrier's last trade
+The carrier registry and commodity index are left unloaded, so every lookup reaches SQLite as it did before they
+existed and the two modes do the same work. While the commands run, a task which should wake every millisecond records
+how late it wakes; that lateness is the loop lag any other command, or the gateway heartbeat, would see.
+
+Run from the repository root with: python -m bench.db_loop_lag [--carriers 20000] [--commands 50] [--rounds 5] [--json]
+
+Depends on: database
+
+"""
+
+# import libraries
+import argparse
+import asyncio
+from contextlib import redirect_stdout
+import json
+import os
+import random
+import statistics
+import time
+
+# the scratch database has to be set up before importing the bot's modules
+from bench import synthetic_db
+
+# import local modules
+from ptn.missionalertbot.database import database
+
+
+MODES = ('loop', 'executor')
+
+# how often the lag monitor wants to wake
+LAG_INTERVAL = 0.001
+
+COMMODITY_TERMS = ['gold', 'tritium', 'indite', 'bertrandite', 'silver', 'palladium', 'agronomic']
+
+
+# a fetched market, as stock_history_rows takes it
+def synthetic_market(rng):
+    return [
+        {'name': f'Commodity{index}', 'stock': rng.randint(0, 25000), 'buyPrice': rng.randint(0, 50000),
+         'sellPrice': 0, 'demand': 0}
+        for index in range(20)
+    ]
+
+
+class CommandRunner:
+    def __init__(self, mode, rows, discord_latency, seed):
+        """
+        Class runs the synthetic commands, making their database calls either on the loop or on the executor.
+
+        :param str mode: 'loop' or 'executor'
+        :param list[tuple] rows: The synthetic carriers' rows, in p_ID order
+        :param float discord_latency: Seconds each wait for Discord takes
+        :param int seed: Seeds the choice of carriers and markets
+        """
+        self.mode = mode
+        self.rows = rows
+        self.discord_latency = discord_latency
+        self.rng = random.Random(seed)
+        # stock snapshots are unique per carrier, commodity and time, so give each its own time
+        self.snapshot_time = 1_700_000_000
+
+    async def call(self, func, *args):
+        if self.mode == 'loop':
+            return func(*args)
+        return await database.run_db_query(func, *args)
+
+    async def discord(self):
+        await asyncio.sleep(self.discord_latency)
+
+    async def stock(self):
+        _, longname, cid, _, _, _ = self.rng.choice(self.rows)
+        carrier_data = await self.call(database.find_carrier, longname, 'longname')
+        await self.call(database.find_mission_for_carrier, carrier_data)
+        # the market fetch
+        await self.discord()
+        self.snapshot_time += 1
+        rows = database.stock_history_rows(cid, synthetic_market(self.rng), 'capi', self.snapshot_time)
+        await self.call(database._insert_stock_history, rows)
+        await self.discord()
+
+    async def cco_load(self):
+        shortname, _, _, _, _, ownerid = self.rng.choice(self.rows)
+        carrier_data = await self.call(database.find_carrier, shortname, 'shortname')
+        await self.discord()
+        await self.call(database._fetch_all, database.carriers_conn,
+                        "SELECT * FROM commodities WHERE commodity LIKE (?)", (f'%{self.rng.choice(COMMODITY_TERMS)}%',))
+        await self.call(database.find_mission_for_carrier, carrier_data)
+        await self.call(database.find_webhook_from_owner, ownerid)
+        await self.discord()
+        await self.call(database._execute_and_commit, database.carriers_conn,
+                        "UPDATE carriers SET lasttrade = strftime('%s','now') WHERE p_ID = ?", (carrier_data.pid,))
+        await self.discord()
+
+
+# how late a task asking to wake every LAG_INTERVAL wakes, until stopped
+async def monitor_lag(lags, stop):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        lags.append(time.perf_counter() - started - LAG_INTERVAL)
+
+
+async def run_mode(mode, rows, commands, rounds, discord_latency, seed):
+    runner = CommandRunner(mode, rows, discord_latency, seed)
+    lags = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_lag(lags, stop))
+    # let the monitor settle before the commands start
+    await asyncio.sleep(LAG_INTERVAL * 10)
+    lags.clear()
+
+    round_times = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        await asyncio.gather(*[runner.stock() if index % 2 else runner.cco_load() for index in range(commands)])
+        round_times.append(time.perf_counter() - started)
+
+    stop.set()
+    await monitor
+
+    lags.sort()
+    return {
+        'mode': mode,
+        'commands': commands,
+        'rounds': rounds,
+        'lag_p50_ms': round(lags[len(lags) // 2] * 1000, 3),
+        'lag_p99_ms': round(lags[int(len(lags) * 0.99)] * 1000, 3),
+        'lag_max_ms': round(lags[-1] * 1000, 3),
+        'round_ms': round(statistics.median(round_times) * 1000, 3),
+    }
+
+
+def run(carriers, commands, rounds, discord_latency, seed=1):
+    """
+    Builds the scratch database, then runs the commands with their queries on the loop and on the executor.
+
+    :param int carriers: How many synthetic carriers
+    :param int commands: How many commands run at once, half /stock and half /cco load
+    :param int rounds: How many times to run them
+    :param float discord_latency: Seconds each wait for Discord takes
+    :param int seed: Seeds the carriers and the commands' choices, so both modes do the same work
+    :returns: Results for each mode
+    :rtype: list[dict]
+    """
+    rows = synthetic_db.build(carriers, missions=carriers, webhooks=carriers // 10, seed=seed)
+    # reach SQLite for every lookup, as the commands did before the registry and index existed
+    database.carrier_registry.loaded = False
+    database.commodity_index.loaded = False
+
+    results = []
+    for mode in MODES:
+        result = asyncio.run(run_mode(mode, rows, commands, rounds, discord_latency, seed))
+        result['carriers'] = carriers
+        results.append(result)
+    return results
+
+
+def format_results(results):
+    lines = [f"{'mode':>10} {'lag p50 ms':>12} {'lag p99 ms':>12} {'lag max ms':>12} {'round ms':>10}"]
+    for result in results:
+        lines.append(f"{result['mode']:>10} {result['lag_p50_ms']:>12} {result['lag_p99_ms']:>12} "
+                     f"{result['lag_max_ms']:>12} {result['round_ms']:>10}")
+    first = results[0]
+    lines.append(f"{first['commands']} concurrent commands x {first['rounds']} rounds, {first['carriers']} carriers")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure event loop lag with database calls on and off the loop.")
+    parser.add_argument('--carriers', type=int, default=20000, help="number of synthetic carriers")
+    parser.add_argument('--commands', type=int, default=50, help="commands run at once")
+    parser.add_argument('--rounds', type=int, default=5, help="times to run the commands")
+    parser.add_argument('--discord-latency', type=float, default=0.02, help="seconds each wait for Discord takes")
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    args = parser.parse_args()
+
+    # the bot logs every query, so keep that out of the results
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        results = run(args.carriers, args.commands, args.rounds, args.discord_latency)
+    print(json.dumps(results, indent=4) if args.json else format_results(results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Scratch databases filled with synthetic carriers, missions and webhooks, for the database benchmarks.
+
+Importing this points the bot at a new scratch data directory and builds its databases there, so it has to be imported
+before any of the bot's modules and never touches real data.
+
+Depends on: database
+
+"""
+
+# import libraries
+from contextlib import redirect_stdout
+import os
+import random
+import sys
+import tempfile
+
+
+# the bot reads its settings when its modules are first imported, so point it at a scratch data directory first
+os.environ['PTN_MAB_DATA_DIR'] = tempfile.mkdtemp(prefix='mab-bench-')
+
+# the bot logs its setup as it's imported, so keep that out of the benchmarks' results
+with redirect_stdout(sys.stderr):
+    # import local constants
+    import ptn.missionalertbot.constants as constants
+
+    # import local modules
+    from ptn.missionalertbot.database import database
+
+if constants.DATA_DIR != os.environ['PTN_MAB_DATA_DIR']:
+    raise RuntimeError("The bot's modules were imported before bench.synthetic_db, so they'd use the real data "
+                       "directory. Import bench.synthetic_db first.")
+
+
+_WORDS = [
+    'Aurora', 'Bastion', 'Cascade', 'Drifter', 'Ember', 'Fortune', 'Gallant', 'Harbinger', 'Indigo', 'Juniper',
+    'Kestrel', 'Lantern', 'Meridian', 'Nomad', 'Odyssey', 'Pilgrim', 'Quasar', 'Radiant', 'Sovereign', 'Tempest',
+    'Umbra', 'Vanguard', 'Wayfarer', 'Xenith', 'Yonder', 'Zephyr', 'Galaxy', 'Trader', 'Hauler', 'Star',
+]
+
+_CALLSIGN_CHARACTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+
+
+def carrier_row(number, rng):
+    """
+    Makes a plausible carrier, unique by its number.
+
+    :param int number: The carrier's number
+    :param random.Random rng: Source of the carrier's words and callsign
+    :returns: Values for shortname, longname, cid, discordchannel, channelid and ownerid
+    :rtype: tuple
+    """
+    longname = f"P.T.N. {rng.choice(_WORDS)} {rng.choice(_WORDS)} {number}"
+    shortname = f"{longname.split()[1].lower()}{number}"
+    callsign = ''.join(rng.choice(_CALLSIGN_CHARACTERS) for _ in range(6))
+    cid = f"{callsign[:3]}-{callsign[3:]}"
+    discordchannel = longname.lower().replace('.', '').replace(' ', '-')
+    return shortname, longname, cid, discordchannel, 10 ** 17 + number, 2 * 10 ** 17 + number
+
+
+def build(carriers, missions=0, webhooks=0, seed=1):
+    """
+    Builds the scratch databases and fills them with synthetic carriers, plus missions and webhooks for the first of
+    them. The carrier registry and commodity index are loaded as at startup.
+
+    :param int carriers: How many carriers
+    :param int missions: How many of them have an active mission
+    :param int webhooks: How many of their owners have a webhook
+    :param int seed: Seeds the carriers' names and callsigns, so runs are comparable
+    :returns: The carriers' rows, in p_ID order
+    :rtype: list[tuple]
+    """
+    database.build_database_on_startup()
+    database.populate_commodities_table_on_startup()
+
+    rng = random.Random(seed)
+    rows = [carrier_row(number, rng) for number in range(1, carriers + 1)]
+    database.carriers_conn.executemany(
+        "INSERT INTO carriers (shortname, longname, cid, discordchannel, channelid, ownerid) VALUES (?, ?, ?, ?, ?, ?)",
+        rows
+    )
+    database.carriers_conn.executemany(
+        "INSERT INTO webhooks (webhook_owner_id, webhook_url, webhook_name) VALUES (?, ?, ?)",
+        [(row[5], f"https://discord.com/api/webhooks/{row[5]}/synthetic", 'synthetic') for row in rows[:webhooks]]
+    )
+    database.carriers_conn.commit()
+    database.missions_conn.executemany(
+        "INSERT INTO missions (carrier, cid, channelid, commodity, missiontype, system, carrier_pid) "
+        "VALUES (?, ?, ?, 'Gold', 'load', 'HIP 58832', ?)",
+        [(row[1], row[2], row[4], pid) for pid, row in enumerate(rows[:missions], start=1)]
+    )
+    database.missions_conn.commit()
+
+    # rebuild what startup builds from the carriers table
+    database.build_carrier_search_indexes()
+    database.load_carrier_registry()
+    return rows
@@ -0,0 +1,406 @@
+"""
+An offline replay of the WMM stock cycle, for measuring it without Discord, cAPI or Inara.
+
+The recorded cAPI and Inara responses in tests/fixtures are served to N synthetic WMM carriers by local stub HTTP
+servers, and each cycle goes through the same fetch, aggregate, render and publish steps as wmm_stock:
+fetch_wmm_carrier_stocks, WMMStockAggregate, wmm_stock_pages and cco_supplies_pages, then ChannelRenderer into fake
+channels which count the Discord calls made. For each N it reports the cycle's latency, HTTP calls, Discord calls and
+peak memory, for a cold cycle and for a repeat cycle served from the market cache with nothing changed. The stubs run
+in the same process, so the little they allocate counts towards peak memory.
+
+Run from the repository root with: python -m bench.wmm_replay [--carriers 10 100 1000] [--json]
+
+Depends on: constants, StockHelpers, WMMAggregator, WMMPages, ChannelRenderer
+
+"""
+
+# import libraries
+import argparse
+import asyncio
+from contextlib import redirect_stdout
+import json
+import os
+from pathlib import Path
+import socket
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from aiohttp import web
+
+
+FIXTURES = Path(__file__).parent.parent / 'tests' / 'fixtures'
+
+# the carrier identifier in the recorded responses, swapped for the one asked about
+RECORDED_CID = 'K8Y-T2G'
+
+
+# a port nothing is listening on
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+# the bot reads its settings when its modules are first imported, so point them at the stubs and a scratch data
+# directory before importing anything from it
+CAPI_PORT = _free_port()
+INARA_PORT = _free_port()
+os.environ['API_HOST'] = f'http://127.0.0.1:{CAPI_PORT}'
+os.environ['API_TOKEN'] = 'replay'
+os.environ['PTN_MAB_INARA_URL'] = f'http://127.0.0.1:{INARA_PORT}'
+os.environ['PTN_MAB_DATA_DIR'] = tempfile.mkdtemp(prefix='mab-replay-')
+
+# the bot logs its setup as it's imported, so keep that out of the results
+with redirect_stdout(sys.stderr):
+    # import local classes
+    from ptn.missionalertbot.classes.WMMData import WMMData
+
+    # import local constants
+    import ptn.missionalertbot.constants as constants
+
+    # import local modules
+    from ptn.missionalertbot.modules import StockHelpers
+    from ptn.missionalertbot.modules.ChannelRenderer import ChannelRenderer
+    from ptn.missionalertbot.modules.StockHelpers import fetch_wmm_carrier_stocks, http_request_counts, market_cache, \
+        close_http_session, inara_market_time
+    from ptn.missionalertbot.modules.WMMAggregator import WMMStockAggregate
+    from ptn.missionalertbot.modules.WMMPages import wmm_stock_pages, cco_supplies_pages
+
+if StockHelpers.API_HOST != os.environ['API_HOST'] or constants.INARA_URL != os.environ['PTN_MAB_INARA_URL']:
+    raise RuntimeError("The bot's modules were imported before the replay harness, so they'd fetch from the real cAPI "
+                       "and Inara. Import bench.wmm_replay first.")
+
+
+class StubServers:
+
+    def __init__(self):
+        """
+        Class serves the recorded cAPI and Inara responses from a thread of its own, so serving them isn't timed as
+        part of the cycle, and counts the requests made to each.
+        """
+        self.requests = {'capi': 0, 'inara': 0}
+        self._capi_body = (FIXTURES / 'capi' / 'fleetcarrier.json').read_bytes()
+        self._inara_body = (FIXTURES / 'inara' / 'market.html').read_bytes()
+        self._loop = None
+        self._thread = None
+        self._runners = []
+
+    def start(self):
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(ready,), name='replay-stubs', daemon=True)
+        self._thread.start()
+        ready.wait()
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def _run(self, ready):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._serve())
+        ready.set()
+        self._loop.run_forever()
+        self._loop.close()
+
+    async def _serve(self):
+        capi = web.Application()
+        capi.router.add_get('/capi/{cid}', self._capi)
+        inara = web.Application()
+        inara.router.add_get('/elite/station-market/', self._inara)
+        for app, port in [(capi, CAPI_PORT), (inara, INARA_PORT)]:
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            await web.TCPSite(runner, '127.0.0.1', port).start()
+            self._runners.append(runner)
+
+    async def _cleanup(self):
+        for runner in self._runners:
+            await runner.cleanup()
+
+    async def _capi(self, request):
+        self.requests['capi'] += 1
+        body = self._capi_body.replace(RECORDED_CID.encode(), request.match_info['cid'].encode())
+        return web.Response(body=body, content_type='application/json')
+
+    async def _inara(self, request):
+        self.requests['inara'] += 1
+        body = self._inara_body.replace(RECORDED_CID.encode(), request.query['search'].encode())
+        return web.Response(body=body, content_type='text/html')
+
+
+class FakeMessage:
+
+    def __init__(self, channel, content):
+        """
+        Class stands in for a discord.Message sent by the bot, counting edits and deletes against its channel.
+
+        :param FakeChannel channel: The channel it was sent to
+        :param str content: The message's content
+        """
+        self.channel = channel
+        self.content = content
+
+    async def edit(self, content=None):
+        self.channel.count('edit')
+        self.content = content
+        return self
+
+    async def delete(self):
+        self.channel.count('delete')
+        self.channel.messages.remove(self)
+
+
+class FakeChannel:
+
+    def __init__(self, channel_id, latency=0):
+        """
+        Class stands in for a discord.TextChannel, starting empty and counting the calls made to it.
+
+        :param int channel_id: The channel's ID
+        :param float latency: Seconds each call takes, to stand in for Discord's round trip
+        """
+        self.id = channel_id
+        self.latency = latency
+        self.messages = []
+        self.calls = {}
+
+    def count(self, call):
+        self.calls[call] = self.calls.get(call, 0) + 1
+
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    async def _round_trip(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def history(self, limit=100):
+        self.count('history')
+        await self._round_trip()
+        # clear_history only deletes the bot's own messages, and this channel starts empty
+        for message in []:
+            yield message
+
+    async def delete_messages(self, messages):
+        # discord.py makes no request for an empty list
+        if not messages:
+            return
+        self.count('delete_messages')
+        await self._round_trip()
+        for message in messages:
+            self.messages.remove(message)
+
+    async def send(self, content):
+        self.count('send')
+        await self._round_trip()
+        message = FakeMessage(self, content)
+        self.messages.append(message)
+        return message
+
+
+def synthetic_carriers(count):
+    """
+    Makes WMM carriers spread across the WMM stations, with every fourth one tracked through Inara rather than cAPI.
+
+    :param int count: How many carriers
+    :rtype: list[WMMData]
+    """
+    return [
+        WMMData({
+            'carrier': f'P.T.N. Replay {number}',
+            'cid': f'R{number // 1000:02d}-{number % 1000:03d}',
+            'location': constants.locations_wmm[number % len(constants.locations_wmm)],
+            'ownerid': 0,
+            'notify': None,
+            'capi': 1 if number % 4 else 0,
+        })
+        for number in range(count)
+    ]
+
+
+def aggregate_markets(carriers, fetched):
+    """
+    Loads the fetched markets into a WMMStockAggregate the way wmm_stock does for carriers whose fetch succeeded.
+
+    :param list[WMMData] carriers: The carriers
+    :param dict fetched: The results of fetch_wmm_carrier_stocks
+    :returns: The computed aggregate, and every location with a tracked carrier in display order
+    :rtype: tuple
+    """
+    wmm_aggregate = WMMStockAggregate()
+    wmm_systems = []
+    for carrier in carriers:
+        if carrier.carrier_location not in wmm_systems:
+            wmm_systems.append(carrier.carrier_location)
+
+        result = fetched[carrier.carrier_identifier]
+        if result['error']:
+            continue
+        if carrier.capi and result['capi_status'] == 200:
+            stn_data = result['capi_data']
+            carrier_name = f"**{carrier.carrier_name} ({carrier.carrier_identifier})**"
+            market_updated = ''
+            system = stn_data['currentStarSystem']
+            commodities = stn_data['market']['commodities']
+        elif result['inara_data']:
+            stn_data = result['inara_data']
+            carrier_name = stn_data['full_name'].upper()
+            market_time = inara_market_time(stn_data['market_updated'])
+            market_updated = "(As of <t:%d:R>)" % market_time.timestamp() if market_time else "(As of %s)" % stn_data['market_updated']
+            system = stn_data['name'].title()
+            commodities = stn_data['commodities']
+        else:
+            continue
+        wmm_aggregate.add_market(carrier, system, carrier_name, market_updated, commodities)
+
+    wmm_aggregate.compute()
+    return wmm_aggregate, wmm_systems
+
+
+async def replay_cycle(carriers, stubs, channels, renderers):
+    """
+    Runs one WMM stock cycle for the carriers against the stubs, publishing to the fake channels.
+
+    :param list[WMMData] carriers: The carriers
+    :param StubServers stubs: The stub servers
+    :param list[FakeChannel] channels: The WMM stock and CCO supplies channels
+    :param list[ChannelRenderer] renderers: Their renderers, which remember what each channel shows between cycles
+    :returns: The cycle's stage timings and call counts
+    :rtype: dict
+    """
+    wmm_channel, cco_channel = channels
+    wmm_renderer, cco_renderer = renderers
+    stub_requests_before = sum(stubs.requests.values())
+    http_requests_before = sum(http_request_counts.values())
+    discord_calls_before = sum(channel.total_calls() for channel in channels)
+
+    cycle_started = time.perf_counter()
+    fetched = await fetch_wmm_carrier_stocks(carriers)
+    fetch_seconds = time.perf_counter() - cycle_started
+
+    aggregate_started = time.perf_counter()
+    wmm_aggregate, wmm_systems = aggregate_markets(carriers, fetched)
+    aggregate_seconds = time.perf_counter() - aggregate_started
+
+    render_started = time.perf_counter()
+    wmm_pages = wmm_stock_pages(wmm_aggregate, wmm_systems, "<t:%d:R>" % time.time())
+    cco_pages = cco_supplies_pages(wmm_aggregate)
+    render_seconds = time.perf_counter() - render_started
+
+    publish_started = time.perf_counter()
+    await wmm_renderer.render(wmm_channel, wmm_pages)
+    await cco_renderer.render(cco_channel, cco_pages)
+    publish_seconds = time.perf_counter() - publish_started
+
+    return {
+        'carriers': len(carriers),
+        'latency_seconds': time.perf_counter() - cycle_started,
+        'fetch_seconds': fetch_seconds,
+        'aggregate_seconds': aggregate_seconds,
+        'render_seconds': render_seconds,
+        'publish_seconds': publish_seconds,
+        'http_calls': sum(stubs.requests.values()) - stub_requests_before,
+        'http_calls_counted': sum(http_request_counts.values()) - http_requests_before,
+        'discord_calls': sum(channel.total_calls() for channel in channels) - discord_calls_before,
+        'errors': sum(1 for result in fetched.values() if result['error']),
+        'pages': len(wmm_pages) + len(cco_pages),
+    }
+
+
+async def replay_carriers(count, stubs, trace_memory, discord_latency=0):
+    """
+    Replays a cold cycle and a repeat cycle for the given number of carriers, starting from an empty market cache and
+    empty channels.
+
+    :param int count: How many carriers
+    :param StubServers stubs: The stub servers
+    :param bool trace_memory: Record each cycle's peak memory with tracemalloc, which slows the cycle down
+    :param float discord_latency: Seconds each Discord call takes
+    :returns: The cold and repeat cycles' results
+    :rtype: list[dict]
+    """
+    carriers = synthetic_carriers(count)
+    for carrier in carriers:
+        market_cache.invalidate(carrier.carrier_identifier)
+    channels = [FakeChannel(1, discord_latency), FakeChannel(2, discord_latency)]
+    renderers = [ChannelRenderer('replay WMM stock'), ChannelRenderer('replay CCO supplies')]
+
+    results = []
+    for cycle in ['cold', 'repeat']:
+        if trace_memory:
+            tracemalloc.start()
+        result = await replay_cycle(carriers, stubs, channels, renderers)
+        if trace_memory:
+            result['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        result['cycle'] = cycle
+        results.append(result)
+    return results
+
+
+async def replay(counts, discord_latency=0, memory=True):
+    """
+    Replays the WMM stock cycle for each number of carriers. Latency is measured in one pass and peak memory in a
+    second, since tracing memory slows the cycle down.
+
+    :param list[int] counts: The numbers of carriers to replay
+    :param float discord_latency: Seconds each Discord call takes
+    :param bool memory: Measure peak memory too
+    :returns: The cold and repeat cycles' results for each number of carriers, in order
+    :rtype: list[dict]
+    """
+    stubs = StubServers()
+    stubs.start()
+    try:
+        results = []
+        for count in counts:
+            timed = await replay_carriers(count, stubs, trace_memory=False, discord_latency=discord_latency)
+            if memory:
+                traced = await replay_carriers(count, stubs, trace_memory=True, discord_latency=discord_latency)
+                for result, traced_result in zip(timed, traced):
+                    result['peak_memory_bytes'] = traced_result['peak_memory_bytes']
+            results.extend(timed)
+        return results
+    finally:
+        await close_http_session()
+        stubs.stop()
+
+
+def format_results(results):
+    """
+    Lays out replay results as a table.
+
+    :param list[dict] results: The results from replay
+    :rtype: str
+    """
+    lines = ["carriers  cycle   latency s  fetch s  aggregate s  render s  publish s  HTTP  Discord  errors  peak MiB"]
+    for result in results:
+        peak = result.get('peak_memory_bytes')
+        lines.append("%8d  %-6s  %9.3f  %7.3f  %11.4f  %8.4f  %9.4f  %4d  %7d  %6d  %8s" % (
+            result['carriers'], result['cycle'], result['latency_seconds'], result['fetch_seconds'],
+            result['aggregate_seconds'], result['render_seconds'], result['publish_seconds'], result['http_calls'],
+            result['discord_calls'], result['errors'], "%.1f" % (peak / 2 ** 20) if peak is not None else "-"))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the WMM stock cycle against recorded cAPI and Inara responses.")
+    parser.add_argument('--carriers', type=int, nargs='+', default=[10, 100, 1000], help="numbers of carriers to replay")
+    parser.add_argument('--discord-latency', type=float, default=0, help="seconds each Discord call takes")
+    parser.add_argument('--no-memory', action='store_true', help="skip measuring peak memory")
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    args = parser.parse_args()
+
+    # the bot logs as it goes, so keep that out of the results
+    with redirect_stdout(sys.stderr):
+        results = asyncio.run(replay(args.carriers, args.discord_latency, memory=not args.no_memory))
+    print(json.dumps(results, indent=4) if args.json else format_results(results))
+
+
+if __name__ == '__main__':
+    main()
@@ -8,7 +8,10 @@ import asyncio
 import os
 
 # import build functions
-from ptn.missionalertbot.database.database import build_database_on_startup, populate_commodities_table_on_startup
+from ptn.missionalertbot.database.database import build_database_on_startup, populate_commodities_table_on_startup, write_queue
+from ptn.missionalertbot.database.Backups import flush_pending_backups
+from ptn.missionalertbot.modules.StockHelpers import close_http_session
+from ptn.missionalertbot.modules.RedditClient import close_reddit
 
 # import bot Cogs
 from ptn.missionalertbot.botcommands.GeneralCommands import GeneralCommands
@@ -38,7 +41,14 @@ async def missionalertbot():
         await bot.add_cog(CTeamCommands(bot))
         await bot.add_cog(DatabaseInteraction(bot))
         await bot.add_cog(StockTracker(bot))
-        await bot.start(TOKEN)
+        try:
+            await bot.start(TOKEN)
+        finally:
+            # close the stock and Reddit HTTP clients and commit any queued writes, then don't lose any backups that were requested but not yet taken
+            await close_http_session()
+            await close_reddit()
+            await write_queue.flush()
+            await flush_pending_backups()
 
 
 if __name__ == '__main__':
@@ -27,7 +27,7 @@ from ptn.missionalertbot.classes.Views import ConfirmRemoveRoleView, ConfirmGran
 from ptn.missionalertbot.classes.WMMData import WMMData
 
 # import local modules
-from ptn.missionalertbot.database.database import find_mission, find_webhook_from_owner, add_webhook_to_database, find_webhook_by_name, delete_webhook_by_name, \
+from ptn.missionalertbot.database.database import find_mission_for_carrier, find_webhook_from_owner, add_webhook_to_database, find_webhook_by_name, delete_webhook_by_name, \
     CarrierDbFields, find_carrier, _update_carrier_last_trade, add_carrier_to_database, _update_carrier_capi, _add_to_wmm_db, find_wmm_carrier, _remove_from_wmm_db, \
     _update_wmm_carrier
 from ptn.missionalertbot.modules.DateString import get_mission_delete_hammertime, get_inactive_hammertime
@@ -38,7 +38,7 @@ from ptn.missionalertbot.modules.ImageHandling import assign_carrier_image
 from ptn.missionalertbot.modules.MissionGenerator import confirm_send_mission_via_button
 from ptn.missionalertbot.modules.MissionCleaner import _cleanup_completed_mission
 from ptn.missionalertbot.modules.MissionEditor import edit_active_mission
-from ptn.missionalertbot.modules.StockHelpers import capi, oauth_new
+from ptn.missionalertbot.modules.StockHelpers import capi_cached, oauth_new_async
 from ptn.missionalertbot.modules.BackgroundTasks import wmm_stock, start_wmm_task
 
 
@@ -164,7 +164,7 @@ async def cco_mission_complete(interaction, carrier, is_complete, message):
         f'{current_channel}')
 
     # resolve the carrier from the carriers db
-    carrier_data = flexible_carrier_search_term(carrier)
+    carrier_data = await flexible_carrier_search_term(carrier)
     if not carrier_data:  # error condition
         try:
             error = f"No carrier found for '**{carrier}**.'"
@@ -174,7 +174,7 @@ async def cco_mission_complete(interaction, carrier, is_complete, message):
             return
 
     try:
-        mission_data = find_mission(carrier_data.carrier_long_name, "carrier")
+        mission_data = find_mission_for_carrier(carrier_data)
         if not mission_data:
             try:
                 raise CustomError(f"Search term `{carrier}` resolved to **{carrier_data.carrier_long_name}** but this carrier does not appear to have an active mission.")
@@ -384,7 +384,7 @@ class CCOCommands(commands.Cog):
             # find the target carrier
             print("Looking for carrier data")
             try:
-                carrier_data = flexible_carrier_search_term(carrier)
+                carrier_data = await flexible_carrier_search_term(carrier)
                 if not carrier_data:
                     raise CustomError(f"No carrier found matching {carrier}.")
             except CustomError as e:
@@ -392,7 +392,7 @@ class CCOCommands(commands.Cog):
 
             # find mission data for carrier
             try:
-                mission_data = find_mission(carrier_data.carrier_long_name, 'Carrier')
+                mission_data = find_mission_for_carrier(carrier_data)
                 if not mission_data:
                     raise CustomError(f"No active mission found for {carrier_data.carrier_long_name} ({carrier_data.carrier_identifier}).")
             except CustomError as e:
@@ -779,7 +779,7 @@ class CCOCommands(commands.Cog):
 
             for carrier in carrier_list:
                 # attempt to find matching carrier data
-                carrier_data = flexible_carrier_search_term(carrier)
+                carrier_data = await flexible_carrier_search_term(carrier)
                 
                 if not carrier_data:  # error condition
                     print(f"❌ No carrier found matching search term {carrier}")
@@ -792,12 +792,11 @@ class CCOCommands(commands.Cog):
 
                 fccode = carrier_data.carrier_identifier
 
-                capi_response = capi(fccode)
-                print(f"capi response: {capi_response.status_code}")
-                if capi_response.status_code != 200:
-                    r = oauth_new(fccode)
-                    oauth_response = r.json()
-                    print(f"capi_enable response {r.status_code} - {oauth_response}")
+                capi_status, _, _ = await capi_cached(fccode)
+                print(f"capi response: {capi_status}")
+                if capi_status != 200:
+                    oauth_status, oauth_response = await oauth_new_async(fccode)
+                    print(f"capi_enable response {oauth_status} - {oauth_response}")
                     if 'token' in oauth_response:
                         try:
                             # DM the carrier owner with oauth link
@@ -894,7 +893,7 @@ class CCOCommands(commands.Cog):
 
             for carrier in carrier_list:
                 # attempt to find matching carrier data
-                carrier_data = flexible_carrier_search_term(carrier)
+                carrier_data = await flexible_carrier_search_term(carrier)
                 
                 if not carrier_data:  # error condition
                     print(f"❌ No carrier found matching search term {carrier}")
@@ -972,7 +971,7 @@ class CCOCommands(commands.Cog):
             await interaction.response.send_message(embed=embed)
 
             # attempt to find matching carrier data
-            carrier_data = flexible_carrier_search_term(carrier)
+            carrier_data = await flexible_carrier_search_term(carrier)
             
             if not carrier_data:  # error condition
                 print(f"❌ No carrier found matching search term {carrier}")
@@ -1040,7 +1039,7 @@ class CCOCommands(commands.Cog):
 
             for carrier in carrier_list:
                 # attempt to find matching carrier data
-                carrier_data = flexible_carrier_search_term(carrier)
+                carrier_data = await flexible_carrier_search_term(carrier)
                 
                 if not carrier_data:  # error condition
                     print(f"❌ No carrier found matching search term {carrier}")
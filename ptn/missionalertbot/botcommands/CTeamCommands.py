@@ -23,7 +23,7 @@ from ptn.missionalertbot.constants import bot, cmentor_role, admin_role, cc_role
     roleapps_channel, verified_role, fc_complete_emoji, event_organiser_role
 
 # import local modules
-from ptn.missionalertbot.database.database import carrier_db
+from ptn.missionalertbot.database.database import carrier_db, delete_community_carrier_by_channel_from_db
 from ptn.missionalertbot.modules.ErrorHandler import on_app_command_error, GenericError, on_generic_error, CustomError
 from ptn.missionalertbot.modules.helpers import check_roles, _regex_alphanumeric_with_hyphens, _cc_owner_check, _cc_role_create_check, \
     _cc_create_channel, _cc_role_create, _cc_assign_permissions, _cc_db_enter, _remove_cc_role_from_owner, _cc_role_delete, _openclose_community_channel, \
@@ -443,7 +443,7 @@ class CTeamCommands(commands.Cog):
                                                     f"\nDeleting associated channel role.", color=constants.EMBED_COLOUR_QU)
                     await interaction.followup.send(embed=embed, ephemeral=True)
                     try:
-                        carrier_db.execute(f"DELETE FROM community_carriers WHERE channelid = {carrier.channel_id}")
+                        await delete_community_carrier_by_channel_from_db(carrier.channel_id)
                         owner = interaction.guild.get_member(carrier.owner_id)
                         embed = await _remove_cc_role_from_owner(interaction, owner) # this returns an embed but we'll only use it to pass into the next function
                         await _cc_role_delete(interaction, carrier.role_id, embed) # this returns an embed but we won't use it
@@ -26,15 +26,20 @@ from ptn.missionalertbot.constants import bot, bot_command_channel, bot_dev_chan
     admin_role, dev_role, trade_alerts_channel, mod_role, cpillar_role, bot_spam_channel, bot_role, mcomplete_id, alum_role
 
 # local modules
-from ptn.missionalertbot.database.database import backup_database, find_carrier, find_mission, _is_carrier_channel, \
-    mission_db, carrier_db, carrier_db_lock, carriers_conn, find_nominator_with_id, delete_nominee_by_nominator, find_community_carrier, \
-    CCDbFields, find_opt_ins, Settings, print_settings_file
+from ptn.missionalertbot.database.database import backup_database_now, find_carrier, find_mission, find_mission_exact, _is_carrier_channel, \
+    mission_db, add_nominee_to_database, find_nominator_with_id, delete_nominee_by_nominator, find_community_carrier, \
+    CCDbFields, find_opt_ins, Settings, print_settings_file, carrier_registry, write_queue, reddit_post_index
+from ptn.missionalertbot.database.QueryProfiler import query_profiler
 from ptn.missionalertbot.modules.Embeds import _is_mission_active_embed, _format_missions_embed, please_wait_embed
 from ptn.missionalertbot.modules.ErrorHandler import on_app_command_error, GenericError, CustomError, on_generic_error
 from ptn.missionalertbot.modules.helpers import bot_exit, check_roles, check_command_channel, unlock_mission_channel, lock_mission_channel, \
     check_mission_channel_lock, list_active_locks
-from ptn.missionalertbot.modules.BackgroundTasks import lasttrade_cron, _monitor_reddit_comments, start_wmm_task, wmm_stock
+from ptn.missionalertbot.modules.BackgroundTasks import lasttrade_cron, _monitor_reddit_comments, start_wmm_task, wmm_stock, stock_history_cron, \
+    wmm_scheduler, reddit_comment_stream, reddit_outbox_worker
 from ptn.missionalertbot.modules.MissionCleaner import check_trade_channels_on_startup
+from ptn.missionalertbot.modules.StockHelpers import market_cache, capi_breaker, inara_breaker
+from ptn.missionalertbot.modules.RedditClient import reddit_stats
+from ptn.missionalertbot.modules.RedditOutbox import reddit_outbox
 from ptn.missionalertbot.modules.DateString import get_inactive_hammertime, get_formatted_date_string
 
 
@@ -130,9 +135,15 @@ class GeneralCommands(commands.Cog):
         # start the lasttrade_cron loop if not running
         if not lasttrade_cron.is_running():
             lasttrade_cron.start()
+        # start thinning out stock history if not running
+        if not stock_history_cron.is_running():
+            stock_history_cron.start()
         # start monitoring reddit comments if not running
         if not _monitor_reddit_comments.is_running():
             _monitor_reddit_comments.start()
+        # start carrying out queued Reddit operations if not running
+        if not reddit_outbox_worker.is_running():
+            reddit_outbox_worker.start()
         # start wmm loop if not running, and our settings.txt allows it
         if constants.wmm_autostart:
             if not wmm_stock.is_running():
@@ -438,14 +449,15 @@ class GeneralCommands(commands.Cog):
 
 
     # backup databases
-    @admin_group.command(name='backup', description='Backs up the carrier and mission databases.')
+    @admin_group.command(name='backup', description='Backs up the carrier, mission and WMM databases.')
     @check_roles([admin_role()])
     @check_command_channel(bot_command_channel())
     async def backup(self, interaction: discord.Interaction):
         print(f"{interaction.user} requested a manual DB backup")
         try:
-            backup_database('missions')
-            backup_database('carriers')
+            await interaction.response.defer()
+            for database_name in ['missions', 'carriers', 'wmm']:
+                await asyncio.to_thread(backup_database_now, database_name)
         except Exception as e:
             error = f"Database backup failed: {e}"
             try:
@@ -458,6 +470,122 @@ class GeneralCommands(commands.Cog):
             color=constants.EMBED_COLOUR_OK
         )
 
+        await interaction.followup.send(embed=embed)
+
+
+    # show query profiling and carrier registry statistics
+    @admin_group.command(name='db_stats', description='Show the slowest database statements, carrier registry and write queue statistics.')
+    @describe(profiling='Turn query profiling on or off.', reset='Clear the collected statement statistics.')
+    @check_roles([admin_role()])
+    @check_command_channel(bot_command_channel())
+    async def db_stats(self, interaction: discord.Interaction, profiling: bool = None, reset: bool = False):
+        print(f"{interaction.user} requested database stats (profiling: {profiling}, reset: {reset})")
+
+        if profiling is not None:
+            query_profiler.enabled = profiling
+            print(f"Query profiling {'enabled' if profiling else 'disabled'} by {interaction.user}")
+        if reset:
+            query_profiler.reset()
+
+        embed = discord.Embed(
+            title="Database Statistics",
+            description=f"Query profiling is **{'on' if query_profiler.enabled else 'off'}** "
+                        f"(slow query threshold {query_profiler.slow_query_ms:g}ms). "
+                        f"Collecting since <t:{int(query_profiler.started)}:R>.",
+            color=constants.EMBED_COLOUR_OK
+        )
+
+        top_statements = query_profiler.top(5)
+        if not top_statements:
+            embed.add_field(name="Top statements", value="No statements recorded.", inline=False)
+        for rank, statement_stats in enumerate(top_statements, start=1):
+            statement = statement_stats.statement
+            if len(statement) > 300:
+                statement = statement[:297] + '...'
+            embed.add_field(
+                name=f"{rank}. {statement_stats.database_name}: {statement_stats.total_ms:.1f}ms total",
+                value=f"```sql\n{statement}```"
+                      f"Calls: {statement_stats.calls} • Rows: {statement_stats.rows} • "
+                      f"Mean: {statement_stats.mean_ms:.2f}ms • Max: {statement_stats.max_ms:.2f}ms\n"
+                      f"{statement_stats.histogram_string()}",
+                inline=False
+            )
+
+        registry_stats = carrier_registry.stats()
+        embed.add_field(
+            name="Carrier registry",
+            value=f"Carriers: {registry_stats['carriers']} • Hits: {registry_stats['hits']} • "
+                  f"Misses: {registry_stats['misses']} • Hit rate: {registry_stats['hit_rate']:.1%}",
+            inline=False
+        )
+
+        queue_stats = write_queue.stats()
+        embed.add_field(
+            name="Write queue",
+            value=f"Queued: {queue_stats['depth']} • Committed: {queue_stats['committed']} in {queue_stats['batches']} batch(es) • "
+                  f"Coalesced: {queue_stats['coalesced']} • Failed: {queue_stats['failed']}\n"
+                  f"Commit latency: last {queue_stats['last_commit_ms']:.1f}ms • mean {queue_stats['mean_commit_ms']:.1f}ms • "
+                  f"max {queue_stats['max_commit_ms']:.1f}ms",
+            inline=False
+        )
+
+        await interaction.response.send_message(embed=embed)
+
+
+    # show what the shared Reddit client has been doing
+    @admin_group.command(name='reddit_stats', description='Show Reddit client statistics.')
+    @check_roles([admin_role()])
+    @check_command_channel(bot_command_channel())
+    async def admin_reddit_stats(self, interaction: discord.Interaction):
+        print(f"{interaction.user} requested Reddit stats")
+
+        client_stats = reddit_stats()
+        created = f"created <t:{int(client_stats['created_at'])}:R>" if client_stats['created_at'] else "not yet created"
+        embed = discord.Embed(
+            title="Reddit Statistics",
+            description=f"Shared Reddit client is **{'open' if client_stats['open'] else 'closed'}**, {created}.",
+            color=constants.EMBED_COLOUR_REDDIT
+        )
+        embed.add_field(
+            name="Client",
+            value=f"Requests: {client_stats['requests']} • Token requests: {client_stats['token_requests']} • "
+                  f"Failed: {client_stats['failed']} • Clients created: {client_stats['clients_created']}",
+            inline=False
+        )
+
+        index_stats = reddit_post_index.stats()
+        embed.add_field(
+            name="Mission post index",
+            value=f"Active posts: {index_stats['posts']} • Hits: {index_stats['hits']} • Misses: {index_stats['misses']}",
+            inline=False
+        )
+
+        stream_stats = reddit_comment_stream.stats()
+        last_poll = f"<t:{int(stream_stats['last_poll_at'])}:R>" if stream_stats['last_poll_at'] else "never"
+        last_lag = f"{stream_stats['last_lag']:.0f}s" if stream_stats['last_lag'] is not None else "n/a"
+        max_lag = f"{stream_stats['max_lag']:.0f}s" if stream_stats['max_lag'] is not None else "n/a"
+        circuit = stream_stats['circuit']
+        circuit_state = circuit['state'] if circuit['retry_in'] is None else f"{circuit['state']}, retrying in {circuit['retry_in']:.0f}s"
+        embed.add_field(
+            name="Comment stream",
+            value=f"Checkpoint: {stream_stats['checkpoint'] or 'none'} • Last poll: {last_poll} • Polls: {stream_stats['polls']}\n"
+                  f"Handled: {stream_stats['processed']} ({stream_stats['per_hour']} in the last hour) • "
+                  f"Backlog: {stream_stats['backlog']} • Lag: {last_lag} (max {max_lag})\n"
+                  f"Skipped as stale: {stream_stats['skipped_stale']} • Failed to relay: {stream_stats['handler_failures']}\n"
+                  f"Circuit: {circuit_state} • Last error: {circuit['last_error'] or 'none'}",
+            inline=False
+        )
+
+        outbox_stats = reddit_outbox.stats()
+        last_done = f"<t:{int(outbox_stats['last_done_at'])}:R>" if outbox_stats['last_done_at'] else "never"
+        embed.add_field(
+            name="Outbox",
+            value=f"Pending: {outbox_stats['pending']} • Done: {outbox_stats['done']} (last {last_done}) • "
+                  f"Retried: {outbox_stats['retried']} • Given up: {outbox_stats['failed']}\n"
+                  f"Last error: {outbox_stats['last_error'] or 'none'}",
+            inline=False
+        )
+
         await interaction.response.send_message(embed=embed)
 
 
@@ -556,20 +684,46 @@ class GeneralCommands(commands.Cog):
             else:
                 print("✅ WMM task is running, returning status and next check interval.")
                 # generate hammertime for last loop and next loop
+                # carriers are refreshed on their own schedules, so the next check is whenever the next carrier is due
                 posix_time_now = get_formatted_date_string()[2]
-                next_loop_seconds = constants.wmm_interval - constants.wmm_slept_for
                 last_loop_absolute = posix_time_now - constants.wmm_slept_for
-                next_loop_absolute = posix_time_now + next_loop_seconds
+                next_due = wmm_scheduler.next_due()
                 last_hammertime = f"<t:{last_loop_absolute}:R>"
-                next_hammertime = f"<t:{next_loop_absolute}:R>"
+                next_hammertime = f"<t:{int(next_due)}:R>" if next_due else "after the current check"
 
                 embed = discord.Embed(
                     title="WMM STOCK TRACKER STATUS",
                     description=f"✅ WMM background task is running.\n:chart_with_upwards_trend: Last check: {last_hammertime}."
-                                f"\n:hourglass_flowing_sand: Next scheduled check {next_hammertime}."
-                                f"\n:timer: Current check interval: {int(constants.wmm_interval/60)} minutes.",
+                                f"\n:hourglass_flowing_sand: Next scheduled check {next_hammertime} ({len(wmm_scheduler)} carrier(s) scheduled)."
+                                f"\n:timer: Carriers are refreshed every {int(constants.WMM_MIN_REFRESH_SECONDS/60)} to {int(constants.wmm_interval/60)} minutes, "
+                                f"sooner when they're running low.",
                     color=constants.EMBED_COLOUR_OK
                 )
+                cycle_stats = constants.wmm_last_cycle_stats
+                if cycle_stats:
+                    embed.add_field(
+                        name="Last cycle",
+                        value=f"{cycle_stats['cycle_seconds']:.1f}s for {cycle_stats['carriers']} carrier(s), {cycle_stats['fetched']} fetched.\n"
+                              f"Fetch: {cycle_stats['fetch_seconds']:.2f}s ({cycle_stats['http_requests']} request(s)) • "
+                              f"Aggregate: {cycle_stats['aggregate_seconds']:.2f}s • Render: {cycle_stats['render_seconds']:.3f}s • "
+                              f"Publish: {cycle_stats['publish_seconds']:.2f}s ({cycle_stats['discord_calls']} Discord call(s))"
+                    )
+                cache_stats = market_cache.stats()
+                embed.add_field(
+                    name="Market cache",
+                    value=f"Cached: {cache_stats['entries']} • Hits: {cache_stats['hits']} • Misses: {cache_stats['misses']} • "
+                          f"Shared fetches: {cache_stats['coalesced']}"
+                )
+                for breaker in [capi_breaker, inara_breaker]:
+                    breaker_stats = breaker.stats()
+                    error_rate = f"{breaker_stats['error_rate']:.0%}" if breaker_stats['error_rate'] is not None else "n/a"
+                    value = f"Circuit: {breaker_stats['state']} • Errors: {error_rate} of {breaker_stats['requests']} recent request(s) • " \
+                            f"Skipped: {breaker_stats['refused']}"
+                    if breaker_stats['retry_in'] is not None:
+                        value += f"\nRetrying <t:{posix_time_now + int(breaker_stats['retry_in'])}:R>"
+                    if breaker_stats['last_error']:
+                        value += f"\nLast error: {breaker_stats['last_error'][:200]}"
+                    embed.add_field(name=breaker.name, value=value, inline=False)
                 embed.set_footer(text="/cco wmm update can trigger updates outwith the above schedule.")
 
             await interaction.edit_original_response(embed=embed)
@@ -699,7 +853,7 @@ class GeneralCommands(commands.Cog):
             # notify user
 
             embed = discord.Embed(
-                description=f":timer: WMM stock will now update every {interval} minutes.",
+                description=f":timer: WMM stock will now update at least every {interval} minutes.",
                 color=constants.EMBED_COLOUR_OK
             )
 
@@ -927,7 +1081,7 @@ class GeneralCommands(commands.Cog):
 
         # now look to see if the carrier is on an active mission
         print("Looking for mission by channel ID match")
-        mission_data = find_mission(interaction.channel.id, "channelid")
+        mission_data = find_mission_exact(interaction.channel.id, "channelid")
         if not mission_data:
             # if there's no result, return an error
             embed = discord.Embed(
@@ -989,18 +1143,8 @@ class GeneralCommands(commands.Cog):
 
         # enter nomination into nominees db
         try:
-            print("Locking carrier db...")
-            await carrier_db_lock.acquire()
-            print("Carrier DB locked.")
-            try:
-                carrier_db.execute(''' INSERT INTO nominees VALUES(?, ?, ?) ''',
-                                (interaction.user.id, user.id, reason))
-                carriers_conn.commit()
-                print("Registered nomination to database")
-            finally:
-                print("Unlocking carrier db...")
-                carrier_db_lock.release()
-                print("Carrier DB unlocked.")
+            await add_nominee_to_database(interaction.user.id, user.id, reason)
+            print("Registered nomination to database")
         except Exception as e:
             await interaction.response.send_message("Sorry, something went wrong and developers have been notified.", ephemeral=True)
             # notify in bot_spam
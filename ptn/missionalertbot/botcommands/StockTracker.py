@@ -29,9 +29,10 @@ from ptn.missionalertbot.constants import bot, certcarrier_role, trainee_role, r
     bot_spam_channel, get_guild
 
 # local modules
-from ptn.missionalertbot.database.database import find_carrier, find_mission
+from ptn.missionalertbot.database.database import find_carrier_exact_async, find_mission_for_carrier_async, CarrierDbFields, \
+    stock_history_rows, record_stock_history
 from ptn.missionalertbot.modules.helpers import check_roles, check_command_channel, flexible_carrier_search_term
-from ptn.missionalertbot.modules.StockHelpers import get_fc_stock
+from ptn.missionalertbot.modules.StockHelpers import get_fc_stock_async, inara_market_time
 from ptn.missionalertbot.modules.ErrorHandler import on_app_command_error, on_generic_error, CustomError, GenericError
 from ptn.missionalertbot.modules.MissionEditor import edit_discord_alerts
 
@@ -82,7 +83,7 @@ class StockTracker(commands.Cog):
             # attempt to find matching carrier data
             if not carrier:
                 # check if we're in a carrier's channel
-                carrier_data = find_carrier(interaction.channel.name, "discordchannel")
+                carrier_data = await find_carrier_exact_async(interaction.channel.name, CarrierDbFields.channelname.value)
 
                 if not carrier_data:
                     # no carrier data found, return a helpful error
@@ -93,7 +94,7 @@ class StockTracker(commands.Cog):
                 
             else:
                 # check for carriers by given search term
-                carrier_data = flexible_carrier_search_term(carrier)
+                carrier_data = await flexible_carrier_search_term(carrier)
                 
                 if not carrier_data:  # error condition
                     print(f"❌ No carrier found matching search term {carrier}")
@@ -105,7 +106,7 @@ class StockTracker(commands.Cog):
 
             # decide what to say about EDMC in the response footer
             edmc_string = "Run EDMC for more accurate and up-to-date stock information."
-            mission_data = find_mission(carrier_data.carrier_long_name, "carrier")
+            mission_data = await find_mission_for_carrier_async(carrier_data)
             if mission_data:
                 print(f"{carrier_data.carrier_long_name} is on a mission: {mission_data}")
                 mission_params: MissionParams = mission_data.mission_params
@@ -115,8 +116,9 @@ class StockTracker(commands.Cog):
             # fetch stock levels
             fcname = carrier_data.carrier_long_name
 
+            cache_age = None
             try:
-                stn_data = get_fc_stock(carrier_data.carrier_identifier, source)
+                stn_data, cache_age = await get_fc_stock_async(carrier_data.carrier_identifier, source)
                 print("Returned data from %s: %s" % ( carrier_data.carrier_identifier, stn_data ))
             except Exception as e:
                 try:
@@ -143,6 +145,18 @@ class StockTracker(commands.Cog):
                 await interaction.edit_original_response(embed=embed)
                 return
 
+            # keep the stock for the history, unless we've already seen it. Inara's market may be hours old, so it's
+            # recorded as of when Inara saw it, or not at all if we can't tell when that was
+            market_time = inara_market_time(stn_data['market_updated']) if source == 'inara' else None
+            if cache_age is None and (source == 'capi' or market_time):
+                try:
+                    timestamp = int(market_time.timestamp()) if market_time else None
+                    await record_stock_history(stock_history_rows(carrier_data.carrier_identifier, com_data, source, timestamp))
+                except Exception as e:
+                    print(f"Unable to record stock history: {e}")
+
+            cache_string = f"\nServed from cache, {int(cache_age)} seconds old." if cache_age is not None else ""
+
             table = Texttable()
             table.set_cols_align(["l", "r", "r"])
             table.set_cols_valign(["m", "m", "m"])
@@ -161,7 +175,7 @@ class StockTracker(commands.Cog):
             embed.color = constants.EMBED_COLOUR_OK
             embed.add_field(name = f"{fcname} ({stn_data['sName']}) stock", value = msg, inline = False)
             embed.add_field(name = 'FC Location', value = loc_data, inline = False)
-            embed.set_footer(text = f"Data last updated: {stn_data['market_updated']}\nData source: {source_formal}\n" \
+            embed.set_footer(text = f"Data last updated: {stn_data['market_updated']}\nData source: {source_formal}{cache_string}\n" \
                              + (f"\n{edmc_string}" if source == 'inara' else ""))
 
             await interaction.edit_original_response(embed=embed)
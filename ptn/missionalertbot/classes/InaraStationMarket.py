@@ -0,0 +1,55 @@
+class InaraStationMarket:
+
+    def __init__(self, fcid, carrier_name, system, station_id, market_updated=None, commodities=None):
+        """
+        Class represents a carrier's Inara station market page, as parsed by InaraParser.
+
+        :param str fcid: The carrier identifier that was searched for
+        :param str carrier_name: The carrier's full name as shown by Inara, including its identifier
+        :param str system: The system the carrier is in
+        :param str station_id: Inara's ID for the carrier
+        :param str market_updated: When the market was last updated, as shown by Inara
+        :param list commodities: The market's commodities as dicts of id, name, sellPrice, buyPrice, demand and stock, or
+            None if the page had no market table
+        """
+        self.fcid = fcid
+        self.carrier_name = carrier_name
+        self.system = system
+        self.station_id = station_id
+        self.market_updated = market_updated
+        self.commodities = commodities
+
+
+    def to_system_info(self):
+        """
+        Formats the carrier's location as returned by inara_find_fc_system.
+
+        :rtype: dict
+        """
+        return {'system': self.system, 'stationid': self.station_id, 'full_name': self.carrier_name}
+
+
+    def to_market_data(self):
+        """
+        Formats the market as returned by inara_fc_market_data, the same shape we give cAPI data.
+
+        :rtype: dict
+        """
+        return {
+            'name': self.system,
+            'currentStarSystem': self.system,
+            'full_name': self.carrier_name,
+            'sName': self.fcid,
+            'market_updated': self.market_updated,
+            'commodities': self.commodities,
+        }
+
+
+    def __str__(self):
+        """
+        Overloads str to return a readable object
+
+        :rtype: str
+        """
+        return 'InaraStationMarket: Carrier:{0.carrier_name} System:{0.system} StationID:{0.station_id} ' \
+               'MarketUpdated:{0.market_updated} Commodities:{1}'.format(self, len(self.commodities or []))
@@ -1,3 +1,6 @@
+from ptn.missionalertbot.classes.MissionParams import MissionParams
+
+
 class MissionData:
 
     def __init__(self, info_dict=None):
@@ -29,7 +32,26 @@ class MissionData:
         self.reddit_comment_id = info_dict.get('reddit_comment_id', None)
         self.reddit_comment_url = info_dict.get('reddit_comment_url', None)
         self.discord_alert_id = info_dict.get('discord_alert_id', None)
-        self.mission_params = info_dict.get('mission_params', None)
+        self.carrier_pid = info_dict.get('carrier_pid', None)
+        # decoded on first access, as most lookups never need the mission params
+        self._mission_params_raw = info_dict.get('mission_params', None)
+        self._mission_params = None
+
+    @property
+    def mission_params(self):
+        """
+        The mission's MissionParams, decoded from the database on first access.
+
+        :rtype: MissionParams
+        """
+        if self._mission_params is None and self._mission_params_raw:
+            self._mission_params = MissionParams.decode(self._mission_params_raw)
+        return self._mission_params
+
+    @mission_params.setter
+    def mission_params(self, mission_params):
+        self._mission_params = mission_params
+        self._mission_params_raw = None
 
     def to_dictionary(self):
         """
@@ -40,8 +62,12 @@ class MissionData:
         """
         response = {}
         for key, value in vars(self).items():
+            if key.startswith('_mission_params'):
+                continue
             if value is not None:
                 response[key] = value
+        if self.mission_params is not None:
+            response['mission_params'] = self.mission_params
         return response
 
     def __str__(self):
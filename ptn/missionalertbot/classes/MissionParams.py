@@ -1,12 +1,35 @@
+import json
+import pickle
+
 from ptn.missionalertbot.classes.CarrierData import CarrierData
 from ptn.missionalertbot.classes.ChannelDefs import ChannelDefs
 from ptn.missionalertbot._metadata import __version__
 
+
+# bump this when the stored format changes, and teach MissionParams.decode to read the old one
+MISSION_PARAMS_SCHEMA_VERSION = 1
+
+# attributes only needed while a mission is being generated or edited; these hold discord.py objects, are rebuilt
+# when needed, and are not stored. Values are the defaults they're given when a mission is read back.
+_transient_attributes = {
+    'copypaste_embed': lambda: None,
+    'discord_embeds': lambda: None,
+    'original_message_embeds': list,
+    'edit_embed': lambda: None,
+}
+
+
+def _unserialisable(value):
+    # anything else we can't represent is dropped rather than failing the whole mission write
+    print(f"MissionParams: not storing unserialisable value {type(value).__name__}")
+    return None
+
+
 class MissionParams:
     """
     A class to store all parameters relating to mission generation.
-    This class can be pickled into the missions database for later retrieval.
-    Note we cannot pickle discord.py weak objects e.g. interactions
+    This class is encoded into the missions database for later retrieval, see encode() and decode().
+    Note we cannot store discord.py weak objects e.g. interactions
     """
 
     def __init__(self, info_dict=None):
@@ -112,6 +135,66 @@ class MissionParams:
             print(f"booze_cruise: {self.booze_cruise}")
         except: pass # for values which haven't been incorporated yet
 
+    def encode(self):
+        """
+        Encodes the persistent fields into compact, versioned JSON for the missions database.
+
+        :returns: The encoded mission params
+        :rtype: bytes
+        """
+        params = {}
+        for key, value in vars(self).items():
+            if key in _transient_attributes:
+                continue
+            if isinstance(value, (CarrierData, ChannelDefs)):
+                value = vars(value)
+            params[key] = value
+
+        return json.dumps(
+            {'schema': MISSION_PARAMS_SCHEMA_VERSION, 'params': params},
+            separators=(',', ':'), default=_unserialisable
+        ).encode('utf-8')
+
+    @classmethod
+    def decode(cls, raw):
+        """
+        Rebuilds a MissionParams from the missions database. Reads both the JSON encoding and the pickles written by
+        earlier versions.
+
+        :param bytes raw: The stored mission params
+        :returns: The mission params
+        :rtype: MissionParams
+        """
+        if isinstance(raw, str):
+            raw = raw.encode('utf-8')
+
+        if is_pickled_mission_params(raw):
+            return pickle.loads(raw)
+
+        stored = json.loads(raw)
+        if stored.get('schema') != MISSION_PARAMS_SCHEMA_VERSION:
+            raise ValueError(f"Unknown MissionParams schema {stored.get('schema')}")
+
+        params = stored['params']
+
+        # set attributes directly rather than through __init__ so missions keep exactly the attributes they were
+        # created with; older missions are told apart by which attributes they have
+        mission_params = cls.__new__(cls)
+        for key, default in _transient_attributes.items():
+            setattr(mission_params, key, default())
+        for key, value in params.items():
+            if key == 'carrier_data' and value is not None:
+                carrier_data = CarrierData()
+                vars(carrier_data).update(value)
+                value = carrier_data
+            elif key == 'channel_defs' and value is not None:
+                channel_defs = ChannelDefs.__new__(ChannelDefs)
+                vars(channel_defs).update(value)
+                value = channel_defs
+            setattr(mission_params, key, value)
+
+        return mission_params
+
     def to_dictionary(self):
         """
         Formats the mission data into a dictionary for easy access.
@@ -182,4 +265,15 @@ class MissionParams:
 
         :rtype: bool
         """
-        return any([value for key, value in vars(self).items() if value])
\ No newline at end of file
+        return any([value for key, value in vars(self).items() if value])
+
+
+def is_pickled_mission_params(raw):
+    """
+    Whether stored mission params are a pickle from before MissionParams.encode existed.
+
+    :param bytes raw: The stored mission params
+    :rtype: bool
+    """
+    # every pickle protocol we've written starts with the PROTO opcode
+    return isinstance(raw, bytes) and raw[:1] == b'\x80'
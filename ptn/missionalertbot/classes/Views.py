@@ -27,14 +27,14 @@ from ptn.missionalertbot.classes.CommunityCarrierData import CommunityCarrierDat
 
 # import local modules
 from ptn.missionalertbot.database.database import delete_nominee_from_db, delete_carrier_from_db, _update_carrier_details_in_database, find_carrier, CarrierDbFields, \
-    mission_db, missions_conn, add_carrier_to_database, carrier_db, _update_carrier_capi
+    add_carrier_to_database, carrier_db, _update_carrier_capi, delete_mission_from_db
 from ptn.missionalertbot.modules.DateString import get_mission_delete_hammertime, get_formatted_date_string
 from ptn.missionalertbot.modules.Embeds import _configure_all_carrier_detail_embed, _generate_cc_notice_embed, role_removed_embed, role_granted_embed, cc_renamed_embed, \
     _add_common_embed_fields, orphaned_carrier_summary_embed
 from ptn.missionalertbot.modules.ErrorHandler import GenericError, on_generic_error, CustomError, AsyncioTimeoutError
 from ptn.missionalertbot.modules.helpers import _remove_cc_manager
 from ptn.missionalertbot.modules.MissionCleaner import _cleanup_completed_mission
-from ptn.missionalertbot.modules.StockHelpers import capi
+from ptn.missionalertbot.modules.StockHelpers import capi_cached
 
 
 # buttons for confirm role add
@@ -284,8 +284,7 @@ class MissionDeleteView(View):
         spamchannel = bot.get_channel(bot_spam_channel())
         print(f"Trying manual mission delete for {self.mission_data.carrier_name}")
         try:
-            mission_db.execute(f'''DELETE FROM missions WHERE carrier LIKE (?)''', ('%' + self.mission_data.carrier_name + '%',))
-            missions_conn.commit()
+            await delete_mission_from_db(self.mission_data)
             embed = discord.Embed(
                 description=f"Deleted mission for {self.mission_data.carrier_name}.",
                 color=constants.EMBED_COLOUR_OK
@@ -945,10 +944,18 @@ class ConfirmPurgeView(View):
         print("User clicked purge...")
         spamchannel = bot.get_channel(bot_spam_channel())
         carrier: CarrierData
+        # queue every delete at once so they're committed together, then report on each
         for carrier in self.carrier_list:
+            print(f"⏳ Deleting {carrier.carrier_long_name}...")
+        results = await asyncio.gather(
+            *[delete_carrier_from_db(carrier.pid) for carrier in self.carrier_list], return_exceptions=True
+        )
+        for carrier, result in zip(self.carrier_list, results):
             try:
-                print(f"⏳ Deleting {carrier.carrier_long_name}...")
-                await delete_carrier_from_db(carrier.pid)
+                if isinstance(result, Exception):
+                    raise result
+                if result:  # the carrier wasn't in the database
+                    raise CustomError(result)
                 embed = discord.Embed(
                     description=f"✅ Deleted `{carrier.pid}` - `{carrier.carrier_long_name}` with ownerid `{carrier.ownerid}`",
                     color=constants.EMBED_COLOUR_OK
@@ -1114,16 +1121,23 @@ class ConfirmCAPISync(View):
 
         updated_carriers = []
 
+        # query CAPI for every carrier at once; requests in flight are limited per source by capi_cached
+        carriers = [carrier for carrier in carriers if not carrier.capi] # don't need to sync those already enabled
         for carrier in carriers:
-            if not carrier.capi: # don't need to sync those already enabled
-                print("⏩ Processing %s (%s)" % ( carrier.carrier_long_name, carrier.carrier_identifier ))
-                capi_response = capi(carrier.carrier_identifier) # query CAPI
-                print(f"capi response: {capi_response.status_code}")
-                if capi_response.status_code == 200: # positive response, update the carrier db
-                    await _update_carrier_capi(carrier.pid, 1)
-                    count += 1 # tally our totals
-                    # generate a summary of carriers updated
-                    updated_carriers.append(carrier.carrier_long_name)
+            print("⏩ Processing %s (%s)" % ( carrier.carrier_long_name, carrier.carrier_identifier ))
+        responses = await asyncio.gather(*[capi_cached(carrier.carrier_identifier) for carrier in carriers], return_exceptions=True)
+
+        for carrier, response in zip(carriers, responses):
+            if isinstance(response, Exception):
+                print(f"capi request for {carrier.carrier_identifier} failed: {response}")
+                continue
+            capi_status, _, _ = response
+            print(f"capi response for {carrier.carrier_identifier}: {capi_status}")
+            if capi_status == 200: # positive response, update the carrier db
+                await _update_carrier_capi(carrier.pid, 1)
+                count += 1 # tally our totals
+                # generate a summary of carriers updated
+                updated_carriers.append(carrier.carrier_long_name)
     
         posix_time_complete = get_formatted_date_string()[2]
         print(f"✅ Complete time: {posix_time_start}")
@@ -9,7 +9,6 @@ constants -> database -> helpers/embeds -> Views -> commands
 
 # libraries
 import ast
-import asyncpraw
 import asyncio
 import os
 import discord
@@ -36,6 +35,20 @@ MISSIONS_DB_PATH = os.path.join(DATA_DIR, 'database', 'missions.db')
 WMM_DB_PATH = os.path.join(DATA_DIR, 'database', 'wmm.db')
 BACKUP_DB_PATH = os.path.join(DATA_DIR, 'database', 'backups')
 SQL_PATH = os.path.join(DATA_DIR, 'database', 'db_sql')
+BACKUP_RETENTION = int(os.getenv('PTN_MAB_BACKUP_RETENTION', 48)) # number of backups kept per database, oldest are rotated out
+BACKUP_COALESCE_SECONDS = 30 # backup requests arriving within this window share a single backup
+BACKUP_PAGES_PER_STEP = 256 # pages copied per step of the online backup, so other connections can interleave
+SQL_DUMP_COMPRESS = ast.literal_eval(os.getenv('PTN_MAB_SQL_DUMP_COMPRESS', 'False')) # gzip SQL dumps in db_sql
+DB_WAL = ast.literal_eval(os.getenv('PTN_MAB_DB_WAL', 'True')) # run the databases in WAL mode so reads don't block on writes
+DB_SYNCHRONOUS = os.getenv('PTN_MAB_DB_SYNCHRONOUS', 'NORMAL' if DB_WAL else 'FULL') # NORMAL is durable enough under WAL
+DB_CACHE_SIZE_KIB = int(os.getenv('PTN_MAB_DB_CACHE_SIZE_KIB', 16384)) # page cache per connection
+DB_MMAP_SIZE = int(os.getenv('PTN_MAB_DB_MMAP_SIZE', 64 * 1024 * 1024)) # bytes of each database to memory-map, 0 to disable
+DB_BUSY_TIMEOUT_MS = 5000 # how long a connection waits on another's lock before giving up
+DB_PROFILING = ast.literal_eval(os.getenv('PTN_MAB_DB_PROFILING', 'False')) # record per-statement timings, see /admin db_stats
+DB_SLOW_QUERY_MS = float(os.getenv('PTN_MAB_DB_SLOW_QUERY_MS', 100)) # statements slower than this are logged while profiling
+DB_WRITE_QUEUE_TICK_SECONDS = float(os.getenv('PTN_MAB_DB_WRITE_QUEUE_TICK_SECONDS', 0.25)) # how long queued writes gather before being committed together
+STOCK_HISTORY_RAW_HOURS = 48 # stock snapshots are kept as fetched for this long, then downsampled to one per hour
+STOCK_HISTORY_HOURLY_DAYS = 30 # hourly stock snapshots are kept for this long, then downsampled to one per day
 SETTINGS_PATH = os.path.join(DATA_DIR, 'settings')
 SETTINGS_FILE = 'settings.txt'
 SETTINGS_FILE_PATH = os.path.join(SETTINGS_PATH, SETTINGS_FILE)
@@ -66,6 +79,33 @@ bot = commands.Bot(command_prefix='m.', intents=discord.Intents.all())
 # PTN2FDevOAuth for cAPI communication
 API_HOST = os.getenv('API_HOST')
 API_TOKEN = os.getenv('API_TOKEN')
+INARA_URL = os.getenv('PTN_MAB_INARA_URL', 'https://inara.cz') # where Inara market pages are fetched from, can point at a recorded copy for testing
+
+# limits for fetching carrier stock over HTTP
+STOCK_HTTP_TIMEOUT_SECONDS = float(os.getenv('PTN_MAB_STOCK_HTTP_TIMEOUT_SECONDS', 20)) # any single request to cAPI or Inara
+CAPI_MAX_CONCURRENCY = int(os.getenv('PTN_MAB_CAPI_MAX_CONCURRENCY', 8)) # requests in flight to the stockbot cAPI proxy
+INARA_MAX_CONCURRENCY = int(os.getenv('PTN_MAB_INARA_MAX_CONCURRENCY', 2)) # requests in flight to Inara, kept low to be polite
+WMM_FETCH_CONCURRENCY = int(os.getenv('PTN_MAB_WMM_FETCH_CONCURRENCY', 10)) # carriers fetched at once by the WMM stock cycle
+WMM_CARRIER_TIMEOUT_SECONDS = float(os.getenv('PTN_MAB_WMM_CARRIER_TIMEOUT_SECONDS', 45)) # all of one carrier's fetches, including any Inara fallback
+CAPI_CACHE_TTL_SECONDS = float(os.getenv('PTN_MAB_CAPI_CACHE_TTL_SECONDS', 300)) # how long a carrier's cAPI market is reused
+INARA_CACHE_TTL_SECONDS = float(os.getenv('PTN_MAB_INARA_CACHE_TTL_SECONDS', 120)) # how long a carrier's Inara market is reused
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('PTN_MAB_CIRCUIT_FAILURE_THRESHOLD', 5)) # failures in a row before we stop asking a stock source
+CIRCUIT_BACKOFF_BASE_SECONDS = float(os.getenv('PTN_MAB_CIRCUIT_BACKOFF_BASE_SECONDS', 60)) # how long we first leave a failing source alone, doubled each time it fails again
+CIRCUIT_BACKOFF_MAX_SECONDS = float(os.getenv('PTN_MAB_CIRCUIT_BACKOFF_MAX_SECONDS', 1800)) # the longest we leave a failing source alone
+CIRCUIT_ERROR_WINDOW_SECONDS = float(os.getenv('PTN_MAB_CIRCUIT_ERROR_WINDOW_SECONDS', 900)) # how far back a source's error rate looks
+
+# Reddit comment stream
+REDDIT_COMMENT_POLL_SECONDS = float(os.getenv('PTN_MAB_REDDIT_COMMENT_POLL_SECONDS', 15)) # how often we check the subreddit for new comments
+REDDIT_COMMENT_MAX_CATCHUP_HOURS = float(os.getenv('PTN_MAB_REDDIT_COMMENT_MAX_CATCHUP_HOURS', 24)) # comments older than this when we catch up are skipped
+REDDIT_COMMENT_HANDLE_ATTEMPTS = int(os.getenv('PTN_MAB_REDDIT_COMMENT_HANDLE_ATTEMPTS', 3)) # tries at relaying a comment to Discord before it's skipped
+REDDIT_STREAM_BACKOFF_BASE_SECONDS = float(os.getenv('PTN_MAB_REDDIT_STREAM_BACKOFF_BASE_SECONDS', 5)) # how long we first wait after Reddit fails, doubled each time it fails again
+REDDIT_STREAM_BACKOFF_MAX_SECONDS = float(os.getenv('PTN_MAB_REDDIT_STREAM_BACKOFF_MAX_SECONDS', 600)) # the longest we wait after Reddit fails
+
+# Reddit outbox
+REDDIT_OUTBOX_MAX_ATTEMPTS = int(os.getenv('PTN_MAB_REDDIT_OUTBOX_MAX_ATTEMPTS', 6)) # tries at a queued Reddit operation before it's given up on
+REDDIT_OUTBOX_RETRY_BASE_SECONDS = float(os.getenv('PTN_MAB_REDDIT_OUTBOX_RETRY_BASE_SECONDS', 30)) # how long before a failed Reddit operation is first retried, doubled each time it fails again
+REDDIT_OUTBOX_RETRY_MAX_SECONDS = float(os.getenv('PTN_MAB_REDDIT_OUTBOX_RETRY_MAX_SECONDS', 1800)) # the longest we wait to retry a Reddit operation
+REDDIT_OUTBOX_KEEP_DAYS = int(os.getenv('PTN_MAB_REDDIT_OUTBOX_KEEP_DAYS', 7)) # how long finished Reddit operations are kept for reference
 
 
 # default settings.txt values
@@ -261,8 +301,21 @@ wmm_trigger = False
 # define global WMM check timer
 wmm_slept_for = 0
 
+# timings and costs of each stage of the last WMM stock cycle, shown by /admin wmm status
+wmm_last_cycle_stats = {}
+
 # define default WMM tracking interval
-wmm_interval = 3600 # 1 hour
+wmm_interval = 3600 # 1 hour; the longest a carrier goes between refreshes
+
+# adaptive WMM refresh scheduling
+WMM_LOW_STOCK_THRESHOLD = 1000 # stock below this is reported as low and DMed to the owner
+# low stock thresholds overriding WMM_LOW_STOCK_THRESHOLD, per commodity e.g. {'Indite': 2000}
+# and per WMM station e.g. {'Swanson': {'Gold': 500}}; station thresholds win over commodity thresholds
+WMM_COMMODITY_THRESHOLDS = ast.literal_eval(os.getenv('PTN_MAB_WMM_COMMODITY_THRESHOLDS', '{}'))
+WMM_LOCATION_THRESHOLDS = ast.literal_eval(os.getenv('PTN_MAB_WMM_LOCATION_THRESHOLDS', '{}'))
+WMM_MIN_REFRESH_SECONDS = 600 # no carrier is refreshed more often than this
+WMM_CAPI_REFRESH_SECONDS = 3600 # how often the stockbot refreshes a carrier's cAPI market
+WMM_STALE_MARKET_SECONDS = 6 * 3600 # Inara markets not updated for this long are refreshed at the longest interval
 
 
 # random gifs and images
@@ -571,15 +624,6 @@ def training_reddit_completed():
 any_elevated_role = [cc_role(), cmentor_role(), certcarrier_role(), rescarrier_role(), admin_role(), trainee_role(), dev_role()]
 
 
-async def get_reddit():
-    """
-    Return reddit instance
-    discord.py complains if an async resource is not initialized
-    inside async
-    """
-    return asyncpraw.Reddit('bot1')
-
-
 async def get_overwrite_perms():
     """
     Default permission set for all temporary channel managers (CCOs, CCs)
@@ -0,0 +1,177 @@
+"""
+Background backups for the databases used by MAB.
+
+Backups are taken with SQLite's online backup API on a separate connection, off the event loop. Write paths only
+request a backup; requests arriving close together are coalesced into one backup per database.
+
+Depends on: constants, DateString
+
+"""
+
+# libraries
+import asyncio
+import gzip
+import os
+import sqlite3
+import traceback
+
+# local constants
+import ptn.missionalertbot.constants as constants
+
+# local modules
+from ptn.missionalertbot.modules.DateString import get_formatted_date_string
+
+
+# databases which have had a backup requested that hasn't been taken yet
+_pending_backups = set()
+_backup_requested: asyncio.Event = None
+_backup_task: asyncio.Task = None
+
+
+def _database_path(database_name):
+    return os.path.join(constants.DB_PATH, f'{database_name}.db')
+
+
+def _dump_path(database_name):
+    extension = 'sql.gz' if constants.SQL_DUMP_COMPRESS else 'sql'
+    return os.path.join(constants.SQL_PATH, f'{database_name}_dump.{extension}')
+
+
+# write a .sql dump of the database, replacing the previous one
+def _dump_database(connection, database_name):
+    """
+    Dumps the database to a .sql text file, optionally gzipped. Used just to get something we can recreate the
+    database from. This only stores the last state.
+
+    :param sqlite3.Connection connection: A connection to the database to dump
+    :param str database_name: The database name, used for the file name
+    """
+    os.makedirs(constants.SQL_PATH, exist_ok=True)
+    dump_path = _dump_path(database_name)
+    temp_path = f'{dump_path}.tmp'
+
+    if constants.SQL_DUMP_COMPRESS:
+        dump_file = gzip.open(temp_path, 'wt', encoding='utf-8')
+    else:
+        dump_file = open(temp_path, 'w', encoding='utf-8')
+
+    with dump_file as f:
+        for line in connection.iterdump():
+            f.write(f'{line}\n')
+
+    # swap the finished dump in so a crash mid-write never leaves us with a truncated file
+    os.replace(temp_path, dump_path)
+
+
+# remove the oldest backups beyond our retention limit
+def _rotate_backups(database_name):
+    """
+    Deletes backups of the given database beyond constants.BACKUP_RETENTION, oldest first.
+
+    :param str database_name: The database whose backups to rotate
+    :returns: The number of backups removed
+    :rtype: int
+    """
+    backups = [
+        os.path.join(constants.BACKUP_DB_PATH, file_name) for file_name in os.listdir(constants.BACKUP_DB_PATH)
+        if file_name.startswith(f'{database_name}.') and file_name.endswith('.db')
+    ]
+    backups.sort(key=os.path.getmtime, reverse=True)
+
+    removed = 0
+    for backup_path in backups[constants.BACKUP_RETENTION:]:
+        try:
+            os.remove(backup_path)
+            removed += 1
+        except OSError as e:
+            print(f"Unable to remove old backup {backup_path}: {e}")
+
+    if removed:
+        print(f"Rotated out {removed} old backup(s) of {database_name}.db")
+    return removed
+
+
+# take a backup immediately
+def backup_database_now(database_name):
+    """
+    Creates a backup of the requested database into BACKUP_DB_PATH/db_name.datetimestamp.db using SQLite's online
+    backup API, writes a fresh SQL dump and rotates old backups. This blocks, so coroutines should use
+    request_backup or run it in a thread.
+
+    :param str database_name: The database name to back up
+    :returns: The path of the new backup
+    :rtype: str
+    """
+    dt_file_string = get_formatted_date_string()[1]
+
+    os.makedirs(constants.BACKUP_DB_PATH, exist_ok=True)
+    backup_path = os.path.join(constants.BACKUP_DB_PATH, f'{database_name}.{dt_file_string}.db')
+
+    # our own connection, so the backup never competes with the bot's connections for a cursor
+    source = sqlite3.connect(_database_path(database_name))
+    try:
+        destination = sqlite3.connect(backup_path)
+        try:
+            source.backup(destination, pages=constants.BACKUP_PAGES_PER_STEP)
+        finally:
+            destination.close()
+        print(f'Backed up {database_name}.db at {dt_file_string}')
+
+        try:
+            _dump_database(source, database_name)
+        except Exception as e:
+            print(f"Unable to write SQL dump for {database_name}: {e}")
+    finally:
+        source.close()
+
+    _rotate_backups(database_name)
+    return backup_path
+
+
+# background worker which takes any pending backups
+async def _backup_worker():
+    while True:
+        await _backup_requested.wait()
+        # let a burst of writes settle so it results in a single backup
+        await asyncio.sleep(constants.BACKUP_COALESCE_SECONDS)
+        _backup_requested.clear()
+        await flush_pending_backups()
+
+
+async def flush_pending_backups():
+    """
+    Takes any requested backups now, off the event loop. Called by the background worker and on shutdown.
+    """
+    pending = sorted(_pending_backups)
+    _pending_backups.clear()
+    for database_name in pending:
+        try:
+            await asyncio.to_thread(backup_database_now, database_name)
+        except Exception as e:
+            print(f"Background backup of {database_name} failed: {e}")
+            traceback.print_exc()
+
+
+# ask for a database to be backed up
+def request_backup(database_name):
+    """
+    Requests a background backup of the given database and returns immediately.
+
+    :param str database_name: The database name to back up
+    """
+    global _backup_requested, _backup_task
+    _pending_backups.add(database_name)
+
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # no event loop yet, e.g. during startup: nothing is waiting on us so just do it now
+        _pending_backups.discard(database_name)
+        backup_database_now(database_name)
+        return
+
+    if _backup_requested is None:
+        _backup_requested = asyncio.Event()
+    if _backup_task is None or _backup_task.done():
+        _backup_task = loop.create_task(_backup_worker())
+    _backup_requested.set()
@@ -0,0 +1,204 @@
+"""
+In-memory registry of the carriers table.
+
+The registry is loaded once at startup and kept up to date by the carrier write functions in database.py, so carrier
+lookups don't need a round trip to the database. Lookups hand out copies, so callers are free to modify what they get.
+
+Depends on: CarrierData
+
+"""
+
+# libraries
+import copy
+
+# local classes
+from ptn.missionalertbot.classes.CarrierData import CarrierData
+
+
+# map the database columns we index on to the CarrierData attributes holding them; keys are lowercase as SQLite column
+# names are case-insensitive
+_indexed_columns = {
+    'p_id': 'pid',
+    'cid': 'carrier_identifier',
+    'shortname': 'carrier_short_name',
+    'longname': 'carrier_long_name',
+    'discordchannel': 'discord_channel',
+    'ownerid': 'ownerid',
+}
+
+
+def _index_key(value):
+    """
+    Normalises a value for use as an index key. Matches the database's COLLATE NOCASE behaviour for strings, and lets
+    integer IDs be looked up whether they arrive as int or str.
+    """
+    if value is None:
+        return None
+    return str(value).strip().lower()
+
+
+class CarrierRegistry:
+
+    def __init__(self):
+        """
+        Class holds every carrier in the database, indexed by each of the fields we look carriers up by.
+        """
+        self.loaded = False
+        self.hits = 0
+        self.misses = 0
+        self._carriers = {}  # p_ID: CarrierData
+        self._indexes = {column: {} for column in _indexed_columns}  # column: {key: set of p_IDs}
+
+    def load(self, rows):
+        """
+        Replaces the registry contents with the given rows.
+
+        :param list rows: sqlite3.Row objects from the carriers table
+        """
+        self._carriers = {}
+        self._indexes = {column: {} for column in _indexed_columns}
+        for row in rows:
+            self._add(CarrierData(row))
+        self.loaded = True
+        print(f"Carrier registry loaded with {len(self._carriers)} carrier(s)")
+
+    def _add(self, carrier_data):
+        self._carriers[carrier_data.pid] = carrier_data
+        for column, attribute in _indexed_columns.items():
+            key = _index_key(getattr(carrier_data, attribute))
+            if key is not None:
+                self._indexes[column].setdefault(key, set()).add(carrier_data.pid)
+
+    def _discard(self, pid):
+        carrier_data = self._carriers.pop(pid, None)
+        if not carrier_data:
+            return None
+        for column, attribute in _indexed_columns.items():
+            key = _index_key(getattr(carrier_data, attribute))
+            pids = self._indexes[column].get(key)
+            if pids is not None:
+                pids.discard(pid)
+                if not pids:
+                    del self._indexes[column][key]
+        return carrier_data
+
+    def put(self, carrier_data):
+        """
+        Adds a carrier to the registry, or replaces the existing entry with the same p_ID.
+
+        :param CarrierData carrier_data: The carrier as now stored in the database
+        """
+        if not carrier_data:
+            return
+        self._discard(carrier_data.pid)
+        self._add(copy.copy(carrier_data))
+
+    def update(self, pid, **values):
+        """
+        Updates attributes of a cached carrier in place, e.g. update(pid, capi=1). Does nothing if we don't hold it.
+
+        :param int pid: The carrier's database ID
+        """
+        carrier_data = self._discard(pid)
+        if not carrier_data:
+            return
+        for attribute, value in values.items():
+            setattr(carrier_data, attribute, value)
+        self._add(carrier_data)
+
+    def remove(self, pid):
+        """
+        Removes a carrier from the registry.
+
+        :param int pid: The carrier's database ID
+        """
+        self._discard(pid)
+
+    def _match(self, searchterm, searchfields):
+        key = _index_key(searchterm)
+        for column in searchfields:
+            pids = self._indexes.get(column.lower(), {}).get(key)
+            if pids:
+                return [self._carriers[pid] for pid in sorted(pids)]
+        return []
+
+    def find(self, searchterm, searchfields):
+        """
+        Finds the first carrier matching the searchterm exactly (ignoring case) in any of the given fields, checked in
+        order. Counts a hit or miss.
+
+        :param searchterm: The value to match
+        :param tuple searchfields: DB column names to match against, in order of preference
+        :returns: A copy of the matching carrier, or None
+        :rtype: CarrierData
+        """
+        matches = self._match(searchterm, searchfields)
+        if not matches:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return copy.copy(matches[0])
+
+    def find_all(self, searchterm, searchfield):
+        """
+        Finds every carrier matching the searchterm exactly (ignoring case) in the given field. Counts a hit or miss.
+
+        :param searchterm: The value to match
+        :param str searchfield: DB column name to match against
+        :returns: Copies of the matching carriers, ordered by p_ID
+        :rtype: list[CarrierData]
+        """
+        matches = self._match(searchterm, (searchfield,))
+        if not matches:
+            self.misses += 1
+            return []
+        self.hits += 1
+        return [copy.copy(carrier_data) for carrier_data in matches]
+
+    def find_containing(self, searchterm, searchfield):
+        """
+        Finds every carrier whose value in the given field contains the searchterm, ignoring case. The in-memory
+        equivalent of a LIKE '%searchterm%' query. Counts a hit or miss.
+
+        :param searchterm: The fragment to match
+        :param str searchfield: DB column name to match against
+        :returns: Copies of the matching carriers, ordered by p_ID
+        :rtype: list[CarrierData]
+        """
+        attribute = _indexed_columns.get(searchfield.lower())
+        key = _index_key(searchterm)
+        if attribute is None or key is None:
+            self.misses += 1
+            return []
+        matches = [
+            copy.copy(self._carriers[pid]) for pid in sorted(self._carriers)
+            if key in (_index_key(getattr(self._carriers[pid], attribute)) or '')
+        ]
+        if matches:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return matches
+
+    def all(self):
+        """
+        :returns: Copies of every carrier, ordered by p_ID
+        :rtype: list[CarrierData]
+        """
+        return [copy.copy(self._carriers[pid]) for pid in sorted(self._carriers)]
+
+    def stats(self):
+        """
+        :returns: The registry size and lookup counters
+        :rtype: dict
+        """
+        lookups = self.hits + self.misses
+        return {
+            'carriers': len(self._carriers),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def __len__(self):
+        return len(self._carriers)
@@ -243,3 +243,29 @@ commodities_all = [
     'Personal Weapons',
     'Reactive Armour'
 ] # full list of all commodities
+
+
+# other names commodities go by, mapped to the name in commodities_all. Names which only differ in case, spacing or
+# punctuation (e.g. CAPI's "AgronomicTreatment") don't need listing here, they're matched automatically
+commodity_aliases = {
+    # CAPI internal names which don't match the in-game name
+    'AgriculturalMedicines': 'Agri-Medicines',
+    'BasicNarcotics': 'Narcotics',
+    'ComercialSamples': 'Commercial Samples',
+    'CoolingHoses': 'Micro-weave Cooling Hoses',
+    'DiagnosticSensor': 'Hardware Diagnostic Sensor',
+    'EncriptedDataStorage': 'Encrypted Data Storage',
+    'HazardousEnvironmentSuits': 'H.E. Suits',
+    'HeliostaticFurnaces': 'Microbial Furnaces',
+    'LowTemperatureDiamond': 'Low Temperature Diamonds',
+    'MuTomImager': 'Muon Imager',
+    'OnionHeadC': 'Onionhead Gamma Strain',
+    'PowerGridAssembly': 'Energy Grid Assembly',
+    'SkimerComponents': 'Skimmer Components',
+    'TerrainEnrichmentSystems': 'Land Enrichment Systems',
+    'TrinketsOfFortune': 'Trinkets of Hidden Fortune',
+    'USSCargoBlackBox': 'Black Box',
+    # common shorthand
+    'LTD': 'Low Temperature Diamonds',
+    'LTDs': 'Low Temperature Diamonds',
+}
@@ -0,0 +1,113 @@
+"""
+In-memory index of the commodities table.
+
+Loaded once at startup after the table is seeded, so commodity searches during mission generation don't need SQL.
+
+Depends on: Commodity, Commodities
+
+"""
+
+# libraries
+import bisect
+import re
+
+# local classes
+from ptn.missionalertbot.classes.Commodity import Commodity
+
+# local constants
+from ptn.missionalertbot.database.Commodities import commodity_aliases
+
+
+def normalise_commodity_name(name):
+    """
+    Reduces a commodity name to lowercase letters and digits, so "Agri-Medicines", "agri medicines" and CAPI's
+    "AgriMedicines" all compare equal.
+
+    :param str name: The commodity name
+    :rtype: str
+    """
+    return re.sub(r'[^a-z0-9]', '', str(name).lower())
+
+
+class CommodityIndex:
+
+    def __init__(self):
+        """
+        Class holds every commodity in the database, indexed by normalised name and alias for exact and prefix matches.
+        """
+        self.loaded = False
+        self._commodities = []  # Commodity objects in entry_id order, as a LIKE query would return them
+        self._exact = {}  # normalised name or alias: Commodity
+        self._prefix_keys = []  # sorted (normalised name or alias, position in _commodities)
+        self._substring_keys = []  # (lowercase name, normalised name) for each entry in _commodities
+
+    def load(self, rows):
+        """
+        Replaces the index contents with the given rows.
+
+        :param list rows: sqlite3.Row objects from the commodities table
+        """
+        self._commodities = sorted((Commodity(row) for row in rows), key=lambda commodity: commodity.entry_id)
+        positions = {commodity.name: position for position, commodity in enumerate(self._commodities)}
+
+        self._exact = {normalise_commodity_name(commodity.name): commodity for commodity in self._commodities}
+        for alias, name in commodity_aliases.items():
+            if name in positions:
+                self._exact.setdefault(normalise_commodity_name(alias), self._commodities[positions[name]])
+
+        self._prefix_keys = sorted(
+            (key, positions[commodity.name]) for key, commodity in self._exact.items()
+        )
+        self._substring_keys = [
+            (commodity.name.lower(), normalise_commodity_name(commodity.name)) for commodity in self._commodities
+        ]
+        self.loaded = True
+        print(f"Commodity index loaded with {len(self._commodities)} commodities and {len(self._exact)} names")
+
+    def find_exact(self, searchterm):
+        """
+        Finds the commodity whose name or alias matches the searchterm, ignoring case, spacing and punctuation.
+
+        :param str searchterm: The commodity name
+        :returns: The commodity, or None
+        :rtype: Commodity
+        """
+        return self._exact.get(normalise_commodity_name(searchterm))
+
+    def search(self, searchterm):
+        """
+        Finds the commodities best matching the searchterm: an exact name or alias match if there is one, otherwise
+        every commodity whose name or alias starts with it, otherwise every commodity whose name contains it.
+
+        :param str searchterm: The commodity name or fragment
+        :returns: The matching commodities, in database order
+        :rtype: list[Commodity]
+        """
+        key = normalise_commodity_name(searchterm)
+        if not key:
+            return []
+
+        commodity = self._exact.get(key)
+        if commodity:
+            return [commodity]
+
+        # everything from the first key >= our term up to the first key which no longer starts with it
+        start = bisect.bisect_left(self._prefix_keys, (key,))
+        positions = set()
+        for prefix_key, position in self._prefix_keys[start:]:
+            if not prefix_key.startswith(key):
+                break
+            positions.add(position)
+
+        # fall back to a substring match on the name, as the old LIKE query did
+        if not positions:
+            term = str(searchterm).strip().lower()
+            positions = {
+                position for position, (name, normalised_name) in enumerate(self._substring_keys)
+                if term in name or key in normalised_name
+            }
+
+        return [self._commodities[position] for position in sorted(positions)]
+
+    def __len__(self):
+        return len(self._commodities)
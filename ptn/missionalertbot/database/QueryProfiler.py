@@ -0,0 +1,194 @@
+"""
+Opt-in query profiling for the databases used by MAB.
+
+Connections are opened with ProfiledConnection, whose cursors time every statement and count the rows it returns or
+changes when profiling is enabled. Statements slower than the threshold are logged. Turn it on with
+PTN_MAB_DB_PROFILING=True or /admin db_stats.
+
+Depends on: constants
+
+"""
+
+# libraries
+import re
+import sqlite3
+import threading
+import time
+
+# local constants
+import ptn.missionalertbot.constants as constants
+
+
+# upper bounds in milliseconds of the latency histogram buckets; anything slower goes in the last bucket
+LATENCY_BUCKETS_MS = [0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000]
+
+
+# reduce a statement to a stable key, so the same query with different literals is counted together
+def _normalise_statement(statement):
+    statement = re.sub(r"'(?:[^']|'')*'", '?', statement)
+    statement = re.sub(r'\b\d+(\.\d+)?\b', '?', statement)
+    return ' '.join(statement.split())
+
+
+class StatementStats:
+
+    def __init__(self, database_name, statement):
+        """
+        Class holds the profile of a single statement on a single database.
+        """
+        self.database_name = database_name
+        self.statement = statement
+        self.calls = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def record_execute(self, elapsed_ms, rows):
+        self.calls += 1
+        self.rows += rows
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        for bucket, upper_bound in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= upper_bound:
+                self.histogram[bucket] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    def record_fetch(self, elapsed_ms, rows):
+        self.rows += rows
+        self.total_ms += elapsed_ms
+
+    @property
+    def mean_ms(self):
+        return self.total_ms / self.calls if self.calls else 0.0
+
+    def histogram_string(self):
+        """
+        :returns: The non-empty histogram buckets, e.g. "≤1ms:12 ≤5ms:3"
+        :rtype: str
+        """
+        labels = [f'≤{bound:g}ms' for bound in LATENCY_BUCKETS_MS] + [f'>{LATENCY_BUCKETS_MS[-1]:g}ms']
+        return ' '.join(f'{label}:{count}' for label, count in zip(labels, self.histogram) if count)
+
+
+class QueryProfiler:
+
+    def __init__(self):
+        """
+        Class collects statement profiles from every profiled connection. Connections are used from both the event loop
+        and the database executor thread, so updates are locked.
+        """
+        self.enabled = constants.DB_PROFILING
+        self.slow_query_ms = constants.DB_SLOW_QUERY_MS
+        self.started = time.time()
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _get_stats(self, database_name, statement):
+        key = (database_name, _normalise_statement(statement))
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = StatementStats(*key)
+        return stats
+
+    def record_execute(self, database_name, statement, elapsed_ms, rows):
+        with self._lock:
+            self._get_stats(database_name, statement).record_execute(elapsed_ms, rows)
+        if elapsed_ms >= self.slow_query_ms:
+            print(f"🐢 Slow query on {database_name} ({elapsed_ms:.1f}ms, {rows} rows): {' '.join(statement.split())}")
+
+    def record_fetch(self, database_name, statement, elapsed_ms, rows):
+        with self._lock:
+            self._get_stats(database_name, statement).record_fetch(elapsed_ms, rows)
+
+    def top(self, count=10):
+        """
+        :returns: The statements with the highest total time, highest first
+        :rtype: list[StatementStats]
+        """
+        with self._lock:
+            stats = list(self._stats.values())
+        return sorted(stats, key=lambda statement_stats: statement_stats.total_ms, reverse=True)[:count]
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+        self.started = time.time()
+
+
+# the profiler shared by every connection
+query_profiler = QueryProfiler()
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """
+    A cursor which reports statement timings and row counts to query_profiler when it's enabled.
+    """
+    _profiled_statement = None
+
+    def _database_name(self):
+        return getattr(self.connection, 'database_name', 'unknown')
+
+    def _profile_execute(self, method, statement, *args):
+        if not query_profiler.enabled:
+            self._profiled_statement = None
+            return method(statement, *args)
+
+        started = time.perf_counter()
+        try:
+            return method(statement, *args)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self._profiled_statement = statement
+            query_profiler.record_execute(self._database_name(), statement, elapsed_ms, max(self.rowcount, 0))
+
+    def _profile_fetch(self, method, *args):
+        if self._profiled_statement is None or not query_profiler.enabled:
+            return method(*args)
+
+        started = time.perf_counter()
+        result = method(*args)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        rows = len(result) if isinstance(result, list) else int(result is not None)
+        query_profiler.record_fetch(self._database_name(), self._profiled_statement, elapsed_ms, rows)
+        return result
+
+    def execute(self, statement, parameters=()):
+        return self._profile_execute(super().execute, statement, parameters)
+
+    def executemany(self, statement, seq_of_parameters):
+        return self._profile_execute(super().executemany, statement, seq_of_parameters)
+
+    def executescript(self, script):
+        return self._profile_execute(super().executescript, script)
+
+    def fetchone(self):
+        return self._profile_fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._profile_fetch(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._profile_fetch(super().fetchall)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """
+    A connection whose cursors, including those made by Connection.execute, are ProfiledCursors.
+    """
+    database_name = 'unknown'
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    # sqlite3's own shortcuts create their cursors internally, so route them through ours
+    def execute(self, statement, parameters=()):
+        return self.cursor().execute(statement, parameters)
+
+    def executemany(self, statement, seq_of_parameters):
+        return self.cursor().executemany(statement, seq_of_parameters)
+
+    def executescript(self, script):
+        return self.cursor().executescript(script)
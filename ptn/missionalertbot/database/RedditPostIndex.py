@@ -0,0 +1,91 @@
+"""
+In-memory index of the Reddit posts of active missions.
+
+The index is loaded once at startup and kept up to date by the mission write functions, so the Reddit comment monitor
+can tell which mission a comment belongs to, or that it belongs to none, without a round trip to the database.
+
+Depends on: none
+
+"""
+
+
+class RedditPostIndex:
+
+    def __init__(self):
+        """
+        Class holds the Reddit post ID of every active mission, with the carrier the mission belongs to. Missions are
+        keyed by their carrier's p_ID, or by carrier name for missions created before carrier_pid existed, the same way
+        the missions table is updated and deleted from.
+        """
+        self.loaded = False
+        self.hits = 0
+        self.misses = 0
+        self._posts = {}  # reddit post ID: {'carrier_pid', 'carrier_name'}
+        self._post_by_mission = {}  # mission key: reddit post ID
+
+    @staticmethod
+    def _mission_key(carrier_pid, carrier_name):
+        return ('pid', carrier_pid) if carrier_pid is not None else ('name', carrier_name)
+
+    def load(self, rows):
+        """
+        Replaces the index contents with the given rows.
+
+        :param list rows: Rows with reddit_post_id, carrier_pid and carrier columns from the missions table
+        """
+        self._posts = {}
+        self._post_by_mission = {}
+        for row in rows:
+            self.set(row['carrier_pid'], row['carrier'], row['reddit_post_id'])
+        self.loaded = True
+        print(f"Reddit post index loaded with {len(self._posts)} post(s)")
+
+    def set(self, carrier_pid, carrier_name, reddit_post_id):
+        """
+        Records a mission's Reddit post, replacing any post it had before, e.g. when the mission is edited and reposted.
+
+        :param int carrier_pid: The mission's carrier p_ID, or None
+        :param str carrier_name: The mission's carrier name
+        :param str reddit_post_id: The mission's Reddit post ID, or None if it wasn't sent to Reddit
+        """
+        key = self._mission_key(carrier_pid, carrier_name)
+        previous = self._post_by_mission.pop(key, None)
+        if previous is not None:
+            self._posts.pop(previous, None)
+        if reddit_post_id:
+            self._posts[str(reddit_post_id)] = {'carrier_pid': carrier_pid, 'carrier_name': carrier_name}
+            self._post_by_mission[key] = str(reddit_post_id)
+
+    def remove(self, carrier_pid, carrier_name):
+        """
+        Forgets a mission's Reddit post, when the mission is complete.
+
+        :param int carrier_pid: The mission's carrier p_ID, or None
+        :param str carrier_name: The mission's carrier name
+        """
+        self.set(carrier_pid, carrier_name, None)
+
+    def find(self, reddit_post_id):
+        """
+        Finds the active mission a Reddit post belongs to. Counts a hit or miss.
+
+        :param str reddit_post_id: The Reddit post ID
+        :returns: A dict of carrier_pid and carrier_name, or None if no active mission has that post
+        :rtype: dict
+        """
+        entry = self._posts.get(str(reddit_post_id))
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return dict(entry)
+
+    def stats(self):
+        """
+        :returns: The number of posts indexed and lookup counters
+        :rtype: dict
+        """
+        return {'posts': len(self._posts), 'hits': self.hits, 'misses': self.misses}
+
+    def __len__(self):
+        return len(self._posts)
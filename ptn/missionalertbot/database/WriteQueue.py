@@ -0,0 +1,191 @@
+"""
+Group-commit queue for the small, frequent writes MAB makes.
+
+Writes are queued and committed together in one transaction per database each tick, instead of each taking the
+database lock and committing on its own. Writes sharing a key replace each other while they're waiting, so only the
+newest one is committed; writes otherwise commit in the order they were queued. Queueing returns a future which
+resolves once the write is committed, for callers which need to know it's durable.
+
+Depends on: constants
+
+"""
+
+# libraries
+import asyncio
+import itertools
+import sqlite3
+import time
+import traceback
+
+# local constants
+import ptn.missionalertbot.constants as constants
+
+
+class QueuedWrite:
+
+    def __init__(self, connection, statement, values, key):
+        """
+        Class holds a single write waiting in the queue, along with the futures of everyone waiting on it.
+        """
+        self.connection = connection
+        self.statement = statement
+        self.values = values
+        self.key = key
+        self.futures = []
+
+
+# retrieve a failed write's exception so asyncio doesn't warn about callers who never awaited it
+def _retrieve_exception(future):
+    if not future.cancelled():
+        future.exception()
+
+
+class WriteQueue:
+
+    def __init__(self, run_db_query, locks):
+        """
+        Class batches queued writes into one transaction per database per tick.
+
+        :param callable run_db_query: Coroutine function which runs a blocking function on the database executor
+        :param dict locks: The asyncio.Lock guarding each connection, keyed by connection
+        """
+        self._run_db_query = run_db_query
+        self._locks = locks
+        self._pending = {}  # (connection, key) or sequence number: QueuedWrite, in commit order
+        self._sequence = itertools.count()
+        self._wakeup: asyncio.Event = None
+        self._task: asyncio.Task = None
+
+        # metrics
+        self.batches = 0
+        self.committed = 0
+        self.coalesced = 0
+        self.failed = 0
+        self.last_commit_ms = 0.0
+        self.max_commit_ms = 0.0
+        self.total_commit_ms = 0.0
+
+    def submit(self, connection, statement, values=(), key=None):
+        """
+        Queues a write and returns immediately. Must be called from the event loop.
+
+        :param sqlite3.Connection connection: The connection to write against
+        :param str statement: The SQL statement
+        :param tuple values: Parameters for the statement
+        :param key: Optional hashable key. A queued write with the same connection and key is replaced by this one, so
+            only use keys for writes which overwrite the same values, e.g. ('capi', pid)
+        :returns: A future resolving to the number of rows affected once the write is committed
+        :rtype: asyncio.Future
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        future.add_done_callback(_retrieve_exception)
+
+        write = QueuedWrite(connection, statement, values, key)
+        if key is None:
+            pending_key = next(self._sequence)
+        else:
+            pending_key = (connection, key)
+            replaced = self._pending.pop(pending_key, None)
+            if replaced:
+                # the newer write takes the older one's place at the back of the queue, keeping order per key
+                write.futures.extend(replaced.futures)
+                self.coalesced += 1
+        write.futures.append(future)
+        self._pending[pending_key] = write
+
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._worker())
+        self._wakeup.set()
+
+        return future
+
+    async def _worker(self):
+        while True:
+            await self._wakeup.wait()
+            # let writes arriving close together gather into the same transaction
+            await asyncio.sleep(constants.DB_WRITE_QUEUE_TICK_SECONDS)
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Write queue flush failed: {e}")
+                traceback.print_exc()
+
+    # run on the database executor: execute a batch of writes in one transaction
+    @staticmethod
+    def _commit_batch(connection, writes):
+        results = []
+        for write in writes:
+            try:
+                results.append(connection.execute(write.statement, write.values).rowcount)
+            except sqlite3.Error as e:
+                # only this statement is rolled back, the rest of the batch still commits
+                results.append(e)
+        connection.commit()
+        return results
+
+    async def flush(self):
+        """
+        Commits every queued write now. Called each tick by the background worker, and on shutdown.
+        """
+        if not self._pending:
+            return
+
+        writes = list(self._pending.values())
+        self._pending = {}
+
+        batches = {}
+        for write in writes:
+            batches.setdefault(write.connection, []).append(write)
+
+        for connection, batch in batches.items():
+            started = time.perf_counter()
+            try:
+                async with self._locks[connection]:
+                    results = await self._run_db_query(self._commit_batch, connection, batch)
+            except Exception as e:
+                print(f"Write queue commit of {len(batch)} write(s) failed: {e}")
+                results = [e] * len(batch)
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.batches += 1
+            self.last_commit_ms = elapsed_ms
+            self.max_commit_ms = max(self.max_commit_ms, elapsed_ms)
+            self.total_commit_ms += elapsed_ms
+
+            for write, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    self.failed += 1
+                    print(f"Queued write failed: {result} - {' '.join(write.statement.split())} {write.values}")
+                else:
+                    self.committed += 1
+                for future in write.futures:
+                    if future.done():
+                        continue
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+
+    @property
+    def depth(self):
+        return len(self._pending)
+
+    def stats(self):
+        """
+        :returns: The queue depth, write counters and commit latencies
+        :rtype: dict
+        """
+        return {
+            'depth': self.depth,
+            'batches': self.batches,
+            'committed': self.committed,
+            'coalesced': self.coalesced,
+            'failed': self.failed,
+            'last_commit_ms': self.last_commit_ms,
+            'mean_commit_ms': self.total_commit_ms / self.batches if self.batches else 0.0,
+            'max_commit_ms': self.max_commit_ms,
+        }
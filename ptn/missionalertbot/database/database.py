@@ -17,12 +17,17 @@ if __name__ == "__main__":
 import os
 import sqlite3
 import asyncio
+import functools
+import gzip
+import itertools
 import json
 import shutil
 import enum
 import discord
 import pickle
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from datetime import timezone
 
@@ -30,7 +35,7 @@ from datetime import timezone
 from ptn.missionalertbot.classes.CarrierData import CarrierData
 from ptn.missionalertbot.classes.Commodity import Commodity
 from ptn.missionalertbot.classes.MissionData import MissionData
-from ptn.missionalertbot.classes.MissionParams import MissionParams
+from ptn.missionalertbot.classes.MissionParams import MissionParams, is_pickled_mission_params
 from ptn.missionalertbot.classes.CommunityCarrierData import CommunityCarrierData
 from ptn.missionalertbot.classes.NomineesData import NomineesData
 from ptn.missionalertbot.classes.WebhookData import WebhookData
@@ -39,6 +44,12 @@ from ptn.missionalertbot.classes.WMMData import WMMData
 # local constants
 import ptn.missionalertbot.constants as constants
 from ptn.missionalertbot.constants import bot
+from ptn.missionalertbot.database.Backups import request_backup, backup_database_now
+from ptn.missionalertbot.database.CarrierRegistry import CarrierRegistry
+from ptn.missionalertbot.database.RedditPostIndex import RedditPostIndex
+from ptn.missionalertbot.database.CommodityIndex import CommodityIndex
+from ptn.missionalertbot.database.QueryProfiler import ProfiledConnection
+from ptn.missionalertbot.database.WriteQueue import WriteQueue
 from ptn.missionalertbot.database.Commodities import commodities_all
 
 # local modules
@@ -117,9 +128,31 @@ def create_settings_file():
 create_settings_file()
 
 
+# open a database connection with our pragmas applied
+def _connect_database(path, database_name):
+    """
+    Connects to a database, applying the journal mode and tuning pragmas from constants. Connections are profiled
+    when query profiling is enabled.
+
+    :param str path: Path to the database file
+    :param str database_name: The database name, used to label its profiling statistics
+    :returns: The connection
+    :rtype: sqlite3.Connection
+    """
+    connection = sqlite3.connect(path, check_same_thread=False, factory=ProfiledConnection)
+    connection.database_name = database_name
+    connection.row_factory = sqlite3.Row
+    connection.execute(f"PRAGMA journal_mode = {'WAL' if constants.DB_WAL else 'DELETE'}")
+    connection.execute(f"PRAGMA synchronous = {constants.DB_SYNCHRONOUS}")
+    connection.execute(f"PRAGMA cache_size = -{constants.DB_CACHE_SIZE_KIB}")
+    connection.execute(f"PRAGMA mmap_size = {constants.DB_MMAP_SIZE}")
+    connection.execute(f"PRAGMA busy_timeout = {constants.DB_BUSY_TIMEOUT_MS}")
+    connection.execute("PRAGMA temp_store = MEMORY")
+    return connection
+
+
 # connect to sqlite carrier database
-carriers_conn = sqlite3.connect(constants.CARRIERS_DB_PATH)
-carriers_conn.row_factory = sqlite3.Row
+carriers_conn = _connect_database(constants.CARRIERS_DB_PATH, 'carriers')
 carrier_db = carriers_conn.cursor()
 
 # carrier database creation
@@ -147,6 +180,9 @@ commodities_table_create = '''
     '''
 commodities_table_columns = ['entry_id', 'commodity']
 
+# in-memory index of the commodities table, loaded once it has been seeded
+commodity_index = CommodityIndex()
+
 webhooks_table_create = '''
     CREATE TABLE webhooks(
         webhook_owner_id INT NOT NULL,
@@ -174,10 +210,56 @@ nominees_table_create = '''
     '''
 nominess_table_columns = ['nominatorid', 'pillarid', 'note']
 
+# case-insensitive indexes for exact carrier lookups
+carriers_search_indexes = {
+    'idx_carriers_cid_nocase': 'cid',
+    'idx_carriers_shortname_nocase': 'shortname',
+    'idx_carriers_longname_nocase': 'longname',
+    'idx_carriers_discordchannel_nocase': 'discordchannel'
+}
+
+# trigram full-text index over carrier names for fragment searches, kept in sync with carriers by triggers
+carriers_search_table_create = '''
+    CREATE VIRTUAL TABLE carriers_search USING fts5(
+        longname, shortname, cid, discordchannel,
+        content='carriers', content_rowid='p_ID', tokenize='trigram'
+    )
+    '''
+carriers_search_triggers_create = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS carriers_search_insert AFTER INSERT ON carriers BEGIN
+        INSERT INTO carriers_search(rowid, longname, shortname, cid, discordchannel)
+        VALUES (new.p_ID, new.longname, new.shortname, new.cid, new.discordchannel);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS carriers_search_delete AFTER DELETE ON carriers BEGIN
+        INSERT INTO carriers_search(carriers_search, rowid, longname, shortname, cid, discordchannel)
+        VALUES ('delete', old.p_ID, old.longname, old.shortname, old.cid, old.discordchannel);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS carriers_search_update AFTER UPDATE ON carriers BEGIN
+        INSERT INTO carriers_search(carriers_search, rowid, longname, shortname, cid, discordchannel)
+        VALUES ('delete', old.p_ID, old.longname, old.shortname, old.cid, old.discordchannel);
+        INSERT INTO carriers_search(rowid, longname, shortname, cid, discordchannel)
+        VALUES (new.p_ID, new.longname, new.shortname, new.cid, new.discordchannel);
+    END
+    '''
+]
+
+# set by build_carrier_search_indexes; False if this SQLite build lacks FTS5 or the trigram tokenizer
+carrier_fts_available = False
+
+# in-memory copy of the carriers table, loaded on startup and kept current by the carrier write functions below
+carrier_registry = CarrierRegistry()
+
+# in-memory index of active missions' Reddit posts, loaded on startup and kept current by the mission write functions
+reddit_post_index = RedditPostIndex()
+
 
 # connect to sqlite missions database
-missions_conn = sqlite3.connect(constants.MISSIONS_DB_PATH)
-missions_conn.row_factory = sqlite3.Row
+missions_conn = _connect_database(constants.MISSIONS_DB_PATH, 'missions')
 mission_db = missions_conn.cursor()
 
 # missions database creation
@@ -204,12 +286,51 @@ missions_table_create = '''
     '''
 missions_tables_columns = ['carrier', 'cid', 'channelid', 'commodity', 'missiontype', 'system', 'station',\
     'profit', 'pad', 'demand', 'rp_text', 'reddit_post_id', 'reddit_post_url', 'reddit_comment_id',\
-    'reddit_comment_url', 'discord_alert_id', 'mission_params']
+    'reddit_comment_url', 'discord_alert_id', 'mission_params', 'carrier_pid']
+
+# indexes for the columns missions are looked up by
+missions_indexes_create = [
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_missions_carrier_pid ON missions(carrier_pid)',
+    'CREATE INDEX IF NOT EXISTS idx_missions_channelid ON missions(channelid)',
+    'CREATE INDEX IF NOT EXISTS idx_missions_reddit_post_id ON missions(reddit_post_id)',
+    'CREATE INDEX IF NOT EXISTS idx_missions_missiontype ON missions(missiontype)'
+]
+
+# where each Reddit stream got up to, so it can carry on from there after a reconnect or restart
+reddit_stream_checkpoints_table_create = '''
+    CREATE TABLE reddit_stream_checkpoints(
+        "stream"	TEXT NOT NULL PRIMARY KEY,
+        "last_fullname"	TEXT NOT NULL,
+        "last_created_utc"	REAL,
+        "updated_at"	INTEGER
+    )
+    '''
+
+# Reddit operations waiting to be carried out, or done, by the Reddit outbox
+reddit_outbox_table_create = '''
+    CREATE TABLE reddit_outbox(
+        "entry_id"	INTEGER PRIMARY KEY AUTOINCREMENT,
+        "operation"	TEXT NOT NULL,
+        "carrier_pid"	INTEGER,
+        "carrier"	TEXT NOT NULL,
+        "payload"	TEXT NOT NULL,
+        "status"	TEXT NOT NULL DEFAULT 'pending',
+        "attempts"	INTEGER NOT NULL DEFAULT 0,
+        "next_attempt_at"	INTEGER NOT NULL,
+        "last_error"	TEXT,
+        "result"	TEXT,
+        "created_at"	INTEGER NOT NULL,
+        "updated_at"	INTEGER
+    )
+    '''
+reddit_outbox_indexes_create = [
+    'CREATE INDEX IF NOT EXISTS idx_reddit_outbox_status ON reddit_outbox(status, next_attempt_at)',
+    'CREATE INDEX IF NOT EXISTS idx_reddit_outbox_carrier_pid ON reddit_outbox(carrier_pid, operation)'
+]
 
 
 # connect to sqlite wmm database
-wmm_conn = sqlite3.connect(constants.WMM_DB_PATH)
-wmm_conn.row_factory = sqlite3.Row
+wmm_conn = _connect_database(constants.WMM_DB_PATH, 'wmm')
 wmm_db = wmm_conn.cursor()
 
 # wmm database creation
@@ -226,64 +347,101 @@ wmm_table_create = '''
 
 wmm_table_columns = ['carrier', 'cid', 'location', 'notify', 'capi']
 
+# stock history, one row per carrier, commodity and snapshot time
+stock_history_table_create = '''
+    CREATE TABLE stock_history(
+        cid   TEXT NOT NULL,
+        commodity   TEXT NOT NULL,
+        timestamp   INT NOT NULL,
+        stock   INT NOT NULL,
+        buy_price   INT,
+        sell_price   INT,
+        demand   INT,
+        source   TEXT
+    )
+    '''
+
+stock_history_indexes_create = [
+    "CREATE INDEX IF NOT EXISTS stock_history_cid_commodity_timestamp ON stock_history (cid, commodity, timestamp)",
+    "CREATE INDEX IF NOT EXISTS stock_history_timestamp ON stock_history (timestamp)",
+]
+
+stock_history_unique_index_create = \
+    "CREATE UNIQUE INDEX IF NOT EXISTS stock_history_snapshot ON stock_history (cid, commodity, timestamp, source)"
+
+
+# attach the missions and wmm databases to the carriers connection, so queries spanning them can use joins
+carriers_conn.execute("ATTACH DATABASE ? AS missions_db", (constants.MISSIONS_DB_PATH,))
+carriers_conn.execute("ATTACH DATABASE ? AS wmm_db", (constants.WMM_DB_PATH,))
+
 # We need some locks while we wait on the DB queries
 carrier_db_lock = asyncio.Lock()
 mission_db_lock = asyncio.Lock()
 wmm_db_lock = asyncio.Lock()
 
+# All queries issued from coroutines are run on this single worker thread so SQLite never blocks the gateway event loop.
+# One worker keeps every statement on the connections strictly serialised, the same as when they ran on the loop.
+db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='mab-db')
 
-# dump db to .sql file
-def dump_database_test(database_name):
-    print("Called dump_database_test")
+
+async def run_db_query(func, *args, **kwargs):
     """
-    Dumps the database object to a .sql text file while backing up the database. Used just to get something we can
-    recreate the database from.  This will only store the last state and should periodically be committed to the repo
-    from the bot.
-    :param str database_name: The DB name to connect against.
-    :returns: None
-    :raises ValueError: if the db name is unknown
+    Runs a blocking database function on the database executor thread and waits for its result.
+
+    :param callable func: The blocking function to run
+    :returns: Whatever func returns
     """
-    # We only have 2 databases today, carriers and missions, though this could really just be 2 tables in a single
-    # database at some stage.
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, functools.partial(func, *args, **kwargs))
 
-    if database_name == 'missions':
-        connection = missions_conn
-    elif database_name == 'carriers':
-        connection = carriers_conn
-    elif database_name == 'wmm':
-        connection = wmm_conn
-    else:
-        raise ValueError(f'Unknown DB dump handling for: {database_name}')
 
-    os.makedirs(constants.SQL_PATH, exist_ok=True)
-    with open(f'{constants.SQL_PATH}/{database_name}_dump.sql', 'w') as f:
-        for line in connection.iterdump():
-            f.write(line)
+def _execute_and_commit(connection, statement, values=()):
+    """
+    Executes a single write statement on its own cursor and commits it. Intended to be run via run_db_query.
+
+    :param sqlite3.Connection connection: The connection to write against
+    :param str statement: The SQL statement
+    :param tuple values: Parameters for the statement
+    :returns: The number of rows affected
+    :rtype: int
+    """
+    cursor = connection.execute(statement, values)
+    connection.commit()
+    return cursor.rowcount
+
+
+def _fetch_all(connection, statement, values=()):
+    """
+    Executes a read statement on its own cursor and returns every row. Intended to be run via run_db_query.
+
+    :param sqlite3.Connection connection: The connection to read from
+    :param str statement: The SQL statement
+    :param tuple values: Parameters for the statement
+    :returns: The matching rows
+    :rtype: list[sqlite3.Row]
+    """
+    return connection.execute(statement, values).fetchall()
+
+
+# small, frequent writes are queued here and committed together in one transaction per database each tick
+write_queue = WriteQueue(run_db_query, {
+    carriers_conn: carrier_db_lock,
+    missions_conn: mission_db_lock,
+    wmm_conn: wmm_db_lock,
+})
 
 
 # function to backup database
 def backup_database(database_name):
-    print("Called backup_database")
     """
-    Creates a backup of the requested database into .backup/db_name.datetimestamp.db
+    Requests a backup of the database. The backup is taken in the background using SQLite's online backup API and
+    bursts of requests are coalesced, so callers never wait on it.
 
     :param str database_name: The database name to back up
     :rtype: None
     """
-    dt_file_string = get_formatted_date_string()[1]
-    print(dt_file_string)
-
-    db_path = (os.path.join(constants.DB_PATH, f'{database_name}.db'))
-    print(f"DB Path: {db_path}")
-    backup_path = (os.path.join(constants.BACKUP_DB_PATH, f'{database_name}.{dt_file_string}.db'))
-    print(f"Backup Path: {backup_path}")
-
-    shutil.copy(db_path, backup_path)
-    print(f'Backed up {database_name}.db at {dt_file_string}')
-    try:
-      dump_database_test(database_name)
-    except Exception as e:
-        print(e)
+    print(f"Requested backup of {database_name}")
+    request_backup(database_name)
 
 
 # function to check if a given table exists in a given database
@@ -324,11 +482,20 @@ def check_table_column_exists(column_name, table_name, database):
 def create_missing_table(table, db_obj, create_stmt):
     print(f'{table} table missing - creating it now')
 
-    if os.path.exists(os.path.join(os.getcwd(), 'db_sql', f'{table}_dump.sql')):
+    # dumps are gzipped when PTN_MAB_SQL_DUMP_COMPRESS is set; if both kinds are there, the newer is the current one
+    dump_path = os.path.join(os.getcwd(), 'db_sql', f'{table}_dump.sql')
+    dump_paths = [path for path in (dump_path, f'{dump_path}.gz') if os.path.exists(path)]
+
+    if dump_paths:
 
         # recreate from backup file
-        print('Recreating database from backup ...')
-        with open(os.path.join(os.getcwd(), 'db_sql', f'{table}_dump.sql')) as f:
+        dump_path = max(dump_paths, key=os.path.getmtime)
+        print(f'Recreating database from backup {dump_path} ...')
+        if dump_path.endswith('.gz'):
+            dump_file = gzip.open(dump_path, 'rt', encoding='utf-8')
+        else:
+            dump_file = open(dump_path, encoding='utf-8')
+        with dump_file as f:
 
             sql_script = f.read()
             db_obj.executescript(sql_script)
@@ -357,8 +524,8 @@ def create_missing_column(table, column, db_name, db_obj, db_conn, type):
 
     print(f'{column} column missing from {db_name} database, inserting...')
 
-    # backup existing database
-    backup_database(table)
+    # backup existing database, and wait for it as we're about to alter the schema
+    backup_database_now(db_name)
 
     statement = f'''ALTER TABLE {table} ADD COLUMN {column} {type}'''
 
@@ -372,74 +539,304 @@ def create_missing_column(table, column, db_name, db_obj, db_conn, type):
     return
 
 
-# build the databases, from scratch if needed
-def build_database_on_startup():
-    print("Building databases...")
+"""
+DATABASE MIGRATIONS
 
-    # Add a mapping when a new table needs to be created
-    # Requires:
-    #   table_name (str):
-    #       obj (sqlite db obj): sqlite connection to db
-    #       create (str): sql create statement for table
-    database_table_map = {
-        'carriers' : {'obj': carrier_db, 'create': carriers_table_create},
-        'commodities': {'obj': carrier_db, 'create': commodities_table_create},
-        'webhooks' : {'obj': carrier_db, 'create': webhooks_table_create},
-        'community_carriers': {'obj': carrier_db, 'create': community_carriers_table_create},
-        'nominees': {'obj': carrier_db, 'create': nominees_table_create},
-        'missions': {'obj': mission_db, 'create': missions_table_create},
-        'wmm': {'obj': wmm_db, 'create': wmm_table_create}
-    }
+Each database records the last migration applied to it in PRAGMA user_version. On startup, any migrations with a
+higher version are run in order. To change a schema, add a migration to the end of that database's list; never edit or
+reorder one which has already shipped. Migrations must be safe to run against databases built before migrations
+existed, which are at version 0 whatever their schema.
+"""
 
-    # check database exists, create from scratch if needed
-    for table_name in database_table_map:
-        t = database_table_map[table_name]
-        if not check_database_table_exists(table_name, t['obj']):
-            create_missing_table(table_name, t['obj'], t['create'])
+# carriers database migrations
+def _create_carriers_tables():
+    for table_name, create_stmt in {
+        'carriers': carriers_table_create,
+        'commodities': commodities_table_create,
+        'webhooks': webhooks_table_create,
+        'community_carriers': community_carriers_table_create,
+        'nominees': nominees_table_create
+    }.items():
+        if not check_database_table_exists(table_name, carrier_db):
+            create_missing_table(table_name, carrier_db, create_stmt)
         else:
             print(f'{table_name} table exists, do nothing')
 
-    # Add a mapping when a new column needs to be added to an existing table
-    # Requires:
-    #   column_name (str):
-    #       db_name (str): name of database the table exist in
-    #       table (str): table the column needs to be added to
-    #       obj (sqlite db obj): sqlite connection to db
-    #       columns (list): list of existing column names
-    #       conn (sqlite connection): connection to sqlitedb
-    #       type (str): type of column data
-    new_column_map = {
-        'capi': {
-            'db_name': 'carriers',
-            'table': 'carriers',
-            'obj': carrier_db,
-            'columns': carriers_table_columns,
-            'conn': carriers_conn,
-            'type': 'BOOLEAN DEFAULT 0'
-        },
+
+def _add_carriers_capi_column():
+    if not check_table_column_exists('capi', 'carriers', carrier_db):
+        create_missing_column('carriers', 'capi', 'carriers', carrier_db, carriers_conn, 'BOOLEAN DEFAULT 0')
+    else:
+        print('capi exists, do nothing')
+
+
+def _create_carriers_nocase_indexes():
+    for index_name, column in carriers_search_indexes.items():
+        carrier_db.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON carriers({column} COLLATE NOCASE)")
+
+
+def _create_commodities_unique_index():
+    # remove any duplicates first, keeping the original entry
+    carrier_db.execute('''
+        DELETE FROM commodities
+        WHERE entry_id NOT IN (SELECT MIN(entry_id) FROM commodities GROUP BY commodity)
+        ''')
+    carrier_db.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_commodities_commodity ON commodities(commodity)")
+
+
+# missions database migrations
+def _create_missions_tables():
+    if not check_database_table_exists('missions', mission_db):
+        create_missing_table('missions', mission_db, missions_table_create)
+    else:
+        print('missions table exists, do nothing')
+
+
+# convert mission_params written by earlier versions from pickles to MissionParams.encode
+def migrate_pickled_mission_params():
+    """
+    One-shot migration of pickled mission_params to the versioned JSON encoding, run as missions migration 2.
+    Rows which can't be converted are left as they are; MissionParams.decode can still read them.
+    """
+    rows = missions_conn.execute("SELECT rowid, mission_params FROM missions WHERE mission_params IS NOT NULL").fetchall()
+    pickled_rows = [row for row in rows if is_pickled_mission_params(row['mission_params'])]
+    if not pickled_rows:
+        return
+
+    print(f"Migrating {len(pickled_rows)} pickled mission_params to schema-versioned JSON...")
+
+    size_before = size_after = 0
+    decode_before = decode_after = 0.0
+    for row in pickled_rows:
+        try:
+            started = time.perf_counter()
+            mission_params = pickle.loads(row['mission_params'])
+            decode_before += time.perf_counter() - started
+
+            encoded = mission_params.encode()
+
+            started = time.perf_counter()
+            MissionParams.decode(encoded)
+            decode_after += time.perf_counter() - started
+        except Exception as e:
+            print(f"Unable to migrate mission_params for missions row {row['rowid']}, leaving it pickled: {e}")
+            continue
+
+        size_before += len(row['mission_params'])
+        size_after += len(encoded)
+        mission_db.execute("UPDATE missions SET mission_params = ? WHERE rowid = ?", (encoded, row['rowid']))
+
+    missions_conn.commit()
+    print(f"mission_params migrated: {size_before} bytes -> {size_after} bytes, "
+          f"decode {decode_before * 1000:.2f}ms -> {decode_after * 1000:.2f}ms")
+
+
+def _key_missions_by_carrier_pid():
+    if not check_table_column_exists('carrier_pid', 'missions', mission_db):
+        create_missing_column('missions', 'carrier_pid', 'missions', mission_db, missions_conn, 'INTEGER')
+
+    # match existing missions to their carrier by name; missions whose carrier has gone keep a NULL carrier_pid
+    carriers = carriers_conn.execute("SELECT p_ID, longname FROM carriers").fetchall()
+    carrier_pids = {carrier['longname'].lower(): carrier['p_ID'] for carrier in carriers}
+    for row in mission_db.execute("SELECT rowid, carrier FROM missions WHERE carrier_pid IS NULL").fetchall():
+        carrier_pid = carrier_pids.get(row['carrier'].lower())
+        if carrier_pid is None:
+            print(f"No carrier found for mission on {row['carrier']}, leaving it unkeyed")
+            continue
+        mission_db.execute("UPDATE missions SET carrier_pid = ? WHERE rowid = ?", (carrier_pid, row['rowid']))
+
+    for index_create in missions_indexes_create:
+        mission_db.execute(index_create)
+
+
+def _create_reddit_stream_checkpoints_table():
+    if not check_database_table_exists('reddit_stream_checkpoints', mission_db):
+        create_missing_table('reddit_stream_checkpoints', mission_db, reddit_stream_checkpoints_table_create)
+    else:
+        print('reddit_stream_checkpoints table exists, do nothing')
+
+
+def _create_reddit_outbox_table():
+    if not check_database_table_exists('reddit_outbox', mission_db):
+        create_missing_table('reddit_outbox', mission_db, reddit_outbox_table_create)
+    else:
+        print('reddit_outbox table exists, do nothing')
+    for index_create in reddit_outbox_indexes_create:
+        mission_db.execute(index_create)
+
+
+# wmm database migrations
+def _create_wmm_tables():
+    if not check_database_table_exists('wmm', wmm_db):
+        create_missing_table('wmm', wmm_db, wmm_table_create)
+    else:
+        print('wmm table exists, do nothing')
+
+
+def _create_stock_history_table():
+    if not check_database_table_exists('stock_history', wmm_db):
+        create_missing_table('stock_history', wmm_db, stock_history_table_create)
+    else:
+        print('stock_history table exists, do nothing')
+    for index_create in stock_history_indexes_create:
+        wmm_db.execute(index_create)
+
+
+def _create_stock_history_unique_index():
+    # Inara snapshots are stamped with Inara's update time, so the same one could be recorded on every refresh. Remove
+    # any duplicates first, keeping the original entry
+    wmm_db.execute('''
+        DELETE FROM stock_history
+        WHERE rowid NOT IN (SELECT MIN(rowid) FROM stock_history GROUP BY cid, commodity, timestamp, source)
+        ''')
+    wmm_db.execute(stock_history_unique_index_create)
+
+
+# Add a migration when a schema needs to change
+# Requires:
+#   database name (str): matches the database's file name
+#       conn (sqlite connection): connection to the database
+#       migrations (list): (version, description, function) in ascending version order
+database_migrations = {
+    'carriers': {
+        'conn': carriers_conn,
+        'migrations': [
+            (1, 'create carriers tables', _create_carriers_tables),
+            (2, 'add capi column to carriers', _add_carriers_capi_column),
+            (3, 'add NOCASE indexes for carrier lookups', _create_carriers_nocase_indexes),
+            (4, 'add UNIQUE index on commodity names', _create_commodities_unique_index),
+        ]
+    },
+    'missions': {
+        'conn': missions_conn,
+        'migrations': [
+            (1, 'create missions table', _create_missions_tables),
+            (2, 'convert pickled mission_params to JSON', migrate_pickled_mission_params),
+            (3, 'key missions by carrier p_ID and index lookup columns', _key_missions_by_carrier_pid),
+            (4, 'create reddit_stream_checkpoints table', _create_reddit_stream_checkpoints_table),
+            (5, 'create reddit_outbox table', _create_reddit_outbox_table),
+        ]
+    },
+    'wmm': {
+        'conn': wmm_conn,
+        'migrations': [
+            (1, 'create wmm table', _create_wmm_tables),
+            (2, 'create stock_history table', _create_stock_history_table),
+            (3, 'add UNIQUE index on stock_history snapshots', _create_stock_history_unique_index),
+        ]
     }
+}
 
-    for column_name in new_column_map:
-        c = new_column_map[column_name]
-        if not check_table_column_exists(column_name, c['table'], c['obj']):
-            create_missing_column(c['table'], column_name, c['db_name'], c['obj'], c['conn'], c['type'])
-        else:
-            print(f'{column_name} exists, do nothing')
+
+# run any migrations a database hasn't had yet
+def run_migrations(database_name):
+    """
+    Applies, in order, every migration for the database newer than its user_version.
+
+    :param str database_name: The database to migrate, a key of database_migrations
+    :returns: The database's schema version after migrating
+    :rtype: int
+    """
+    connection = database_migrations[database_name]['conn']
+    migrations = database_migrations[database_name]['migrations']
+
+    current_version = connection.execute("PRAGMA user_version").fetchone()[0]
+    pending = [migration for migration in migrations if migration[0] > current_version]
+    if not pending:
+        print(f'{database_name} database is at schema version {current_version}, nothing to migrate')
+        return current_version
+
+    # take a backup first unless this is a brand new database
+    if connection.execute("SELECT count(*) FROM sqlite_master").fetchone()[0]:
+        backup_database_now(database_name)
+
+    for version, description, migrate in pending:
+        print(f'Migrating {database_name} database to schema version {version}: {description}')
+        try:
+            migrate()
+            # PRAGMA doesn't accept bound parameters; version is always an int from the migration list
+            connection.execute(f"PRAGMA user_version = {int(version)}")
+            connection.commit()
+        except Exception as e:
+            connection.rollback()
+            print(f"❌ Migration of {database_name} to version {version} failed: {e}")
+            raise
+
+        current_version = version
+
+    return current_version
+
+
+# build the databases, from scratch if needed
+def build_database_on_startup():
+    print("Building databases...")
+
+    for database_name in database_migrations:
+        run_migrations(database_name)
+
+    build_carrier_search_indexes()
+    load_carrier_registry()
+    load_reddit_post_index()
+
+
+# build indexes used by the carrier search functions
+def build_carrier_search_indexes():
+    """
+    Creates the trigram FTS5 index used for fragment matches. This is checked on every startup rather than being a
+    migration, as it depends on the SQLite build we're running under. If FTS5/trigram is unavailable, fragment
+    searches fall back to LIKE. The NOCASE indexes used for exact matches are created by migration.
+    """
+    global carrier_fts_available
+    print("Building carrier search indexes...")
+
+    try:
+        if not check_database_table_exists('carriers_search', carrier_db):
+            carrier_db.execute(carriers_search_table_create)
+        for trigger in carriers_search_triggers_create:
+            carrier_db.execute(trigger)
+        # cheap at our table sizes, and guarantees the index matches carriers even if it was edited by hand
+        carrier_db.execute("INSERT INTO carriers_search(carriers_search) VALUES('rebuild')")
+        carrier_fts_available = True
+    except sqlite3.OperationalError as e:
+        print(f"⚠ FTS5 trigram search unavailable, carrier fragment search will use LIKE: {e}")
+        carrier_fts_available = False
+
+    carriers_conn.commit()
+
+
+# load every carrier into the in-memory registry
+def load_carrier_registry():
+    """
+    (Re)loads the carrier registry from the carriers table.
+    """
+    carrier_registry.load(carriers_conn.execute("SELECT * FROM carriers").fetchall())
+
+
+# load every active mission's Reddit post into the in-memory index
+def load_reddit_post_index():
+    """
+    (Re)loads the Reddit post index from the missions table.
+    """
+    reddit_post_index.load(missions_conn.execute(
+        "SELECT reddit_post_id, carrier_pid, carrier FROM missions WHERE reddit_post_id IS NOT NULL"
+    ).fetchall())
 
 
 # populate commodities database on fresh install
 def populate_commodities_table_on_startup():
-    for commodity in commodities_all:
-        # Check if the commodity already exists in the table
-        carrier_db.execute("SELECT commodity FROM commodities WHERE commodity=?", (commodity,))
-        existing_entry = carrier_db.fetchone()
+    started = time.perf_counter()
 
-        # If the commodity does not exist, insert it
-        if existing_entry is None:
-            carrier_db.execute("INSERT INTO commodities (commodity) VALUES (?)", (commodity,))
-
-    # Commit the changes to the database
+    # one statement for the whole list; the UNIQUE index on commodity skips any we already have
+    carrier_db.executemany(
+        "INSERT INTO commodities (commodity) VALUES (?) ON CONFLICT(commodity) DO NOTHING",
+        [(commodity,) for commodity in commodities_all]
+    )
     carriers_conn.commit()
+    seeded = time.perf_counter()
+
+    commodity_index.load(carriers_conn.execute("SELECT * FROM commodities").fetchall())
+    print(f"Commodities seeded in {(seeded - started) * 1000:.1f}ms, "
+          f"index built in {(time.perf_counter() - seeded) * 1000:.1f}ms")
 
 
 
@@ -479,23 +876,35 @@ async def add_carrier_to_database(short_name, long_name, carrier_id, channel, ch
     """
     await carrier_db_lock.acquire()
     try:
-        carrier_db.execute(''' INSERT INTO carriers VALUES(NULL, ?, ?, ?, ?, ?, ?, strftime('%s','now'), ?) ''',
-                           (short_name, long_name, carrier_id, channel, channel_id, owner_id, 0))
-        carriers_conn.commit()
+        row = await run_db_query(_insert_carrier, (short_name, long_name, carrier_id, channel, channel_id, owner_id, 0))
+        carrier_registry.put(CarrierData(row))
         print(f'Added {long_name} to database')
     finally:
         carrier_db_lock.release()
 
 
+def _insert_carrier(values):
+    """
+    Inserts a carrier and returns the new row, so the registry can hold exactly what the database does.
+
+    :param tuple values: shortname, longname, cid, discordchannel, channelid, ownerid, capi
+    :rtype: sqlite3.Row
+    """
+    cursor = carriers_conn.execute(
+        ''' INSERT INTO carriers VALUES(NULL, ?, ?, ?, ?, ?, ?, strftime('%s','now'), ?) ''', values
+    )
+    carriers_conn.commit()
+    return carriers_conn.execute("SELECT * FROM carriers WHERE p_ID = ?", (cursor.lastrowid,)).fetchone()
+
+
 # add a webhook to the database
 async def add_webhook_to_database(owner_id, webhook_url, webhook_name):
     print("Called add_webhook_to_database")
     await carrier_db_lock.acquire()
     print("Carrier DB locked.")
     try:
-        carrier_db.execute(''' INSERT INTO webhooks VALUES(?, ?, ?) ''',
-                        (owner_id, webhook_url, webhook_name))
-        carriers_conn.commit()
+        await run_db_query(_execute_and_commit, carriers_conn, ''' INSERT INTO webhooks VALUES(?, ?, ?) ''',
+                           (owner_id, webhook_url, webhook_name))
         print(f"Successfully added webhook {webhook_url} to database for {owner_id} with name {webhook_name}")
     except Exception as e:
         print(e)
@@ -504,6 +913,40 @@ async def add_webhook_to_database(owner_id, webhook_url, webhook_name):
         print("Carrier DB unlocked.")
 
 
+# add a community carrier to the database
+async def add_community_carrier_to_database(owner_id, channel_id, role_id):
+    """
+    Inserts a community carrier's owner, channel and notification role.
+
+    :param int owner_id: The owner's Discord ID
+    :param int channel_id: The community channel's ID
+    :param int role_id: The notification role's ID
+    """
+    await carrier_db_lock.acquire()
+    try:
+        await run_db_query(_execute_and_commit, carriers_conn, ''' INSERT INTO community_carriers VALUES(?, ?, ?) ''',
+                           (owner_id, channel_id, role_id))
+    finally:
+        carrier_db_lock.release()
+
+
+# add a nomination to the database
+async def add_nominee_to_database(nominator_id, pillar_id, note):
+    """
+    Inserts a nomination.
+
+    :param int nominator_id: The nominating user's Discord ID
+    :param int pillar_id: The nominee's Discord ID
+    :param str note: The reason given
+    """
+    await carrier_db_lock.acquire()
+    try:
+        await run_db_query(_execute_and_commit, carriers_conn, ''' INSERT INTO nominees VALUES(?, ?, ?) ''',
+                           (nominator_id, pillar_id, note))
+    finally:
+        carrier_db_lock.release()
+
+
 # carrier edit function
 async def _update_carrier_details_in_database(carrier_data, original_name):
     """
@@ -527,56 +970,87 @@ async def _update_carrier_details_in_database(carrier_data, original_name):
             carrier_data.ownerid,
             f'%{original_name}%'
         )
-        # Handy number to print out what the database connection is actually doing
-        carriers_conn.set_trace_callback(print)
-        carrier_db.execute(
-            ''' UPDATE carriers
-            SET shortname=?, longname=?, cid=?, discordchannel=?, channelid=?, ownerid=?
-            WHERE longname LIKE (?) ''', data
-        )
-
-        carriers_conn.commit()
+        rows = await run_db_query(_update_carrier_details, data)
+        for row in rows:
+            carrier_registry.put(CarrierData(row))
     finally:
         carrier_db_lock.release()
 
 
+def _update_carrier_details(data):
+    """
+    Runs the carrier details update and returns the updated rows, so the registry can be refreshed.
+
+    :param tuple data: The new details, followed by the LIKE pattern for the original name
+    :rtype: list[sqlite3.Row]
+    """
+    pids = [row['p_ID'] for row in carriers_conn.execute(
+        "SELECT p_ID FROM carriers WHERE longname LIKE (?)", (data[-1],)).fetchall()]
+    carriers_conn.execute(
+        ''' UPDATE carriers
+        SET shortname=?, longname=?, cid=?, discordchannel=?, channelid=?, ownerid=?
+        WHERE longname LIKE (?) ''', data
+    )
+    carriers_conn.commit()
+    return [carriers_conn.execute("SELECT * FROM carriers WHERE p_ID = ?", (pid,)).fetchone() for pid in pids]
+
+
 # update carrier last trade time
-async def _update_carrier_last_trade(pid):
-    await carrier_db_lock.acquire()
-    try:
-        carrier_db.execute(
-            ''' UPDATE carriers
-            SET lasttrade=strftime('%s','now')
-            WHERE p_ID=? ''', ( [ pid ] ))
-        carriers_conn.commit()
-    finally:
-        carrier_db_lock.release()
+async def _update_carrier_last_trade(pid, durable=False):
+    """
+    Queues an update of the carrier's last trade time. The registry is updated straight away.
+
+    :param int pid: The carrier's database ID
+    :param bool durable: Wait until the update is committed
+    """
+    # take the timestamp here rather than in SQL so the registry gets the same value
+    lasttrade = int(datetime.now(tz=timezone.utc).timestamp())
+    committed = write_queue.submit(
+        carriers_conn,
+        ''' UPDATE carriers
+        SET lasttrade=?
+        WHERE p_ID=? ''', ( lasttrade, pid ), key=('lasttrade', pid))
+    carrier_registry.update(pid, lasttrade=lasttrade)
+    if durable:
+        await committed
 
 
 # update carrier cAPI flag
-async def _update_carrier_capi(pid, capi):
+async def _update_carrier_capi(pid, capi, durable=False):
+    """
+    Queues an update of the carrier's cAPI flag. The registry is updated straight away.
+
+    :param int pid: The carrier's database ID
+    :param int capi: 1 if the carrier's stock can be fetched from cAPI, else 0
+    :param bool durable: Wait until the update is committed
+    """
     print("Setting capi to %s for carrier ID %s" % ( capi, pid ))
-    await carrier_db_lock.acquire()
-    try:
-        carrier_db.execute('''
-            UPDATE carriers
-            SET capi=?
-            WHERE p_ID=?
-            ''', ( [ capi, pid ] ))
-        carriers_conn.commit()
-    finally:
-        carrier_db_lock.release()
+    committed = write_queue.submit(carriers_conn, '''
+        UPDATE carriers
+        SET capi=?
+        WHERE p_ID=?
+        ''', ( capi, pid ), key=('capi', pid))
+    carrier_registry.update(pid, capi=capi)
+    if durable:
+        await committed
 
 
 # function to remove a carrier
 async def delete_carrier_from_db(p_id):
-    carrier = find_carrier(p_id, CarrierDbFields.p_id.name)
-    try:
-        await carrier_db_lock.acquire()
-        carrier_db.execute(f"DELETE FROM carriers WHERE p_ID = {p_id}")
-        carriers_conn.commit()
-    finally:
-        carrier_db_lock.release()
+    # exact matches only: find_carrier falls back to a substring search, so would take p_ID 1 for p_ID 10
+    carrier = await find_carrier_exact_async(p_id, (CarrierDbFields.p_id.value,))
+    if carrier.pid is None:
+        print(f"No carrier found with p_ID {p_id} to delete")
+        return f"No carrier found in the database with ID `{p_id}`."
+    # deletes made together, e.g. by /carrier purge, are committed in a single transaction
+    deleted = await write_queue.submit(carriers_conn, "DELETE FROM carriers WHERE p_ID = ?", (carrier.pid,))
+    # only forget the carrier once the delete is committed, so a failed write leaves it findable. The registry is keyed
+    # by the p_ID as stored, which the exact lookup gives us whether p_id arrived as an int or a str
+    carrier_registry.remove(carrier.pid)
+    if deleted != 1:
+        # removed since we looked it up, and whoever removed it has dealt with its image
+        print(f"Carrier with p_ID {p_id} was already gone, nothing deleted")
+        return f"No carrier found in the database with ID `{p_id}`."
     # archive the removed carrier's image by appending date and time of deletion to it
     try:
         shutil.move(f'images/{carrier.carrier_short_name}.png',
@@ -593,8 +1067,7 @@ async def delete_webhook_by_name(userid, webhook_name):
     try:
         await carrier_db_lock.acquire()
         query = f"DELETE FROM webhooks WHERE webhook_owner_id = ? AND webhook_name = ?"
-        carrier_db.execute(query, (userid, webhook_name))
-        carriers_conn.commit()
+        await run_db_query(_execute_and_commit, carriers_conn, query, (userid, webhook_name))
         return print("Deleted")
     finally:
         carrier_db_lock.release()
@@ -604,8 +1077,17 @@ async def delete_webhook_by_name(userid, webhook_name):
 async def delete_community_carrier_from_db(ownerid):
     try:
         await carrier_db_lock.acquire()
-        carrier_db.execute(f"DELETE FROM community_carriers WHERE ownerid = {ownerid}")
-        carriers_conn.commit()
+        await run_db_query(_execute_and_commit, carriers_conn, "DELETE FROM community_carriers WHERE ownerid = ?", (ownerid,))
+    finally:
+        carrier_db_lock.release()
+    return
+
+
+# remove a community carrier by its channel
+async def delete_community_carrier_by_channel_from_db(channelid):
+    try:
+        await carrier_db_lock.acquire()
+        await run_db_query(_execute_and_commit, carriers_conn, "DELETE FROM community_carriers WHERE channelid = ?", (channelid,))
     finally:
         carrier_db_lock.release()
     return
@@ -615,8 +1097,7 @@ async def delete_community_carrier_from_db(ownerid):
 async def delete_nominee_from_db(pillarid):
     try:
         await carrier_db_lock.acquire()
-        carrier_db.execute(f"DELETE FROM nominees WHERE pillarid = {pillarid}")
-        carriers_conn.commit()
+        await run_db_query(_execute_and_commit, carriers_conn, "DELETE FROM nominees WHERE pillarid = ?", (pillarid,))
     finally:
         carrier_db_lock.release()
     return
@@ -627,8 +1108,8 @@ async def delete_nominee_by_nominator(nomid, pillarid):
     print(f"Attempting to delete {nomid} {pillarid} match.")
     try:
         await carrier_db_lock.acquire()
-        carrier_db.execute(f"DELETE FROM nominees WHERE nominatorid = {nomid} AND pillarid = {pillarid}")
-        carriers_conn.commit()
+        await run_db_query(_execute_and_commit, carriers_conn, "DELETE FROM nominees WHERE nominatorid = ? AND pillarid = ?",
+                           (nomid, pillarid))
     finally:
         carrier_db_lock.release()
     return print("Deleted")
@@ -643,6 +1124,8 @@ def _delete_all_from_database(database):
     """
     carrier_db.execute(f"DELETE FROM {database}")
     carriers_conn.commit()
+    if database == 'carriers':
+        load_carrier_registry()
 
 
 # function to search for a carrier
@@ -655,17 +1138,130 @@ def find_carrier(searchterm, searchfield):
     :returns: A single CarrierData object
     :rtype: CarrierData
     """
-    # TODO: This needs to check an exact not a `LIKE`
-    carrier_db.execute(
-        f"SELECT * FROM carriers WHERE {searchfield} LIKE (?)", (f'%{searchterm}%',)
-        )
-    carrier_data = CarrierData(carrier_db.fetchone())
+    if carrier_registry.loaded:
+        # an exact match wins; otherwise behave like the LIKE query, lowest p_ID first
+        carrier_data = carrier_registry.find(searchterm, (searchfield,))
+        if not carrier_data:
+            matches = carrier_registry.find_containing(searchterm, searchfield)
+            carrier_data = matches[0] if matches else CarrierData()
+    else:
+        cursor = carriers_conn.execute(
+            f"SELECT * FROM carriers WHERE {searchfield} LIKE (?)", (f'%{searchterm}%',)
+            )
+        carrier_data = CarrierData(cursor.fetchone())
     print(f"FC {carrier_data.pid} is {carrier_data.carrier_long_name} {carrier_data.carrier_identifier} called by "
           f"shortname {carrier_data.carrier_short_name} with channel #{carrier_data.discord_channel} called "
           f"from find_carrier.")
     return carrier_data
 
 
+async def find_carrier_async(searchterm, searchfield):
+    """
+    Awaitable find_carrier, run on the database executor.
+
+    :rtype: CarrierData
+    """
+    if carrier_registry.loaded:
+        return find_carrier(searchterm, searchfield)
+    return await run_db_query(find_carrier, searchterm, searchfield)
+
+
+# find a carrier by an exact, case-insensitive match on one of its identifying fields
+def find_carrier_exact(searchterm, searchfields=('cid', 'shortname', 'longname', 'discordchannel')):
+    """
+    Finds a single carrier whose value in any of the given fields matches the searchterm exactly, ignoring case.
+    Uses the NOCASE indexes, so this is an index lookup rather than a table scan.
+
+    :param str searchterm: The exact value to match
+    :param tuple searchfields: DB columns to match against, in order of preference
+    :returns: A single CarrierData object, empty if not found
+    :rtype: CarrierData
+    """
+    if isinstance(searchfields, str):
+        searchfields = (searchfields,)
+
+    if carrier_registry.loaded:
+        # the registry holds every carrier, so a miss here means there's no such carrier
+        carrier_data = carrier_registry.find(searchterm, searchfields) or CarrierData()
+        print(f"find_carrier_exact for '{searchterm}' in {searchfields}: {carrier_data.carrier_long_name}")
+        return carrier_data
+
+    # one indexed subquery per field; the field order breaks ties so the result is deterministic
+    statement = ' UNION ALL '.join(
+        f"SELECT *, {priority} AS priority FROM carriers WHERE {field} = ? COLLATE NOCASE"
+        for priority, field in enumerate(searchfields)
+    )
+    cursor = carriers_conn.execute(f"{statement} ORDER BY priority, p_ID LIMIT 1",
+                                   tuple(searchterm for field in searchfields))
+    carrier_data = CarrierData(cursor.fetchone())
+    print(f"find_carrier_exact for '{searchterm}' in {searchfields}: {carrier_data.carrier_long_name}")
+    return carrier_data
+
+
+# ranked fragment search across carrier names, IDs and channels
+def search_carriers(searchterm, limit=10):
+    """
+    Finds carriers whose name, shortname, ID or channel contains the searchterm, best matches first.
+    Uses the trigram FTS5 index where possible, otherwise falls back to LIKE with a deterministic ordering.
+
+    :param str searchterm: The fragment to search for
+    :param int limit: The maximum number of results
+    :returns: A list of CarrierData objects, ranked
+    :rtype: list[CarrierData]
+    """
+    searchterm = searchterm.strip()
+    if not searchterm:
+        return []
+
+    # trigram matching needs at least three characters
+    if carrier_fts_available and len(searchterm) >= 3:
+        # quote the term as an FTS phrase so user input can't be parsed as query syntax
+        match_term = '"' + searchterm.replace('"', '""') + '"'
+        cursor = carriers_conn.execute(
+            '''
+            SELECT carriers.* FROM carriers_search
+            JOIN carriers ON carriers.p_ID = carriers_search.rowid
+            WHERE carriers_search MATCH ?
+            ORDER BY bm25(carriers_search, 10.0, 5.0, 2.0, 1.0), carriers.p_ID
+            LIMIT ?
+            ''', (match_term, limit)
+        )
+    else:
+        like_term = f'%{searchterm}%'
+        cursor = carriers_conn.execute(
+            '''
+            SELECT * FROM carriers
+            WHERE longname LIKE ? OR shortname LIKE ? OR cid LIKE ? OR discordchannel LIKE ?
+            ORDER BY (longname LIKE ?) DESC, (shortname LIKE ?) DESC, length(longname), p_ID
+            LIMIT ?
+            ''', (like_term, like_term, like_term, like_term, like_term, like_term, limit)
+        )
+
+    carrier_data = [CarrierData(carrier) for carrier in cursor.fetchall()]
+    print(f"search_carriers for '{searchterm}' found {len(carrier_data)} result(s)")
+    return carrier_data
+
+
+async def find_carrier_exact_async(searchterm, searchfields=('cid', 'shortname', 'longname', 'discordchannel')):
+    """
+    Awaitable find_carrier_exact, run on the database executor.
+
+    :rtype: CarrierData
+    """
+    if carrier_registry.loaded:
+        return find_carrier_exact(searchterm, searchfields)
+    return await run_db_query(find_carrier_exact, searchterm, searchfields)
+
+
+async def search_carriers_async(searchterm, limit=10):
+    """
+    Awaitable search_carriers, run on the database executor.
+
+    :rtype: list[CarrierData]
+    """
+    return await run_db_query(search_carriers, searchterm, limit)
+
+
 # used to find carriers if we expect multiple results for a search term
 # TODO: make every carrier longname search prompt with multiple results and use this function
 def find_carriers_mult(searchterm, searchfield):
@@ -677,10 +1273,16 @@ def find_carriers_mult(searchterm, searchfield):
     :returns: A list of carrier data objects
     :rtype: list[CarrierData]
     """
-    carrier_db.execute(
-        f"SELECT * FROM carriers WHERE {searchfield} LIKE (?) AND shortname != ownerid", (f'%{searchterm}%',)
-    )
-    carrier_data = [CarrierData(carrier) for carrier in carrier_db.fetchall()]
+    if carrier_registry.loaded:
+        carrier_data = [
+            carrier for carrier in carrier_registry.find_containing(searchterm, searchfield)
+            if str(carrier.carrier_short_name) != str(carrier.ownerid)
+        ]
+    else:
+        cursor = carriers_conn.execute(
+            f"SELECT * FROM carriers WHERE {searchfield} LIKE (?) AND shortname != ownerid", (f'%{searchterm}%',)
+        )
+        carrier_data = [CarrierData(carrier) for carrier in cursor.fetchall()]
     for carrier in carrier_data:
         print(f"FC {carrier.pid} is {carrier.carrier_long_name} {carrier.carrier_identifier} called by "
               f"shortname {carrier.carrier_short_name} with channel <#{carrier.channel_id}> "
@@ -689,6 +1291,17 @@ def find_carriers_mult(searchterm, searchfield):
     return carrier_data
 
 
+async def find_carriers_mult_async(searchterm, searchfield):
+    """
+    Awaitable find_carriers_mult, run on the database executor.
+
+    :rtype: list[CarrierData]
+    """
+    if carrier_registry.loaded:
+        return find_carriers_mult(searchterm, searchfield)
+    return await run_db_query(find_carriers_mult, searchterm, searchfield)
+
+
 def find_opt_ins():
     """
     Returns all carriers matching the opt-in marker designation.
@@ -713,9 +1326,8 @@ def find_webhook_from_owner(ownerid):
     :returns: A list of webhook data objects
     :rtype: list[WebhookData]
     """
-    carrier_db.execute(f"SELECT * FROM webhooks WHERE "
-                       f"webhook_owner_id = {ownerid} ")
-    webhook_data = [WebhookData(webhooks) for webhooks in carrier_db.fetchall()]
+    cursor = carriers_conn.execute("SELECT * FROM webhooks WHERE webhook_owner_id = ?", (ownerid,))
+    webhook_data = [WebhookData(webhooks) for webhooks in cursor.fetchall()]
     for webhooks in webhook_data:
         print(f"{webhooks.webhook_owner_id} owns {webhooks.webhook_url} called {webhooks.webhook_name}"
               f" called from find_webhook_from_owner.")
@@ -723,6 +1335,15 @@ def find_webhook_from_owner(ownerid):
     return webhook_data
 
 
+async def find_webhook_from_owner_async(ownerid):
+    """
+    Awaitable find_webhook_from_owner, run on the database executor.
+
+    :rtype: list[WebhookData]
+    """
+    return await run_db_query(find_webhook_from_owner, ownerid)
+
+
 def find_webhook_by_name(ownerid, name): # TODO: why doesn't this work?
     print("Called find_webhook_by_name")
     """
@@ -808,9 +1429,9 @@ def find_mission(searchterm, searchfield):
     :param str searchfield: the DB column to match against
     :returns: list[mission data]
     """
-    mission_db.execute(f'''SELECT * FROM missions WHERE {searchfield} LIKE (?)''',
-                        (f'%{searchterm}%',))
-    row = mission_db.fetchone()
+    cursor = missions_conn.execute(f'''SELECT * FROM missions WHERE {searchfield} LIKE (?)''',
+                                   (f'%{searchterm}%',))
+    row = cursor.fetchone()
 
     # check whether a mission exists
     if row is None:
@@ -821,17 +1442,99 @@ def find_mission(searchterm, searchfield):
         mission_data = MissionData(row)
         print(f'Found mission data: {mission_data}')
 
-    # unpickle the mission_params object if it exists
-    if mission_data.mission_params:
-        print("Found mission_params, enumerating...")
-        mission_data.mission_params = pickle.loads(mission_data.mission_params)
-        mission_data.mission_params.print_values()
+    # mission_params are decoded by MissionData when first used, so lookups which don't need them stay cheap
+    if mission_data._mission_params_raw:
+        print("Found mission_params")
     else:
         print("No mission_params found")
 
     return mission_data
 
 
+# find a carrier's active mission
+def find_mission_for_carrier(carrier_data):
+    """
+    Finds the active mission for a carrier by its p_ID, using the carrier_pid index. Missions created before
+    carrier_pid existed whose carrier couldn't be matched are found by exact name instead.
+
+    :param CarrierData carrier_data: The carrier
+    :returns: The mission data, or None if the carrier has no active mission
+    :rtype: MissionData
+    """
+    cursor = missions_conn.execute(
+        "SELECT * FROM missions WHERE carrier_pid = ? OR (carrier_pid IS NULL AND carrier = ?)",
+        (carrier_data.pid, carrier_data.carrier_long_name)
+    )
+    row = cursor.fetchone()
+    if row is None:
+        print(f'No mission found for {carrier_data.carrier_long_name} ({carrier_data.pid})')
+        return None
+
+    mission_data = MissionData(row)
+    print(f'Found mission data: {mission_data}')
+    return mission_data
+
+
+async def find_mission_for_carrier_async(carrier_data):
+    """
+    Awaitable find_mission_for_carrier, run on the database executor.
+
+    :rtype: MissionData
+    """
+    return await run_db_query(find_mission_for_carrier, carrier_data)
+
+
+# find a mission by an exact match on one of its columns
+def find_mission_exact(searchterm, searchfield):
+    """
+    Finds the mission whose searchfield exactly matches the searchterm. Use for indexed IDs such as channelid and
+    reddit_post_id.
+
+    :param searchterm: the value to match
+    :param str searchfield: the DB column to match against
+    :returns: The mission data, or None if there's no such mission
+    :rtype: MissionData
+    """
+    cursor = missions_conn.execute(f"SELECT * FROM missions WHERE {searchfield} = ?", (searchterm,))
+    row = cursor.fetchone()
+    if row is None:
+        print(f'No mission found for {searchterm} in {searchfield}')
+        return None
+
+    mission_data = MissionData(row)
+    print(f'Found mission data: {mission_data}')
+    return mission_data
+
+
+async def find_mission_exact_async(searchterm, searchfield):
+    """
+    Awaitable find_mission_exact, run on the database executor.
+
+    :rtype: MissionData
+    """
+    return await run_db_query(find_mission_exact, searchterm, searchfield)
+
+
+# remove a mission
+async def delete_mission_from_db(mission_data):
+    """
+    Deletes a mission, by carrier p_ID where it has one, otherwise by exact carrier name.
+
+    :param MissionData mission_data: The mission to delete
+    """
+    await mission_db_lock.acquire()
+    try:
+        if mission_data.carrier_pid is not None:
+            await run_db_query(_execute_and_commit, missions_conn, "DELETE FROM missions WHERE carrier_pid = ?",
+                               (mission_data.carrier_pid,))
+        else:
+            await run_db_query(_execute_and_commit, missions_conn, "DELETE FROM missions WHERE carrier = ?",
+                               (mission_data.carrier_name,))
+        reddit_post_index.remove(mission_data.carrier_pid, mission_data.carrier_name)
+    finally:
+        mission_db_lock.release()
+
+
 # carrier edit function
 async def _update_mission_in_database(mission_params):
     print("Called _update_mission_in_database")
@@ -846,8 +1549,8 @@ async def _update_mission_in_database(mission_params):
     print("Getting mission db lock...")
     await mission_db_lock.acquire()
 
-    print("Pickling mission_params...")
-    pickled_mission_params = pickle.dumps(mission_params)
+    print("Encoding mission_params...")
+    encoded_mission_params = mission_params.encode()
 
     try:
         data = (
@@ -867,12 +1570,11 @@ async def _update_mission_in_database(mission_params):
             mission_params.reddit_comment_id,
             mission_params.reddit_comment_url,
             mission_params.discord_alert_id,
-            pickled_mission_params,
+            encoded_mission_params,
+            mission_params.carrier_data.pid,
+            mission_params.carrier_data.pid,
             mission_params.carrier_data.carrier_long_name
         )
-        # Handy number to print out what the database connection is actually doing
-        missions_conn.set_trace_callback(print)
-
         # define our SQL update statement
         statement = """
         UPDATE missions
@@ -892,14 +1594,17 @@ async def _update_mission_in_database(mission_params):
             reddit_comment_id = ?,
             reddit_comment_url = ?,
             discord_alert_id = ?,
-            mission_params = ?
-        WHERE carrier LIKE ?
+            mission_params = ?,
+            carrier_pid = ?
+        WHERE carrier_pid = ? OR (carrier_pid IS NULL AND carrier = ?)
         """
 
         print("Executing update...")
-        mission_db.execute(statement, data)
-        print("Committing...")
-        missions_conn.commit()
+        await run_db_query(_execute_and_commit, missions_conn, statement, data)
+        # a mission found by carrier name now has its carrier_pid, so drop any entry under its name
+        reddit_post_index.remove(None, mission_params.carrier_data.carrier_long_name)
+        reddit_post_index.set(mission_params.carrier_data.pid, mission_params.carrier_data.carrier_long_name,
+                              mission_params.reddit_post_id)
     except Exception as e:
         print(e)
     finally:
@@ -909,6 +1614,204 @@ async def _update_mission_in_database(mission_params):
         return
 
 
+# find where a Reddit stream got up to
+def find_reddit_stream_checkpoint(stream):
+    """
+    Returns the last item a Reddit stream processed.
+
+    :param str stream: The stream's name
+    :returns: The row with last_fullname, last_created_utc and updated_at, or None if it has never processed anything
+    :rtype: sqlite3.Row
+    """
+    return missions_conn.execute("SELECT * FROM reddit_stream_checkpoints WHERE stream = ?", (stream,)).fetchone()
+
+
+async def find_reddit_stream_checkpoint_async(stream):
+    """
+    Awaitable find_reddit_stream_checkpoint, run on the database executor.
+
+    :rtype: sqlite3.Row
+    """
+    return await run_db_query(find_reddit_stream_checkpoint, stream)
+
+
+# record where a Reddit stream got up to
+async def _update_reddit_stream_checkpoint(stream, fullname, created_utc, durable=False):
+    """
+    Queues an update of a Reddit stream's checkpoint. Updates queued in the same tick are coalesced, so only the newest
+    is written.
+
+    :param str stream: The stream's name
+    :param str fullname: The fullname of the last item processed, e.g. t1_abc123
+    :param float created_utc: When that item was created
+    :param bool durable: Wait until the update is committed
+    """
+    committed = write_queue.submit(missions_conn, '''
+        INSERT INTO reddit_stream_checkpoints (stream, last_fullname, last_created_utc, updated_at)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(stream) DO UPDATE SET
+            last_fullname=excluded.last_fullname,
+            last_created_utc=excluded.last_created_utc,
+            updated_at=excluded.updated_at
+        ''', ( stream, fullname, created_utc, int(datetime.now(tz=timezone.utc).timestamp()) ), key=('reddit_stream', stream))
+    if durable:
+        await committed
+
+
+def _insert_reddit_outbox_entry(values):
+    cursor = missions_conn.execute('''
+        INSERT INTO reddit_outbox (operation, carrier_pid, carrier, payload, next_attempt_at, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', values)
+    missions_conn.commit()
+    return cursor.lastrowid
+
+
+# add a Reddit operation to the outbox
+async def add_reddit_outbox_entry(operation, carrier_pid, carrier_name, payload):
+    """
+    Adds a Reddit operation to the outbox, to be carried out straight away.
+
+    :param str operation: What to do, one of the operations RedditOutbox knows
+    :param int carrier_pid: The mission's carrier p_ID, or None
+    :param str carrier_name: The mission's carrier name
+    :param dict payload: Everything the operation needs, stored as JSON
+    :returns: The new entry's ID
+    :rtype: int
+    """
+    now = int(datetime.now(tz=timezone.utc).timestamp())
+    await mission_db_lock.acquire()
+    try:
+        entry_id = await run_db_query(_insert_reddit_outbox_entry,
+                                      ( operation, carrier_pid, carrier_name, json.dumps(payload), now, now ))
+    finally:
+        mission_db_lock.release()
+    print(f"Queued Reddit {operation} for {carrier_name} as outbox entry {entry_id}")
+    return entry_id
+
+
+# find Reddit operations still to be carried out
+def find_pending_reddit_outbox_entries():
+    """
+    Returns every pending Reddit outbox entry, oldest first.
+
+    :rtype: list[sqlite3.Row]
+    """
+    return missions_conn.execute(
+        "SELECT * FROM reddit_outbox WHERE status = 'pending' ORDER BY entry_id"
+    ).fetchall()
+
+
+async def find_pending_reddit_outbox_entries_async():
+    """
+    Awaitable find_pending_reddit_outbox_entries, run on the database executor.
+
+    :rtype: list[sqlite3.Row]
+    """
+    return await run_db_query(find_pending_reddit_outbox_entries)
+
+
+# find a carrier's latest Reddit operation of a kind
+def find_latest_reddit_outbox_entry(operation, carrier_pid, before_entry_id=None):
+    """
+    Returns the newest outbox entry for the operation on the carrier's missions, e.g. so completing a mission can find
+    the post made for it.
+
+    :param str operation: The operation
+    :param int carrier_pid: The carrier's p_ID
+    :param int before_entry_id: Only look at entries queued before this one
+    :returns: The entry, or None if there isn't one
+    :rtype: sqlite3.Row
+    """
+    return missions_conn.execute('''
+        SELECT * FROM reddit_outbox
+        WHERE operation = ? AND carrier_pid = ? AND entry_id < ?
+        ORDER BY entry_id DESC LIMIT 1
+        ''', (operation, carrier_pid, before_entry_id or 2 ** 63 - 1)).fetchone()
+
+
+async def find_latest_reddit_outbox_entry_async(operation, carrier_pid, before_entry_id=None):
+    """
+    Awaitable find_latest_reddit_outbox_entry, run on the database executor.
+
+    :rtype: sqlite3.Row
+    """
+    return await run_db_query(find_latest_reddit_outbox_entry, operation, carrier_pid, before_entry_id)
+
+
+# record an attempt at a Reddit operation
+async def _update_reddit_outbox_entry(entry_id, status, attempts, next_attempt_at, payload, last_error=None, result=None):
+    """
+    Records the outcome of an attempt at an outbox entry, and how far it got. Committed before returning, so progress
+    survives a restart.
+
+    :param int entry_id: The entry
+    :param str status: 'pending', 'done' or 'failed'
+    :param int attempts: Attempts made so far
+    :param int next_attempt_at: When a pending entry is next due, as a POSIX timestamp
+    :param dict payload: The entry's payload, including its progress
+    :param str last_error: What went wrong, if anything
+    :param dict result: What a finished entry produced
+    """
+    await mission_db_lock.acquire()
+    try:
+        await run_db_query(_execute_and_commit, missions_conn, '''
+            UPDATE reddit_outbox
+            SET status = ?, attempts = ?, next_attempt_at = ?, payload = ?, last_error = ?, result = ?, updated_at = ?
+            WHERE entry_id = ?
+            ''', ( status, attempts, next_attempt_at, json.dumps(payload), last_error,
+                   json.dumps(result) if result is not None else None, int(datetime.now(tz=timezone.utc).timestamp()),
+                   entry_id ))
+    finally:
+        mission_db_lock.release()
+
+
+# forget old finished Reddit operations
+async def delete_finished_reddit_outbox_entries(before):
+    """
+    Deletes done and failed outbox entries last updated before the given time.
+
+    :param int before: POSIX timestamp
+    :returns: The number of entries deleted
+    :rtype: int
+    """
+    await mission_db_lock.acquire()
+    try:
+        return await run_db_query(_execute_and_commit, missions_conn,
+                                  "DELETE FROM reddit_outbox WHERE status != 'pending' AND updated_at < ?", (before,))
+    finally:
+        mission_db_lock.release()
+
+
+def _insert_mission(values):
+    missions_conn.execute(''' INSERT INTO missions (carrier, cid, channelid, commodity, missiontype, system, station, profit, pad, demand,
+        rp_text, reddit_post_id, reddit_post_url, reddit_comment_id, reddit_comment_url, discord_alert_id, mission_params, carrier_pid)
+        VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ''', values)
+    missions_conn.commit()
+
+
+# add a new mission
+async def add_mission_to_database(mission_params):
+    """
+    Inserts a newly generated mission and indexes its Reddit post.
+
+    :param MissionParams mission_params: The mission
+    """
+    values = (
+        mission_params.carrier_data.carrier_long_name, mission_params.carrier_data.carrier_identifier, mission_params.mission_temp_channel_id,
+        mission_params.commodity_name.title(), mission_params.mission_type.lower(), mission_params.system.title(), mission_params.station.title(),
+        mission_params.profit, mission_params.pads.upper(), mission_params.demand, mission_params.cco_message_text, mission_params.reddit_post_id,
+        mission_params.reddit_post_url, mission_params.reddit_comment_id, mission_params.reddit_comment_url, mission_params.discord_alert_id,
+        mission_params.encode(), mission_params.carrier_data.pid
+    )
+    await mission_db_lock.acquire()
+    try:
+        await run_db_query(_insert_mission, values)
+        reddit_post_index.set(mission_params.carrier_data.pid, mission_params.carrier_data.carrier_long_name, mission_params.reddit_post_id)
+    finally:
+        mission_db_lock.release()
+
+
 # check if a carrier is for a registered PTN fleet carrier
 async def _is_carrier_channel(carrier_data):
     if not carrier_data.discord_channel:
@@ -926,11 +1829,15 @@ async def find_commodity(mission_params, interaction):
 
     print(f'Searching for commodity against match "{mission_params.commodity_search_term}" requested by {interaction.user.display_name}')
 
-    carrier_db.execute(
-        f"SELECT * FROM commodities WHERE commodity LIKE (?)",
-        (f'%{mission_params.commodity_search_term}%',))
-
-    commodities = [Commodity(commodity) for commodity in carrier_db.fetchall()]
+    started = time.perf_counter()
+    if commodity_index.loaded:
+        commodities = commodity_index.search(mission_params.commodity_search_term)
+    else:
+        rows = await run_db_query(_fetch_all, carriers_conn, "SELECT * FROM commodities WHERE commodity LIKE (?)",
+                                  (f'%{mission_params.commodity_search_term}%',))
+        commodities = [Commodity(commodity) for commodity in rows]
+    print(f'Commodity search for "{mission_params.commodity_search_term}" found {len(commodities)} match(es) in '
+          f'{(time.perf_counter() - started) * 1000:.3f}ms')
     commodity = None
     if not commodities:
         mission_params.returnflag = False 
@@ -960,7 +1867,7 @@ async def find_commodity(mission_params, interaction):
 
     else:
         print(f'Between 1 and 3 commodities found for: "{mission_params.commodity_search_term}", asking {interaction.user.display_name} which they want.')
-        # The database runs a partial match, in the case we have more than 1 ask the user which they want.
+        # The search runs a partial match, in the case we have more than 1 ask the user which they want.
         # here we have less than 3, but more than 1 match
         embed = discord.Embed(title=f"Multiple commodities found for input: {mission_params.commodity_search_term}", color=constants.EMBED_COLOUR_OK)
 
@@ -1007,9 +1914,9 @@ def find_wmm_carrier(searchterm, searchfield):
     :param str searchfield: the DB column to match against
     :returns: class instance WMMData
     """
-    wmm_db.execute(f'''SELECT * FROM wmm WHERE {searchfield} LIKE (?)''',
-                        (f'%{searchterm}%',))
-    row = wmm_db.fetchone()
+    cursor = wmm_conn.execute(f'''SELECT * FROM wmm WHERE {searchfield} LIKE (?)''',
+                              (f'%{searchterm}%',))
+    row = cursor.fetchone()
 
     # check whether row exists
     if row is None:
@@ -1022,6 +1929,15 @@ def find_wmm_carrier(searchterm, searchfield):
         return wmm_data
 
 
+async def find_wmm_carrier_async(searchterm, searchfield):
+    """
+    Awaitable find_wmm_carrier, run on the database executor.
+
+    :rtype: WMMData
+    """
+    return await run_db_query(find_wmm_carrier, searchterm, searchfield)
+
+
 # wmm fetch all carriers
 def _fetch_wmm_carriers():
     """
@@ -1031,14 +1947,23 @@ def _fetch_wmm_carriers():
     """
     print("Called _fetch_wmm_carriers")
     sql = "SELECT * FROM wmm"
-    wmm_db.execute(sql)
+    cursor = wmm_conn.execute(sql)
 
     # instantiate into WMMData
-    wmm_carriers = [WMMData(wmm_carrier) for wmm_carrier in wmm_db.fetchall()]
+    wmm_carriers = [WMMData(wmm_carrier) for wmm_carrier in cursor.fetchall()]
 
     return wmm_carriers
 
 
+async def _fetch_wmm_carriers_async():
+    """
+    Awaitable _fetch_wmm_carriers, run on the database executor.
+
+    :returns: A list of WMMData class objects
+    """
+    return await run_db_query(_fetch_wmm_carriers)
+
+
 # WMM start tracking
 async def _add_to_wmm_db(carrier, cid, location, ownerid, capi):
     print("Called _add_to_wmm_db for %s (%s), at %s, owned by %s / capi: %s" % ( carrier, cid, location, ownerid, capi ))
@@ -1050,8 +1975,7 @@ async def _add_to_wmm_db(carrier, cid, location, ownerid, capi):
     # write to database
     try:
         await wmm_db_lock.acquire()
-        wmm_db.execute(sql, values)
-        wmm_conn.commit()
+        await run_db_query(_execute_and_commit, wmm_conn, sql, values)
     finally:
         wmm_db_lock.release()
 
@@ -1062,8 +1986,7 @@ async def _remove_from_wmm_db(cid):
     try:
         await wmm_db_lock.acquire()
         sql = "DELETE FROM wmm WHERE cid = (?)"
-        wmm_db.execute(sql, (cid,))
-        wmm_conn.commit()
+        await run_db_query(_execute_and_commit, wmm_conn, sql, (cid,))
     finally:
         wmm_db_lock.release()
     return print("Deleted")
@@ -1090,39 +2013,201 @@ def _wmm_database_insert(data):
 
 
 # update WMM entry
-async def _update_wmm_carrier(wmm_data: WMMData):
+async def _update_wmm_carrier(wmm_data: WMMData, durable=False):
     """
-    Updates details for a WMM carrier. Uses the carrier's identifier to search.
+    Queues an update of the details for a WMM carrier. Uses the carrier's identifier to search.
     
     :param WMMData wmm_data: The updated dataset
+    :param bool durable: Wait until the update is committed
+    """
+    committed = _queue_wmm_carrier_update(wmm_data)
+    print("WMM carrier update queued.")
+    if durable:
+        await committed
+
+
+# update several WMM entries at once
+async def _update_wmm_carriers(wmm_carriers, durable=False):
+    """
+    Queues updates of the details for several WMM carriers together, so they're committed in the same transaction.
+
+    :param list[WMMData] wmm_carriers: The updated datasets
+    :param bool durable: Wait until the updates are committed
     """
+    committed = [_queue_wmm_carrier_update(wmm_data) for wmm_data in wmm_carriers]
+    print(f"{len(committed)} WMM carrier update(s) queued.")
+    if durable:
+        await asyncio.gather(*committed)
+
+
+def _queue_wmm_carrier_update(wmm_data: WMMData):
     print("Received data: %s %s %s %s" % ( wmm_data.carrier_location, wmm_data.notification_status, wmm_data.capi, wmm_data.carrier_identifier ))
 
     # notification status is a list, so we need to transform it into json before storing it in the db
     notification_status = json.dumps(wmm_data.notification_status) if wmm_data.notification_status else None
 
+    values = (
+        wmm_data.carrier_location,
+        notification_status,
+        wmm_data.capi,
+        wmm_data.carrier_identifier
+    )
+
+    sql = '''
+        UPDATE wmm
+        SET location = ?,
+            notify = ?,
+            capi = ?
+        WHERE cid = ?
+    '''
+
+    # every column is written each time, so a newer update for the same carrier can replace a queued one
+    return write_queue.submit(wmm_conn, sql, values, key=('wmm', wmm_data.carrier_identifier))
+
+
+# build stock_history rows from a carrier's market data
+def stock_history_rows(cid, commodities, source, timestamp=None):
+    """
+    Converts market data, as returned by cAPI or Inara, into rows for record_stock_history.
+
+    :param str cid: The carrier's identifier
+    :param list commodities: The market's commodities, as dicts with name, stock, buyPrice, sellPrice and demand
+    :param str source: Where the data came from, 'capi' or 'inara'
+    :param int timestamp: When the data was fetched, defaults to now
+    :returns: Rows of (cid, commodity, timestamp, stock, buy_price, sell_price, demand, source)
+    :rtype: list[tuple]
+    """
+    timestamp = timestamp or int(datetime.now(tz=timezone.utc).timestamp())
+    return [
+        (cid, com['name'].lower(), timestamp, int(com['stock']), com.get('buyPrice'), com.get('sellPrice'), com.get('demand'), source)
+        for com in commodities
+    ]
+
+
+def _insert_stock_history(rows):
+    # a snapshot we already have, e.g. an unchanged Inara market, is left as it is
+    cursor = wmm_conn.executemany('''
+        INSERT OR IGNORE INTO stock_history (cid, commodity, timestamp, stock, buy_price, sell_price, demand, source)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+    wmm_conn.commit()
+    return cursor.rowcount
+
+
+# store stock snapshots
+async def record_stock_history(rows):
+    """
+    Stores a batch of stock snapshots in a single transaction. Snapshots already recorded for the same carrier,
+    commodity, time and source are skipped.
+
+    :param list[tuple] rows: Rows from stock_history_rows
+    """
+    if not rows:
+        return
     await wmm_db_lock.acquire()
+    try:
+        recorded = await run_db_query(_insert_stock_history, rows)
+        print(f"Recorded {recorded} stock snapshot(s), {len(rows) - recorded} already recorded")
+    finally:
+        wmm_db_lock.release()
+
+
+def _downsample_stock_history(now):
+    # each tier keeps only the newest snapshot per carrier, commodity and bucket within its age range
+    tiers = [
+        # (oldest, newest, bucket seconds)
+        (now - constants.STOCK_HISTORY_HOURLY_DAYS * 86400, now - constants.STOCK_HISTORY_RAW_HOURS * 3600, 3600),
+        (0, now - constants.STOCK_HISTORY_HOURLY_DAYS * 86400, 86400),
+    ]
+    removed = 0
+    for oldest, newest, bucket in tiers:
+        # SQLite returns the rowid of the row holding MAX(timestamp) in each group
+        cursor = wmm_conn.execute('''
+            DELETE FROM stock_history
+            WHERE timestamp >= ? AND timestamp < ?
+            AND rowid NOT IN (
+                SELECT kept FROM (
+                    SELECT rowid AS kept, MAX(timestamp)
+                    FROM stock_history
+                    WHERE timestamp >= ? AND timestamp < ?
+                    GROUP BY cid, commodity, timestamp / ?
+                )
+            )
+            ''', (oldest, newest, oldest, newest, bucket))
+        removed += cursor.rowcount
+    wmm_conn.commit()
+    return removed
+
+
+# thin out old stock snapshots
+async def downsample_stock_history():
+    """
+    Downsamples stock history: snapshots are kept as fetched for STOCK_HISTORY_RAW_HOURS, then one per hour until
+    STOCK_HISTORY_HOURLY_DAYS, then one per day.
 
+    :returns: The number of snapshots removed
+    :rtype: int
+    """
+    now = int(datetime.now(tz=timezone.utc).timestamp())
+    await wmm_db_lock.acquire()
     try:
+        removed = await run_db_query(_downsample_stock_history, now)
+    finally:
+        wmm_db_lock.release()
+    print(f"Downsampled stock history, removed {removed} snapshot(s)")
+    return removed
 
-        values = (
-            wmm_data.carrier_location,
-            notification_status,
-            wmm_data.capi,
-            wmm_data.carrier_identifier
-        )
 
-        sql = '''
-            UPDATE wmm
-            SET location = ?,
-                notify = ?,
-                capi = ?
-            WHERE cid = ?
-        '''
+# find a carrier's stock history
+def find_stock_history(cid, commodity=None, since=None):
+    """
+    Returns a carrier's stock snapshots, oldest first.
 
-        wmm_db.execute(sql, values)
-        wmm_conn.commit()
-        print("WMM carrier updated.")
+    :param str cid: The carrier's identifier
+    :param str commodity: Only return this commodity, case-insensitive
+    :param int since: Only return snapshots taken at or after this timestamp
+    :rtype: list[sqlite3.Row]
+    """
+    sql = "SELECT * FROM stock_history WHERE cid = ? AND timestamp >= ?"
+    values = [cid, since or 0]
+    if commodity:
+        sql += " AND commodity = ?"
+        values.append(commodity.lower())
+    sql += " ORDER BY commodity, timestamp"
+    return wmm_conn.execute(sql, values).fetchall()
 
-    finally:
-        wmm_db_lock.release()
\ No newline at end of file
+
+# work out how fast a carrier's commodities are selling
+def get_depletion_rates(cid, hours=24):
+    """
+    Works out how quickly each of a carrier's commodities has been running down over the given period. Restocks are
+    ignored, so only falls in stock count. cAPI and Inara can disagree, so each commodity's rate only uses snapshots
+    from the source of its newest one.
+
+    :param str cid: The carrier's identifier
+    :param int hours: How far back to look
+    :returns: Units per hour for each commodity with at least two snapshots from its current source in the period,
+        keyed by lowercase name
+    :rtype: dict
+    """
+    since = int(datetime.now(tz=timezone.utc).timestamp()) - hours * 3600
+    rates = {}
+    for commodity, snapshots in itertools.groupby(find_stock_history(cid, since=since), key=lambda row: row['commodity']):
+        snapshots = list(snapshots)
+        source = snapshots[-1]['source']
+        snapshots = [snapshot for snapshot in snapshots if snapshot['source'] == source]
+        elapsed_hours = (snapshots[-1]['timestamp'] - snapshots[0]['timestamp']) / 3600
+        if elapsed_hours <= 0:
+            continue
+        depleted = sum(max(earlier['stock'] - later['stock'], 0) for earlier, later in zip(snapshots, snapshots[1:]))
+        rates[commodity] = depleted / elapsed_hours
+    return rates
+
+
+async def get_depletion_rates_async(cid, hours=24):
+    """
+    Awaitable get_depletion_rates, run on the database executor.
+
+    :rtype: dict
+    """
+    return await run_db_query(get_depletion_rates, cid, hours)
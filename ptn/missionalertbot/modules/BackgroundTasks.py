@@ -15,6 +15,7 @@ if __name__ == "__main__":
 import asyncio
 from datetime import datetime, timezone, timedelta
 import json
+import time
 import traceback
 
 # import discord
@@ -24,76 +25,108 @@ from discord.ext import tasks
 
 # import local classes
 from ptn.missionalertbot.classes.CarrierData import CarrierData
-from ptn.missionalertbot.classes.MissionData import MissionData
 from ptn.missionalertbot.classes.WMMData import WMMData
 
 # import local constants
 import ptn.missionalertbot.constants as constants
-from ptn.missionalertbot.constants import get_reddit, reddit_channel, sub_reddit, bot_guild, certcarrier_role, rescarrier_role, \
-    bot_spam_channel, cco_color_role, commodities_wmm, channel_cco_wmm_supplies, channel_wmm_stock
+from ptn.missionalertbot.constants import reddit_channel, sub_reddit, bot_guild, certcarrier_role, rescarrier_role, \
+    bot_spam_channel, cco_color_role, channel_cco_wmm_supplies, channel_wmm_stock
 
 # import local modules
-from ptn.missionalertbot.database.database import CarrierDbFields, carrier_db, mission_db, find_carrier, bot, _fetch_wmm_carriers, \
-    _update_wmm_carrier, _update_carrier_capi
+from ptn.missionalertbot.database.database import carrier_db, bot, _fetch_wmm_carriers_async, _update_wmm_carrier, _update_wmm_carriers, _update_carrier_capi, \
+    find_carrier_async, CarrierDbFields, carrier_registry, reddit_post_index, stock_history_rows, record_stock_history, downsample_stock_history, get_depletion_rates_async
 from ptn.missionalertbot.modules.helpers import clear_history
-from ptn.missionalertbot.modules.StockHelpers import capi, get_fc_stock, chunk, notify_wmm_owner
+from ptn.missionalertbot.modules.ChannelRenderer import ChannelRenderer
+from ptn.missionalertbot.modules.WMMScheduler import WMMScheduler, next_refresh_interval
+from ptn.missionalertbot.modules.StockHelpers import notify_wmm_owner, fetch_wmm_carrier_stocks, http_request_counts, inara_market_time
+from ptn.missionalertbot.modules.WMMAggregator import WMMStockAggregate
+from ptn.missionalertbot.modules.WMMDigest import WMMNotificationDigest
+from ptn.missionalertbot.modules.WMMPages import wmm_stock_pages, cco_supplies_pages
+from ptn.missionalertbot.modules.RedditClient import get_reddit
+from ptn.missionalertbot.modules.RedditCommentStream import RedditCommentStream
+from ptn.missionalertbot.modules.RedditOutbox import reddit_outbox
+
+
+# the subreddit's comment stream, which carries on from the last comment it handled
+reddit_comment_stream = RedditCommentStream(sub_reddit())
+
+
+# relay a new Reddit comment on one of our posts to Discord
+async def _handle_reddit_comment(comment):
+    comment_channel = bot.get_channel(reddit_channel())
+    reddit = await get_reddit()
+    print(f"New reddit comment: {comment}. Is_submitter is {comment.is_submitter}")
+    # ignore comments from the bot / post author
+    if comment.is_submitter:
+        return
+
+    # look the parent post up in our index of active missions' posts
+    post_id = str(comment.submission)
+    mission_post = reddit_post_index.find(post_id)
+
+    # a post that isn't an active mission's and wasn't made by us has nothing to do with us
+    if not mission_post and getattr(comment, 'link_author', None) != reddit.config.username:
+        print(f"Comment is on {post_id}, which isn't one of our posts, ignoring.")
+        return
+
+    # log some data
+    print(f"{comment.author} wrote:\n {comment.body}\nAt: {comment.permalink}\nIn: {comment.submission}")
+
+    # the parent post's title comes with the comment; only fetch the post if it didn't
+    post_title = getattr(comment, 'link_title', None)
+    if not post_title:
+        submission = await reddit.submission(post_id)
+        post_title = submission.title
+
+    if not mission_post:
+        print("No match in mission index, mission must be complete.")
+
+        embed = discord.Embed(title=f"{post_title}",
+                            description=f"This mission is **COMPLETED**.\n\nComment by **{comment.author}**\n{comment.body}"
+                                        f"\n\nTo view this comment click here:\nhttps://www.reddit.com{comment.permalink}",
+                                        color=constants.EMBED_COLOUR_QU)
+
+    else:
+        # mission is active, we'll get its carrier's owner from the registry and ping the CCO
+        print(f'Found mission for carrier: {mission_post["carrier_name"]}')
+        if mission_post['carrier_pid'] is not None:
+            carrier_data = carrier_registry.find(mission_post['carrier_pid'], ('p_id',))
+        else:
+            carrier_data = carrier_registry.find(mission_post['carrier_name'], ('longname',))
+
+        # We can't easily moderate Reddit comments so we'll post it to a CCO-only channel
+        owner_mention = f"<@{carrier_data.ownerid}>" if carrier_data else mission_post['carrier_name']
+        await comment_channel.send(f"{owner_mention}, your Reddit trade post has received a new comment:")
+        embed = discord.Embed(title=f"{post_title}",
+                            description=f"This mission is **IN PROGRESS**.\n\nComment by **{comment.author}**\n{comment.body}"
+                                        f"\n\nTo view this comment click here:\nhttps://www.reddit.com{comment.permalink}",
+                                        color=constants.EMBED_COLOUR_REDDIT)
+    await comment_channel.send(embed=embed)
+    print("Sent comment to channel")
 
 
 # monitor reddit comments
 @tasks.loop(seconds=60)
 async def _monitor_reddit_comments():
     print("Reddit monitor started")
-    while True:
-        try:
-            # TODO: what happens if there's an error in this process, e.g. reddit is down?
-
-            comment_channel = bot.get_channel(reddit_channel())
-            # establish a comment stream to the subreddit using async praw
-            reddit = await get_reddit()
-            subreddit = await reddit.subreddit(sub_reddit())
-            async for comment in subreddit.stream.comments(skip_existing=True):
-                print(f"New reddit comment: {comment}. Is_submitter is {comment.is_submitter}")
-                # ignore comments from the bot / post author
-                if not comment.is_submitter:
-                    # log some data
-                    print(f"{comment.author} wrote:\n {comment.body}\nAt: {comment.permalink}\nIn: {comment.submission}")
-
-                    # get a submission object so we can interrogate it for the parent post title
-                    submission = await reddit.submission(comment.submission)
-
-                    # lookup the parent post ID with the mission database
-                    mission_db.execute(f"SELECT * FROM missions WHERE "
-                                    f"reddit_post_id = '{comment.submission}' ")
-
-                    print('DB command ran, go fetch the result')
-                    mission_data = MissionData(mission_db.fetchone())
-
-                    if not mission_data:
-                        print("No match in mission DB, mission must be complete.")
-
-                        embed = discord.Embed(title=f"{submission.title}",
-                                            description=f"This mission is **COMPLETED**.\n\nComment by **{comment.author}**\n{comment.body}"
-                                                        f"\n\nTo view this comment click here:\nhttps://www.reddit.com{comment.permalink}",
-                                                        color=constants.EMBED_COLOUR_QU)
-
-                    elif mission_data:
-                        # mission is active, we'll get info from the db and ping the CCO
-                        print(f'Found mission data: {mission_data}')
-
-                        # now we need to lookup the carrier data in the db
-                        carrier_data = find_carrier(mission_data.carrier_name, CarrierDbFields.longname.name)
-
-                        # We can't easily moderate Reddit comments so we'll post it to a CCO-only channel
-
-                        await comment_channel.send(f"<@{carrier_data.ownerid}>, your Reddit trade post has received a new comment:")
-                        embed = discord.Embed(title=f"{submission.title}",
-                                            description=f"This mission is **IN PROGRESS**.\n\nComment by **{comment.author}**\n{comment.body}"
-                                                        f"\n\nTo view this comment click here:\nhttps://www.reddit.com{comment.permalink}",
-                                                        color=constants.EMBED_COLOUR_REDDIT)
-                    await comment_channel.send(embed=embed)
-                    print("Sent comment to channel")
-        except Exception as e:
-            print(f"Error while monitoring {sub_reddit()} for comments: {e}")
+    try:
+        # only returns if something's gone badly wrong; Reddit errors are retried within it
+        await reddit_comment_stream.run(_handle_reddit_comment)
+    except Exception as e:
+        print(f"Error while monitoring {sub_reddit()} for comments, restarting in 60s: {e}")
+        traceback.print_exc()
+
+
+# carry out queued Reddit operations
+@tasks.loop(seconds=60)
+async def reddit_outbox_worker():
+    print("Reddit outbox worker started")
+    try:
+        # only returns if something's gone badly wrong; failed operations are retried within it
+        await reddit_outbox.run()
+    except Exception as e:
+        print(f"Error in Reddit outbox worker, restarting in 60s: {e}")
+        traceback.print_exc()
 
 
 # lasttrade task loop:
@@ -154,6 +187,15 @@ async def lasttrade_cron():
         pass
 
 
+# the WMM stock and CCO supplies channels, edited in place each cycle
+wmm_stock_renderer = ChannelRenderer('WMM stock channel')
+cco_supplies_renderer = ChannelRenderer('CCO WMM supplies channel')
+
+# when each WMM carrier is next due a refresh, and the last usable data we fetched for it
+wmm_scheduler = WMMScheduler()
+wmm_last_fetched = {}
+
+
 # function to start WMM loop
 async def start_wmm_task():
     if wmm_stock.is_running():
@@ -165,6 +207,9 @@ async def start_wmm_task():
     await clear_history(wmm_channel)
     print("Starting WMM stock background task")
     message = await wmm_channel.send('⌛ WMM stock tracking initialized, preparing for update.')
+    # the channel has just been cleared, so the first cycle renders from scratch
+    wmm_stock_renderer.reset()
+    cco_supplies_renderer.reset()
     wmm_stock.start(message, wmm_channel, ccochannel)
 
 
@@ -173,12 +218,13 @@ async def start_wmm_task():
 @tasks.loop(seconds=30)
 async def wmm_stock(message, wmm_channel, ccochannel):
     print("▶ Starting WMM stock check loop.")
+    cycle_started = time.perf_counter()
 
     #print(f"wmm_stock function start")
     wmm_systems = []
 
     # retrieve all WMM carriers
-    wmm_carriers = _fetch_wmm_carriers()
+    wmm_carriers = await _fetch_wmm_carriers_async()
 
     carrier: WMMData
 
@@ -191,44 +237,70 @@ async def wmm_stock(message, wmm_channel, ccochannel):
     # TODO: harmonise with MAB formats
     if wmm_systems == []:
         nofc = "WMM Stock: No Fleet Carriers are currently being tracked for WMM. Please add some to the list!"
-        try:
-            await message.edit(content=nofc)
-        except:
-            await clear_history(wmm_channel)
-            await wmm_channel.send(nofc)
+        await wmm_stock_renderer.render(wmm_channel, [nofc])
         return
 
-    content = {}
-    ccocontent = {}
-    wmm_stock = {}
-    wmm_station_stock = {}
+    wmm_aggregate = WMMStockAggregate()
+    history_rows = []
+
+    # only carriers due a refresh are fetched, the rest are shown from their last fetch
+    due_cids = wmm_scheduler.pop_due([carrier.carrier_identifier for carrier in wmm_carriers])
+    for carrier in wmm_carriers:
+        last_fetched = wmm_last_fetched.get(carrier.carrier_identifier)
+        # refresh anything we have nothing for, or whose data came from the wrong source since cAPI was toggled
+        if not last_fetched or bool(carrier.capi) != (last_fetched['capi_status'] is not None):
+            due_cids.add(carrier.carrier_identifier)
+    due_carriers = [carrier for carrier in wmm_carriers if carrier.carrier_identifier in due_cids]
+
+    # fetch every due carrier's market at once, then work through the results in order
+    print(f"Fetching stock for {len(due_carriers)} of {len(wmm_carriers)} carrier(s)...")
+    # how long each stage of the cycle took and what it cost, shown by /admin wmm status
+    cycle_stats = {'carriers': len(wmm_carriers), 'fetched': len(due_carriers)}
+    http_requests_before = sum(http_request_counts.values())
+    fetch_started = time.perf_counter()
+    fresh_stock = await fetch_wmm_carrier_stocks(due_carriers)
+    cycle_stats['fetch_seconds'] = time.perf_counter() - fetch_started
+    cycle_stats['http_requests'] = sum(http_request_counts.values()) - http_requests_before
+    print(f"Fetched stock for {len(due_carriers)} carrier(s) in {cycle_stats['fetch_seconds']:.1f}s "
+          f"with {cycle_stats['http_requests']} request(s)")
+    aggregate_started = time.perf_counter()
+
+    fetched_stock = {}
+    fresh_cids = set()
+    for carrier in wmm_carriers:
+        cid = carrier.carrier_identifier
+        fetched = fresh_stock.get(cid)
+        # an auth failure has to be acted on even if Inara has nothing for the carrier either
+        if fetched and not fetched['error'] and (fetched['capi_status'] in [200, 400, 401] or fetched['inara_data']):
+            fetched_stock[cid] = fetched
+            fresh_cids.add(cid)
+            # only keep data we can show again; errors are retried when the carrier is next due
+            if fetched['capi_status'] == 200 or fetched['inara_data']:
+                wmm_last_fetched[cid] = fetched
+        else:
+            # show what we had, if anything, when a fetch fails or cAPI and Inara are both unavailable
+            fetched_stock[cid] = wmm_last_fetched.get(cid) or fetched
+
+    # what each refreshed carrier's next refresh is worked out from
+    refresh_inputs = {}
 
     for carrier in wmm_carriers:
         print(f"Interrogating {carrier} for stock...")
-        carrier_has_stock = False
-        # load our notification status as a list so we can use it later
-        notification_status = json.loads(carrier.notification_status) if carrier.notification_status else []
+        fetched = fetched_stock[carrier.carrier_identifier]
+        fresh = carrier.carrier_identifier in fresh_cids
+        if fetched['error']:
+            print(f"Unable to fetch stock for {carrier.carrier_identifier}: {fetched['error']}")
+            continue
+        # whether we're showing Inara's market for a cAPI carrier while cAPI can't give us one
+        inara_fallback = False
         if carrier.capi:
-            print(f"Calling CAPI for {carrier.carrier_name}")
-            capi_response = capi(carrier.carrier_identifier)
-            stn_data = capi_response.json()
-
-            print(f"capi response: {capi_response.status_code}")
-            if capi_response.status_code != 200:
-                # TODO handle missing carriers, auth errors etc.
-                print(f"Error from CAPI for {carrier.carrier_identifier}: {capi_response.status_code} - {stn_data}")
-                if capi_response.status_code == 500:
-                    # this is an internal stockbot api error, dont re-auth for this.
-                    print(f"Internal stockbot API error, someone check the logs")
-                    continue
-                elif capi_response.status_code == 418:
-                    # capi is down for maintenance.
-                    await clear_history(wmm_channel)
-                    message = f"Bleep Bloop: Frontier API is down for maintenance, unable to retrieve stocks for all carriers. Retrying in 60 seconds."
-                    await wmm_channel.send(message)
-                    await asyncio.sleep(60)
-                    return
-                elif capi_response.status_code == 400 or capi_response.status_code == 401:
+            stn_data = fetched['capi_data']
+
+            print(f"capi response: {fetched['capi_status']}")
+            if fetched['capi_status'] != 200:
+                # TODO handle missing carriers
+                print(f"Error from CAPI for {carrier.carrier_identifier}: {fetched['capi_status']} - {stn_data}")
+                if fetched['capi_status'] == 400 or fetched['capi_status'] == 401:
                     print(f"cAPI auth failed for {carrier.carrier_name}")
 
                     # User needs to re-auth. (400 = EGS, 401 = Expired Token)
@@ -236,7 +308,9 @@ async def wmm_stock(message, wmm_channel, ccochannel):
                     # remove CAPI flag from databases
                     carrier.capi = 0
                     await _update_wmm_carrier(carrier)
-                    await _update_carrier_capi(carrier.carrier_identifier, 0)
+                    carrier_data = await find_carrier_async(carrier.carrier_identifier, CarrierDbFields.cid.name)
+                    if carrier_data.pid:
+                        await _update_carrier_capi(carrier_data.pid, 0)
 
                     embed = discord.Embed(
                         description=f"<@{bot.user.id}> was unable to retrieve stock levels for {carrier.carrier_name} ({carrier.carrier_identifier}) from the Frontier API. "
@@ -251,29 +325,37 @@ async def wmm_stock(message, wmm_channel, ccochannel):
                     # notify the owner
                     await notify_wmm_owner(carrier, embed, message)
                     
+                elif fetched['inara_data']:
+                    # cAPI or the stockbot is in trouble (418 is Frontier maintenance, 500 is the stockbot itself),
+                    # so show Inara's market until it recovers
+                    print(f"Falling back to Inara for {carrier.carrier_identifier}")
+                    inara_fallback = True
                 else:
-                    # all other unknown errors.
-                    print(f"Unknown error from CAPI, see above for details.")
+                    print(f"No Inara market to fall back on for {carrier.carrier_identifier}, see above for details.")
                     continue
             else:
                 carrier_name = f"**{carrier.carrier_name} ({carrier.carrier_identifier})**"
                 market_updated = ''
 
+        # when the market was updated at its source and how long ago that was, if we know
+        market_time = None
+        market_age = None
+
         # this catches the case where we remove the cAPI flag above if auth fails.
-        if not carrier.capi:
-            stn_data = get_fc_stock(carrier.carrier_identifier, 'inara')
+        if not carrier.capi or inara_fallback:
+            stn_data = fetched['inara_data']
             if not stn_data:
                 print(f"no inara market data for {carrier.carrier_identifier}")
                 continue
             carrier_name = stn_data['full_name'].upper()
             stn_data['currentStarSystem'] = stn_data['name'].title()
             stn_data['market'] = {'commodities': stn_data['commodities']}
-            try:
-                utc_time = datetime.strptime(stn_data['market_updated'].split('(')[1][0:-1], "%d %b %Y, %I:%M%p")
-                market_updated = "(As of <t:%d:R>)" % utc_time.timestamp()
-            except:
+            market_time = inara_market_time(stn_data['market_updated'])
+            if market_time:
+                market_updated = "(As of <t:%d:R>)" % market_time.timestamp()
+                market_age = (datetime.now(tz=timezone.utc) - market_time).total_seconds()
+            else:
                 market_updated = "(As of %s)" % stn_data['market_updated']
-                pass
         if 'market' not in stn_data:
             print(f"No market data for {carrier.carrier_identifier}")
             continue
@@ -281,89 +363,48 @@ async def wmm_stock(message, wmm_channel, ccochannel):
         # now we interrogate the carrier's stock levels
         com_data = stn_data['market']['commodities']
         print("Market data for %s: %s" % ( carrier.carrier_name, com_data ))
+        row = wmm_aggregate.add_market(carrier, stn_data['currentStarSystem'], carrier_name, market_updated, com_data)
+        if fresh:
+            source = 'capi' if carrier.capi and not inara_fallback else 'inara'
+            if source == 'capi':
+                history_rows.extend(stock_history_rows(carrier.carrier_identifier, com_data, source))
+            elif market_time:
+                # Inara's market may be hours old, so record it as of when Inara saw it
+                history_rows.extend(stock_history_rows(carrier.carrier_identifier, com_data, source, int(market_time.timestamp())))
+            refresh_inputs[carrier.carrier_identifier] = (source, market_age, row)
+
+    # work out every carrier's low stock and every station's totals and shortfalls in one go
+    wmm_aggregate.compute()
+    cycle_stats['aggregate_seconds'] = time.perf_counter() - aggregate_started
+
+    # low stock is sent to each owner as a single digest, and noted in the db in one go, once we've been through everything
+    digest = WMMNotificationDigest()
+    notified_carriers = []
+    for row, entry in enumerate(wmm_aggregate.carriers):
+        carrier = entry['carrier']
+        # load our notification status as a list so we can use it later
+        notification_status = json.loads(carrier.notification_status) if carrier.notification_status else []
 
-        # check for if market is empty
-        if com_data == []:
-            # TODO: how should this look?
-            content[carrier.carrier_location].append("**%s** - %s (%s) has no current market data. please visit the carrier with EDMC running" % (
-                carrier.carrier_name, stn_data['currentStarSystem'], carrier.carrier_location )
-            )
+        # Notify the owner once per commodity per wmm_tracking session.
+        newly_low = [(name, stock) for name, stock, price, low in wmm_aggregate.carrier_lines(row) if low and name not in notification_status]
+        if not newly_low:
             continue
+        print(f"Generating low stock warning for {carrier.carrier_name} to DM to owner")
 
-        # iterate through commodities
-        for com in com_data:
-            # add carrier location to the wmm_stock list if not already there
-            if carrier.carrier_location not in wmm_stock:
-                wmm_stock[carrier.carrier_location] = []
-            if stn_data['currentStarSystem'] not in wmm_station_stock:
-                wmm_station_stock[stn_data['currentStarSystem']] = {}
-            if carrier.carrier_location not in wmm_station_stock[stn_data['currentStarSystem']]:
-                wmm_station_stock[stn_data['currentStarSystem']][carrier.carrier_location] = {}
-
-            # add commodity to the master list if not already there
-            if com['name'].title() not in commodities_wmm:
-                continue
-
-            # if carrier has stock of the commodity
-            if com['stock'] != 0:
-                print("Found stock for %s" % (com['name']))
-                carrier_has_stock = True
-                if com['name'].lower() not in wmm_station_stock[stn_data['currentStarSystem']][carrier.carrier_location]:
-                    wmm_station_stock[stn_data['currentStarSystem']][carrier.carrier_location][com['name'].lower()] = int(com['stock'])
-                else:
-                    wmm_station_stock[stn_data['currentStarSystem']][carrier.carrier_location][com['name'].lower()] += int(com['stock'])
-
-                # if commodity stock is low 
-                if int(com['stock']) < 1000:
-                    wmm_stock[carrier.carrier_location].append("%s x %s - %s (%s) - **%s** - Price: %s - LOW STOCK %s" % (
-                        com['name'], format(com['stock'], ','), stn_data['currentStarSystem'], carrier.carrier_location, carrier_name, format(com['buyPrice'], ','), market_updated )
-                    )
-
-                    # Notify the owner once per commodity per wmm_tracking session.
-                    print("Notification status: %s" % (notification_status))
-                    if com['name'] not in notification_status:
-                        print(f"Generating low stock warning for {carrier.carrier_name} to DM to owner")
-                        
-                        embed = discord.Embed(
-                            description=f"📉 Your fleet carrier {carrier.carrier_name} ({carrier.carrier_identifier}) is low on %s - %s remaining." 
-                                         % ( com['name'], com['stock'] ),
-                            color=constants.EMBED_COLOUR_WARNING
-                        )
-
-                        message = f"<@{carrier.carrier_owner}>: Your fleet carrier {carrier.carrier_name} ({carrier.carrier_identifier}) is low on %s - %s remaining.\n\n" \
-                                  f"*Please enable direct messages from <@{bot.user.id}> to receive these alerts via DM.*" % ( com['name'], com['stock'] )
-                        
-                        await notify_wmm_owner(carrier, embed, message)
+        # estimate how long it'll last from how fast it's been selling
+        depletion_rates = await get_depletion_rates_async(carrier.carrier_identifier)
+        for name, stock in newly_low:
+            digest.add_low_stock(carrier, name, stock, depletion_rates.get(name.lower()))
+            notification_status.append(name)
 
-                        # tell the db we've notified for this commodity
-                        if not notification_status:
-                            notification_status = []
+        carrier.notification_status = notification_status
+        notified_carriers.append(carrier)
 
-                        notification_status.append(com['name'])
-                        carrier.notification_status = notification_status
+    if notified_carriers:
+        await digest.send()
 
-                        await _update_wmm_carrier(carrier)
-
-                # has stock, not low
-                else:
-                    wmm_stock[carrier.carrier_location].append("%s x %s - %s (%s) - **%s** - Price: %s %s" % (
-                        com['name'], format(com['stock'], ','), stn_data['currentStarSystem'].upper(), carrier.carrier_location, carrier_name, format(com['buyPrice'], ','), market_updated )
-                    )
-
-        # no stock at all
-        if not carrier_has_stock:
-            wmm_stock[carrier.carrier_location].append("**%s** - %s (%s) has no stock of any WMM commodity! %s" % (
-                carrier_name, stn_data['currentStarSystem'].upper(), carrier.carrier_location, market_updated )
-            )
-
-    for system in wmm_systems:
-        content[system] = []
-        content[system].append('-')
-        if system not in wmm_stock:
-            content[system].append("Could not find any carriers with stock in %s" % system)
-        else:
-            for line in wmm_stock[system]:
-                content[system].append(line)
+        # tell the db we've notified for these commodities
+        await _update_wmm_carriers(notified_carriers)
 
     try:
         wmm_updated = "<t:%d:R>" % datetime.now().timestamp()
@@ -371,69 +412,81 @@ async def wmm_stock(message, wmm_channel, ccochannel):
         wmm_updated = datetime.now().strftime("%d %b %Y %H:%M:%S")
         pass
 
-    # clear message history
-    await clear_history(wmm_channel)
-
-    # for each station, use a new message.
-    # and split messages over 10 lines.
-    # each line is between 120-200 chars
-    # using max: 2000 / 200 = 10
-    for (system, stncontent) in content.items():
-        if len(stncontent) == 1:
-            # this station has no carriers, dont bother printing it.
-            continue
-        pages = [page for page in chunk(stncontent, 10)]
-        for page in pages:
-            page.insert(0, ':')
-            await wmm_channel.send('\n'.join(page))
-
-    footer = []
-    footer.append(':')
-    footer.append("-\nCarrier stocks last checked %s" % ( wmm_updated ))
-    footer.append("Carriers with no timestamp are fetched from cAPI and are accurate to within an hour.")
-    footer.append("Carriers with (As of ...) are fetched from Inara. Ensure EDMC is running to update stock levels!")
-    await wmm_channel.send('\n'.join(footer))
-
+    render_started = time.perf_counter()
+    wmm_pages = wmm_stock_pages(wmm_aggregate, wmm_systems, wmm_updated)
     print("Current list of stations:")
-    print(wmm_station_stock)
-
-    for system in wmm_station_stock:
-        ccocontent[system] = []
-        for station in wmm_station_stock[system]:
-            ccocontent[system].append('-')
-            for commodity in commodities_wmm:
-                if commodity.lower() not in wmm_station_stock[system][station]:
-                    ccocontent[system].append(f"{commodity.title()} x NO STOCK !! - {system} ({station})")
-                else:
-                    ccocontent[system].append(f"{commodity.title()} x {format(wmm_station_stock[system][station][commodity.lower()], ',')} - {system} ({station})")
-
-    # for each station, use a new message.
-    # and split messages over 10 lines.
-    # each line is roughly 50 chars
-    # using max: 2000 / 50 = 40
-    await clear_history(ccochannel)
-    for (system, stncontent) in ccocontent.items():
-        if len(stncontent) == 1:
-            # this station has no carriers, dont bother printing it.
-            continue
-        pages = [page for page in chunk(stncontent, 40)]
-        for page in pages:
-            page.insert(0, ':')
-            await ccochannel.send('\n'.join(page))
-
-    # the following code allows us to change sleep time dynamically
-    # waiting at least 10 seconds before checking constants.wmm_interval again
-    # This also checks for the trigger to manually update.
+    print(wmm_aggregate.stations)
+    cco_pages = cco_supplies_pages(wmm_aggregate)
+    cycle_stats['render_seconds'] = time.perf_counter() - render_started
+
+    # only pages whose content changed are edited
+    publish_started = time.perf_counter()
+    await wmm_stock_renderer.render(wmm_channel, wmm_pages)
+    await cco_supplies_renderer.render(ccochannel, cco_pages)
+    cycle_stats['publish_seconds'] = time.perf_counter() - publish_started
+    cycle_stats['discord_calls'] = sum(renderer.last_edits + renderer.last_sends + renderer.last_deletes
+                                       for renderer in [wmm_stock_renderer, cco_supplies_renderer])
+
+    # keep this cycle's stock for the history
+    try:
+        await record_stock_history(history_rows)
+    except Exception as e:
+        print(f"Unable to record stock history: {e}")
+
+    # schedule each refreshed carrier's next refresh from its source, stock levels and how fast it's selling
+    now = time.time()
+    for cid in due_cids:
+        interval = constants.WMM_MIN_REFRESH_SECONDS
+        if cid in refresh_inputs:
+            source, market_age, row = refresh_inputs[cid]
+            try:
+                depletion_rates = await get_depletion_rates_async(cid)
+            except Exception as e:
+                print(f"Unable to get depletion rates for {cid}: {e}")
+                depletion_rates = {}
+            interval = next_refresh_interval(source, market_age, wmm_aggregate.carrier_stock(row), depletion_rates,
+                                             wmm_aggregate.carrier_thresholds(row))
+        wmm_scheduler.schedule(cid, now + interval)
+        print(f"{cid} next due for a stock refresh in {int(interval / 60)} minutes")
+
+    cycle_stats['cycle_seconds'] = time.perf_counter() - cycle_started
+    constants.wmm_last_cycle_stats = cycle_stats
+    print(f"WMM stock cycle for {len(wmm_carriers)} carrier(s) took {cycle_stats['cycle_seconds']:.1f}s: "
+          f"fetch {cycle_stats['fetch_seconds']:.2f}s, aggregate {cycle_stats['aggregate_seconds']:.2f}s, "
+          f"render {cycle_stats['render_seconds']:.3f}s, publish {cycle_stats['publish_seconds']:.2f}s "
+          f"with {cycle_stats['discord_calls']} Discord call(s)")
+
+    # sleep until the next carrier is due, checking every 10 seconds
+    # for the trigger to manually update or a change to constants.wmm_interval
+    wmm_interval = constants.wmm_interval
     constants.wmm_slept_for = 0
-    while constants.wmm_slept_for < constants.wmm_interval:
-        # wmm_trigger is set by ;wmm_stock command
+    while True:
+        # wmm_trigger is set by /cco wmm update
         if constants.wmm_trigger:
             print("Manual WMM stock refresh triggered.")
             constants.wmm_trigger = False
-            constants.wmm_slept_for = constants.wmm_interval
-        else:
-            await asyncio.sleep(10)
-            constants.wmm_slept_for = constants.wmm_slept_for + 10
+            wmm_scheduler.force_all()
+            break
+        if constants.wmm_interval != wmm_interval:
+            print("WMM interval changed, refreshing all carriers.")
+            wmm_scheduler.force_all()
+            break
+        next_due = wmm_scheduler.next_due()
+        if next_due is None or next_due <= time.time():
+            break
+        await asyncio.sleep(10)
+        constants.wmm_slept_for = constants.wmm_slept_for + 10
+
+# stock history task loop:
+# Every hour, thin out old stock snapshots so the history stays compact.
+@tasks.loop(hours=1)
+async def stock_history_cron():
+    try:
+        await downsample_stock_history()
+    except Exception as e:
+        print(f"stock history downsampling failed: {e}")
+        traceback.print_exc()
+
 
 @wmm_stock.after_loop
 async def wmm_after_loop():
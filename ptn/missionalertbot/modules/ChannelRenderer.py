@@ -0,0 +1,87 @@
+"""
+A module for keeping a channel's bot-posted pages up to date by editing them in place, used by the WMM stock channels.
+
+Depends on: helpers
+
+"""
+
+# import libraries
+import hashlib
+
+# import discord.py
+import discord
+
+# import local modules
+from ptn.missionalertbot.modules.helpers import clear_history
+
+
+class ChannelRenderer:
+
+    def __init__(self, name):
+        """
+        Class remembers the messages it has published to a channel, in order, and the hash of each one's content. Each
+        render edits only the pages whose content changed, and sends or deletes pages only when the page count changes.
+
+        :param str name: Used to label log output
+        """
+        self.name = name
+        self.channel_id = None
+        self._published = []  # [message, content hash] for each page, in channel order
+
+        # API calls made by the last render
+        self.last_edits = 0
+        self.last_sends = 0
+        self.last_deletes = 0
+
+    def reset(self):
+        """
+        Forgets the published pages, so the next render starts from a cleared channel. Call this if anything else
+        clears or posts to the channel.
+        """
+        self.channel_id = None
+        self._published = []
+
+    async def render(self, channel, pages, retry=True):
+        """
+        Brings the channel in line with the given pages.
+
+        :param discord.TextChannel channel: The channel to render to
+        :param list[str] pages: The content of each message, in display order
+        :param bool retry: Start again from a cleared channel if one of our messages has gone missing
+        """
+        if channel.id != self.channel_id or not self._published:
+            # we don't know what's in the channel, so start it clean
+            await clear_history(channel)
+            self._published = []
+            self.channel_id = channel.id
+
+        self.last_edits = self.last_sends = self.last_deletes = 0
+        try:
+            for index, content in enumerate(pages):
+                content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+                if index < len(self._published):
+                    message, published_hash = self._published[index]
+                    if published_hash != content_hash:
+                        await message.edit(content=content)
+                        self._published[index][1] = content_hash
+                        self.last_edits += 1
+                else:
+                    message = await channel.send(content)
+                    self._published.append([message, content_hash])
+                    self.last_sends += 1
+
+            while len(self._published) > len(pages):
+                message, _ = self._published.pop()
+                await message.delete()
+                self.last_deletes += 1
+
+        except discord.NotFound:
+            # someone removed one of our pages, so our record of the channel is wrong
+            print(f"{self.name}: a published page has gone missing, rendering from scratch.")
+            self.reset()
+            if retry:
+                return await self.render(channel, pages, retry=False)
+            raise
+
+        print(f"{self.name}: rendered {len(pages)} page(s) with {self.last_edits} edit(s), {self.last_sends} new and "
+              f"{self.last_deletes} deleted.")
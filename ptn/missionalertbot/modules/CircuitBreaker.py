@@ -0,0 +1,155 @@
+"""
+A module for circuit breakers guarding the upstream stock sources, so a failing source is left alone to recover instead of
+being asked again by every carrier in every cycle.
+
+Depends on: constants
+
+"""
+
+# import libraries
+from collections import deque
+import random
+import time
+
+# import local constants
+import ptn.missionalertbot.constants as constants
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker:
+
+    def __init__(self, name, failure_threshold=None, backoff_base=None, backoff_max=None, window=None):
+        """
+        Class tracks the health of one upstream endpoint.
+
+        The circuit starts closed and every request is allowed. After failure_threshold failures in a row it opens, and
+        requests are refused for a backoff that doubles each time it reopens, with jitter so we don't all come back at
+        once. When the backoff is over it goes half-open and lets a single probe through: success closes it again,
+        failure reopens it.
+
+        :param str name: The endpoint, used to label log output
+        :param int failure_threshold: Failures in a row that open the circuit, defaults to CIRCUIT_FAILURE_THRESHOLD
+        :param float backoff_base: Seconds the circuit first stays open, defaults to CIRCUIT_BACKOFF_BASE_SECONDS
+        :param float backoff_max: Longest the circuit stays open, defaults to CIRCUIT_BACKOFF_MAX_SECONDS
+        :param float window: Seconds of outcomes the error rate is worked out over, defaults to
+            CIRCUIT_ERROR_WINDOW_SECONDS
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold or constants.CIRCUIT_FAILURE_THRESHOLD
+        self.backoff_base = backoff_base or constants.CIRCUIT_BACKOFF_BASE_SECONDS
+        self.backoff_max = backoff_max or constants.CIRCUIT_BACKOFF_MAX_SECONDS
+        self.window = window or constants.CIRCUIT_ERROR_WINDOW_SECONDS
+
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.times_opened = 0  # since the circuit last closed, sets the backoff
+        self.retry_at = None  # monotonic time an open circuit goes half-open
+        self._probing = False
+        self._outcomes = deque()  # (monotonic time, succeeded)
+
+        self.refused = 0
+        self.last_error = None
+
+    def allow(self):
+        """
+        Asks whether a request may be made now. A half-open circuit allows one request at a time, whose outcome must be
+        recorded.
+
+        :rtype: bool
+        """
+        if self.state == OPEN and time.monotonic() >= self.retry_at:
+            print(f"{self.name} circuit half-open, probing.")
+            self.state = HALF_OPEN
+        if self.state == CLOSED or (self.state == HALF_OPEN and not self._probing):
+            self._probing = self.state == HALF_OPEN
+            return True
+        self.refused += 1
+        return False
+
+    def record_success(self):
+        """
+        Records a request that got a usable answer from the endpoint.
+        """
+        self._record(True)
+        if self.state != CLOSED:
+            print(f"{self.name} circuit closed, endpoint has recovered.")
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.times_opened = 0
+        self.retry_at = None
+        self._probing = False
+
+    def record_failure(self, error):
+        """
+        Records a request the endpoint failed, opening the circuit if it has failed too often.
+
+        :param error: What went wrong, shown in the status
+        """
+        self._record(False)
+        self.last_error = str(error)
+        self.consecutive_failures += 1
+        self._probing = False
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.consecutive_failures >= self.failure_threshold):
+            self._open()
+
+    def abandon(self):
+        """
+        Records a request given up on before the endpoint answered, e.g. cancelled by a timeout. It counts as neither
+        success nor failure, but frees a half-open circuit to probe again.
+        """
+        self._probing = False
+
+    def _open(self):
+        backoff = min(self.backoff_max, self.backoff_base * 2 ** self.times_opened)
+        # jitter over the upper half, so it backs off at least half as long
+        backoff = random.uniform(backoff / 2, backoff)
+        self.times_opened += 1
+        self.state = OPEN
+        self.retry_at = time.monotonic() + backoff
+        print(f"{self.name} circuit open after {self.consecutive_failures} failure(s), retrying in {backoff:.0f}s. "
+              f"Last error: {self.last_error}")
+
+    def _record(self, succeeded):
+        now = time.monotonic()
+        self._outcomes.append((now, succeeded))
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            self._outcomes.popleft()
+
+    def error_rate(self):
+        """
+        :returns: The share of requests in the last window that failed, or None if there were none
+        :rtype: float
+        """
+        now = time.monotonic()
+        recent = [succeeded for recorded_at, succeeded in self._outcomes if now - recorded_at <= self.window]
+        if not recent:
+            return None
+        return recent.count(False) / len(recent)
+
+    def retry_in(self):
+        """
+        :returns: Seconds until an open circuit goes half-open, or None if it isn't open
+        :rtype: float
+        """
+        if self.state != OPEN:
+            return None
+        return max(0, self.retry_at - time.monotonic())
+
+    def stats(self):
+        """
+        :returns: The circuit's state, error rate and counters
+        :rtype: dict
+        """
+        return {
+            'state': self.state,
+            'error_rate': self.error_rate(),
+            'requests': len(self._outcomes),
+            'consecutive_failures': self.consecutive_failures,
+            'retry_in': self.retry_in(),
+            'refused': self.refused,
+            'last_error': self.last_error,
+        }
@@ -30,7 +30,7 @@ import ptn.missionalertbot.constants as constants
 from ptn.missionalertbot.constants import ptn_logo_discord
 
 #import local modules
-from ptn.missionalertbot.database.database import find_mission
+from ptn.missionalertbot.database.database import find_mission_for_carrier_async
 
 # confirm edit mission embed
 def _confirm_edit_mission_embed(mission_params: MissionParams):
@@ -55,7 +55,7 @@ def _confirm_edit_mission_embed(mission_params: MissionParams):
 async def _is_mission_active_embed(carrier_data):
     print("Called _is_mission_active_embed")
     # look to see if the carrier is on an active mission
-    mission_data = find_mission(carrier_data.carrier_long_name, "carrier")
+    mission_data = await find_mission_for_carrier_async(carrier_data)
 
     if not mission_data:
         # if there's no result, make our embed tell the user this
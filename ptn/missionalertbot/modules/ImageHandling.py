@@ -141,7 +141,7 @@ def cleanup_temp_image_file(file_name):
 async def assign_carrier_image(interaction: discord.Interaction, lookname, original_embeds):
     print('assign_carrier_image called')
 
-    carrier_data = flexible_carrier_search_term(lookname)
+    carrier_data = await flexible_carrier_search_term(lookname)
 
     # check carrier exists
     if not carrier_data:
@@ -0,0 +1,190 @@
+"""
+A module for parsing Inara station market pages.
+
+The page is read in a single streaming pass with the standard library's HTMLParser, picking out only the header and the
+market table as they go past, rather than building a BeautifulSoup tree of the whole page and searching it.
+
+Depends on: InaraStationMarket
+
+"""
+
+# import libraries
+from html.parser import HTMLParser
+
+# import local classes
+from ptn.missionalertbot.classes.InaraStationMarket import InaraStationMarket
+
+
+# elements which never have a closing tag, so are never on the element stack
+_VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param', 'source', 'track', 'wbr'}
+
+# prefix of the carrier link in the page header, followed by the station ID and a trailing slash
+_STATION_HREF_PREFIX_LENGTH = len('/elite/station/')
+
+
+def _parse_number(text):
+    return int(text.replace('-', '0').replace(',', '').replace(' Cr', ''))
+
+
+class _StationMarketPageParser(HTMLParser):
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._stack = []  # (tag, role) of each open element
+        self._capture = None  # text of the element currently being captured
+
+        # the links in the first h2 of the page header: the carrier, then its system
+        self.header_links = []  # (href, text)
+        self._header_done = False
+
+        # the value follows a div whose text is "Market update"
+        self.market_updated = None
+        self._market_update_depth = None  # stack depth the value will start at, once the label has closed
+
+        # the market is the first table in the second mainblock
+        self.rows = None  # cell text of each market row
+        self._mainblocks = 0
+        self._row = None
+
+    def _roles(self):
+        return {role for _, role in self._stack}
+
+    def handle_starttag(self, tag, attrs):
+        classes = ()
+        href = None
+        for name, value in attrs:
+            if name == 'class' and value:
+                classes = value.split()
+            elif name == 'href':
+                href = value
+
+        role = None
+        roles = self._roles()
+
+        if self._market_update_depth is not None:
+            if len(self._stack) == self._market_update_depth:
+                role = 'market_update_value'
+                self._capture = []
+            self._market_update_depth = None
+
+        elif tag == 'div':
+            if 'headercontent' in classes and not self._header_done:
+                role = 'header'
+            elif 'mainblock' in classes:
+                self._mainblocks += 1
+                if self._mainblocks == 2:
+                    role = 'market_block'
+
+        elif tag == 'h2' and 'header' in roles and not self._header_done:
+            role = 'header_h2'
+        elif tag == 'a' and href is not None and 'header_h2' in roles:
+            role = 'header_link'
+            self._href = href
+            self._capture = []
+
+        elif tag == 'table' and 'market_block' in roles and self.rows is None:
+            role = 'market_table'
+            self.rows = []
+        elif tag == 'tbody' and 'market_table' in roles and 'market_tbody' not in roles:
+            role = 'market_tbody'
+        elif tag == 'tr' and 'market_tbody' in roles:
+            role = 'market_subheader' if 'subheader' in classes else 'market_row'
+            self._row = []
+        elif tag == 'td' and 'market_row' in roles:
+            role = 'market_cell'
+            self._capture = []
+
+        if tag not in _VOID_ELEMENTS:
+            self._stack.append((tag, role))
+
+    def handle_startendtag(self, tag, attrs):
+        # self-closing, e.g. <br/>, so nothing to track
+        pass
+
+    def handle_endtag(self, tag):
+        if not any(open_tag == tag for open_tag, _ in self._stack):
+            return
+        # close everything up to and including the matching element, as browsers do with unclosed tags
+        while self._stack:
+            open_tag, role = self._stack.pop()
+            if role:
+                self._close(role)
+            if open_tag == tag:
+                break
+        if self._market_update_depth is not None and len(self._stack) < self._market_update_depth:
+            # the label was the last thing in its parent
+            self._market_update_depth = None
+
+    def _close(self, role):
+        if role == 'header_link':
+            self.header_links.append((self._href, ''.join(self._capture)))
+            self._capture = None
+        elif role == 'header_h2':
+            self._header_done = True
+        elif role == 'market_update_label':
+            self._market_update_depth = len(self._stack)
+        elif role == 'market_update_value':
+            self.market_updated = ''.join(self._capture)
+            self._capture = None
+        elif role == 'market_cell':
+            self._row.append(''.join(self._capture))
+            self._capture = None
+        elif role == 'market_row':
+            self.rows.append(self._row)
+            self._row = None
+
+    def handle_data(self, data):
+        if self._capture is not None:
+            self._capture.append(data)
+            return
+
+        if self._market_update_depth is not None and len(self._stack) == self._market_update_depth and data.strip():
+            # the value is bare text rather than an element
+            self.market_updated = data
+            self._market_update_depth = None
+        elif self.market_updated is None and data == 'Market update' and self._stack and self._stack[-1] == ('div', None):
+            self._stack[-1] = ('div', 'market_update_label')
+
+
+def parse_station_market_page(content, fcid):
+    """
+    Parses an Inara station market page in one pass.
+
+    :param content: The page, as bytes or str
+    :param str fcid: The carrier identifier that was searched for
+    :returns: The carrier and its market. Its commodities are None if the page had no market table.
+    :rtype: InaraStationMarket
+    :raises ValueError: If the page header doesn't name a station and system, e.g. when the search had no results
+    """
+    if isinstance(content, bytes):
+        content = content.decode('utf-8', errors='replace')
+
+    parser = _StationMarketPageParser()
+    parser.feed(content)
+    parser.close()
+
+    if len(parser.header_links) < 2:
+        raise ValueError(f"No station found in Inara page for {fcid}")
+    (carrier_href, carrier_name), (_, system) = parser.header_links[:2]
+
+    commodities = None
+    if parser.rows is not None:
+        commodities = []
+        for cells in parser.rows:
+            commodities.append({
+                'id': cells[0],
+                'name': cells[0],
+                'sellPrice': _parse_number(cells[1]),
+                'buyPrice': _parse_number(cells[3]),
+                'demand': _parse_number(cells[2]),
+                'stock': _parse_number(cells[4])
+            })
+
+    return InaraStationMarket(
+        fcid=fcid,
+        carrier_name=carrier_name,
+        system=system,
+        station_id=carrier_href[_STATION_HREF_PREFIX_LENGTH:-1],
+        market_updated=parser.market_updated,
+        commodities=commodities
+    )
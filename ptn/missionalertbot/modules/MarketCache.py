@@ -0,0 +1,106 @@
+"""
+A module for caching carrier market data fetched from cAPI and Inara.
+
+Results are kept for a time-to-live that depends on their source, and concurrent requests for the same carrier and
+source share a single upstream fetch.
+
+Depends on: none
+
+"""
+
+# import libraries
+import asyncio
+import copy
+import time
+
+
+# retrieve a failed fetch's exception so asyncio doesn't warn when nobody else was waiting on it
+def _retrieve_exception(future):
+    if not future.cancelled():
+        future.exception()
+
+
+class MarketCache:
+
+    def __init__(self):
+        """
+        Class caches market data by carrier identifier and source. Callers get their own copy of the cached data, so
+        they're free to modify it.
+        """
+        self._entries = {}  # (carrier identifier, source): (data, time fetched, time to live)
+        self._in_flight = {}  # (carrier identifier, source): future resolving to the data being fetched
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def get(self, cid, source, fetch, ttl, cacheable=bool):
+        """
+        Returns cached data for the carrier and source if it's younger than ttl, otherwise fetches it. If a fetch for
+        the same carrier and source is already underway, waits for that one instead of starting another.
+
+        :param str cid: The carrier's identifier
+        :param str source: Where the data comes from, e.g. 'capi' or 'inara'
+        :param callable fetch: Coroutine function which fetches the data
+        :param float ttl: How many seconds cached data is good for
+        :param callable cacheable: Decides whether a fetched result should be cached, e.g. to skip errors
+        :returns: The data, and its age in seconds if it came from the cache or None if it was just fetched
+        :rtype: tuple
+        """
+        key = (cid, source)
+        now = time.monotonic()
+
+        entry = self._entries.get(key)
+        if entry and now - entry[1] < entry[2]:
+            self.hits += 1
+            return copy.deepcopy(entry[0]), now - entry[1]
+
+        in_flight = self._in_flight.get(key)
+        if in_flight:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            # the fetch runs in its own task, so it belongs to no single caller
+            in_flight = asyncio.ensure_future(self._fetch(key, fetch, ttl, cacheable))
+            in_flight.add_done_callback(_retrieve_exception)
+            self._in_flight[key] = in_flight
+
+        # shielded, so a caller giving up, including the one which started the fetch, doesn't cancel it for the rest
+        data = await asyncio.shield(in_flight)
+        return copy.deepcopy(data), None
+
+    async def _fetch(self, key, fetch, ttl, cacheable):
+        try:
+            data = await fetch()
+            if cacheable(data):
+                self._evict_expired()
+                self._entries[key] = (data, time.monotonic(), ttl)
+            return data
+        finally:
+            del self._in_flight[key]
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        for key in [key for key, (_, fetched_at, ttl) in self._entries.items() if now - fetched_at >= ttl]:
+            del self._entries[key]
+
+    def invalidate(self, cid, source=None):
+        """
+        Drops cached data for a carrier, e.g. after its cAPI authorisation changes.
+
+        :param str cid: The carrier's identifier
+        :param str source: Only drop data from this source
+        """
+        for key in [key for key in self._entries if key[0] == cid and (source is None or key[1] == source)]:
+            del self._entries[key]
+
+    def stats(self):
+        """
+        :returns: The number of cached entries and lookup counters
+        :rtype: dict
+        """
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+        }
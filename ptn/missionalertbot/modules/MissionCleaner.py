@@ -24,15 +24,16 @@ from ptn.missionalertbot.classes.MissionParams import MissionParams
 
 # import local constants
 import ptn.missionalertbot.constants as constants
-from ptn.missionalertbot.constants import bot, bot_spam_channel, wine_alerts_loading_channel, wine_alerts_unloading_channel, trade_alerts_channel, get_reddit, sub_reddit, \
-    reddit_flair_mission_stop, seconds_long, sub_reddit, mission_command_channel, ptn_logo_discord, reddit_flair_mission_start, channel_upvotes, trade_cat, seconds_very_short, \
-    reddit_timeout
+from ptn.missionalertbot.constants import bot, bot_spam_channel, wine_alerts_loading_channel, wine_alerts_unloading_channel, trade_alerts_channel, sub_reddit, \
+    reddit_flair_mission_stop, seconds_long, sub_reddit, mission_command_channel, ptn_logo_discord, reddit_flair_mission_start, channel_upvotes, trade_cat, seconds_very_short
 
 # import local modules
-from ptn.missionalertbot.database.database import backup_database, mission_db, missions_conn, find_carrier, CarrierDbFields
+from ptn.missionalertbot.database.database import backup_database, mission_db, find_carrier, CarrierDbFields, \
+    delete_mission_from_db, find_mission_exact_async, find_latest_reddit_outbox_entry_async
 from ptn.missionalertbot.modules.DateString import get_final_delete_hammertime, get_mission_delete_hammertime
 from ptn.missionalertbot.modules.helpers import lock_mission_channel, unlock_mission_channel, clean_up_pins, ChannelDefs, check_mission_channel_lock
-from ptn.missionalertbot.modules.ErrorHandler import GenericError, CustomError, on_generic_error, AsyncioTimeoutError, SilentError
+from ptn.missionalertbot.modules.ErrorHandler import GenericError, CustomError, on_generic_error, SilentError
+from ptn.missionalertbot.modules.RedditOutbox import reddit_outbox, POST_MISSION, COMPLETE_MISSION
 
 
 """
@@ -107,39 +108,26 @@ async def _cleanup_completed_mission(interaction: discord.Interaction, mission_d
                 except:
                     print(f"Unable to send completion message for {mission_data.carrier_name}, maybe channel deleted?")
 
-            # add comment to Reddit post
-            print("Add comment to Reddit post...")
-            if mission_data.reddit_post_id:
-                try:  # try in case Reddit is down
-                    async def add_reddit_comment():
-                        reddit_post_id = mission_data.reddit_post_id
-                        reddit = await get_reddit()
-                        await reddit.subreddit(mission_params.channel_defs.sub_reddit_actual)
-                        submission = await reddit.submission(reddit_post_id)
-                        await submission.reply(reddit_complete_text)
-                        # mark original post as spoiler, change its flair
-                        await submission.flair.select(mission_params.channel_defs.reddit_flair_completed)
-                        await submission.mod.spoiler()
-
-                    await asyncio.wait_for(add_reddit_comment(), timeout=reddit_timeout())
-
-                except asyncio.TimeoutError:
-                    print("❌⏲ TimeoutError while updating Reddit")
-                    error = "Timed out while trying to update Reddit."
-                    if cco:
-                        try:
-                            raise AsyncioTimeoutError(error, False)
-                        except Exception as e:
-                            await on_generic_error(interaction, e)
-                    else:
-                        try:
-                            raise SilentError(error)
-                        except Exception as e:
-                            await on_generic_error(interaction, e)
-
+            # queue the Reddit post's completion comment, flair and spoiler, which the Reddit outbox carries out in
+            # the background and reports to the mission gen channel if it can't
+            print("Queue Reddit post update...")
+            pending_post = None
+            if not mission_data.reddit_post_id and mission_data.carrier_pid is not None:
+                # the mission may have ended before its Reddit post was made
+                pending_post = await find_latest_reddit_outbox_entry_async(POST_MISSION, mission_data.carrier_pid)
+                if pending_post and pending_post['status'] != 'pending':
+                    pending_post = None
+            if mission_data.reddit_post_id or pending_post:
+                try:
+                    await reddit_outbox.queue(COMPLETE_MISSION, mission_data.carrier_pid, mission_data.carrier_name, {
+                        'post_id': mission_data.reddit_post_id,
+                        'comment': reddit_complete_text,
+                        'flair_id': mission_params.channel_defs.reddit_flair_completed,
+                        'status_channel_id': mission_params.channel_defs.mission_command_channel_actual,
+                    })
 
                 except Exception as e:
-                    print(f"❌ Failed updating Reddit: {e}")
+                    print(f"❌ Failed queueing Reddit update: {e}")
                     error = f'Failed updating Reddit {e}'
                     if cco:
                         try:
@@ -204,8 +192,7 @@ async def _cleanup_completed_mission(interaction: discord.Interaction, mission_d
 
             # delete mission entry from db
             print("Remove from mission database...")
-            mission_db.execute(f'''DELETE FROM missions WHERE carrier LIKE (?)''', ('%' + mission_data.carrier_name + '%',))
-            missions_conn.commit()
+            await delete_mission_from_db(mission_data)
 
             await clean_up_pins(completed_mission_channel)
 
@@ -317,9 +304,7 @@ async def remove_carrier_channel(interaction: discord.Interaction, completed_mis
                 """
 
                 # check whether channel is in-use for a new mission
-                mission_db.execute(f"SELECT * FROM missions WHERE "
-                                f"channelid = {completed_mission_channel_id}")
-                mission_data = MissionData(mission_db.fetchone())
+                mission_data = await find_mission_exact_async(completed_mission_channel_id, 'channelid')
                 print(f'Mission data from remove_carrier_channel: {mission_data}')
 
                 if mission_data:
@@ -8,6 +8,7 @@ Dependencies: constants, database, ImageHandling, TextGen, MissionGenerator
 # import libraries
 import aiohttp
 import asyncio
+import time
 import traceback
 import typing
 
@@ -18,7 +19,7 @@ from discord.ui import View, Modal
 
 # import local constants
 import ptn.missionalertbot.constants as constants
-from ptn.missionalertbot.constants import bot, bot_spam_channel, get_reddit, upvote_emoji, wineloader_role, hauler_role, get_guild
+from ptn.missionalertbot.constants import bot, bot_spam_channel, upvote_emoji, wineloader_role, hauler_role, get_guild, reddit_timeout
 
 # import local classes
 from ptn.missionalertbot.classes.MissionParams import MissionParams
@@ -31,6 +32,7 @@ from ptn.missionalertbot.modules.MissionGenerator import validate_pads, validate
     mission_generation_complete, cleanup_temp_image_file, send_discord_alert, send_discord_channel_message
 from ptn.missionalertbot.modules.TextGen import txt_create_discord, txt_create_reddit_title, txt_create_reddit_body
 from ptn.missionalertbot.modules.ErrorHandler import on_generic_error, CustomError, GenericError
+from ptn.missionalertbot.modules.RedditClient import get_reddit, find_own_submission
 
 
 class EditConfirmView(View):
@@ -162,8 +164,8 @@ class AddMessageModal(Modal):
             While self.message returns the inputted text if printed, it is actually a class holding
             all the attributes of the TextInput. View shows only the text the user inputted.
 
-            This is important because it is a weak instance and cannot be pickled with mission_params,
-            and we only want the value pickled anyway
+            This is important because it is a weak instance and cannot be stored with mission_params,
+            and we only want the value stored anyway
             """
             print(self.mission_params.cco_message_text)
             message_embed.title="✍ MESSAGE SET"
@@ -415,6 +417,8 @@ async def update_webhooks(interaction: discord.Interaction, mission_params, spam
 
             print("Defining Discord embeds...")
             discord_embeds = mission_params.discord_embeds
+            if not discord_embeds: # embeds aren't stored with the mission, so rebuild them if the channel edit didn't
+                discord_embeds = await return_discord_channel_embeds(mission_params)
             webhook_embeds = [discord_embeds.buy_embed, discord_embeds.sell_embed, discord_embeds.webhook_info_embed]
 
             if mission_params.cco_message_text: webhook_embeds.append(discord_embeds.owner_text_embed)
@@ -484,8 +488,16 @@ async def update_reddit_post(interaction: discord.Interaction, mission_params, s
             print("Sending new Reddit post")
             reddit = await get_reddit()
             subreddit = await reddit.subreddit(mission_params.channel_defs.sub_reddit_actual)
-            submission = await subreddit.submit_image(mission_params.reddit_title, image_path=mission_params.reddit_img_name,
-                                                    flair_id=mission_params.channel_defs.reddit_flair_in_progress)
+            posted_at = time.time()
+            await subreddit.submit_image(mission_params.reddit_title, image_path=mission_params.reddit_img_name,
+                                         flair_id=mission_params.channel_defs.reddit_flair_in_progress,
+                                         without_websockets=True)
+            # posting without websockets doesn't return the submission, so find it among our own posts, never mistaking
+            # the post we're replacing for it
+            submission = await asyncio.wait_for(
+                find_own_submission(subreddit, mission_params.reddit_title, posted_at,
+                                    exclude_ids={original_reddit_post_id} if original_reddit_post_id else ()),
+                timeout=reddit_timeout())
             # save new mission_params
             print(f"Original post ID: {original_reddit_post_id}")
 
@@ -11,7 +11,6 @@ from typing import List, Optional
 import aiohttp
 import asyncio
 import os
-import pickle
 from PIL import Image
 import random
 import traceback
@@ -32,20 +31,22 @@ from ptn.missionalertbot.classes.MissionParams import MissionParams
 
 # import local constants
 import ptn.missionalertbot.constants as constants
-from ptn.missionalertbot.constants import bot, get_reddit, seconds_short, upvote_emoji, hauler_role, trainee_role, reddit_timeout, \
+from ptn.missionalertbot.constants import bot, seconds_short, upvote_emoji, hauler_role, trainee_role, \
     get_guild, get_overwrite_perms, ptn_logo_discord, wineloader_role, o7_emoji, bot_spam_channel, discord_emoji, training_cat, \
     trade_cat, mcomplete_id, somm_role, pilot_role
 
 # import local modules
-from ptn.missionalertbot.database.database import backup_database, mission_db, missions_conn, find_carrier, CarrierDbFields, \
-    find_commodity, find_mission, carrier_db, carriers_conn, find_webhook_from_owner, _update_carrier_last_trade
+from ptn.missionalertbot.database.database import backup_database, find_carrier, CarrierDbFields, \
+    find_commodity, commodity_index, find_mission_for_carrier_async, carrier_db, carriers_conn, find_webhook_from_owner_async, _update_carrier_last_trade, \
+    add_mission_to_database
 from ptn.missionalertbot.modules.DateString import get_formatted_date_string
 from ptn.missionalertbot.modules.Embeds import _mission_summary_embed
-from ptn.missionalertbot.modules.ErrorHandler import on_generic_error, CustomError, AsyncioTimeoutError, GenericError
+from ptn.missionalertbot.modules.ErrorHandler import on_generic_error, CustomError, GenericError
 from ptn.missionalertbot.modules.helpers import lock_mission_channel, unlock_mission_channel, check_mission_channel_lock, flexible_carrier_search_term
 from ptn.missionalertbot.modules.ImageHandling import assign_carrier_image, create_carrier_reddit_mission_image, create_carrier_discord_mission_image
 from ptn.missionalertbot.modules.MissionCleaner import remove_carrier_channel
 from ptn.missionalertbot.modules.TextGen import txt_create_discord, txt_create_reddit_body, txt_create_reddit_title
+from ptn.missionalertbot.modules.RedditOutbox import reddit_outbox, POST_MISSION
 
 
 # a class to hold all our Discord embeds
@@ -301,8 +302,8 @@ class AddMessageModal(Modal):
                 While self.message returns the inputted text if printed, it is actually a class holding
                 all the attributes of the TextInput. View shows only the text the user inputted.
 
-                This is important because it is a weak instance and cannot be pickled with mission_params,
-                and we only want the value pickled anyway
+                This is important because it is a weak instance and cannot be stored with mission_params,
+                and we only want the value stored anyway
                 """
                 print(self.mission_params.cco_message_text)
                 message_embed.title="✍ MESSAGE SET"
@@ -404,9 +405,13 @@ async def validate_supplydemand(interaction: discord.Interaction, mission_params
 
 async def define_commodity(interaction: discord.Interaction, mission_params):
     # define commodity
+    exact_commodity = commodity_index.find_exact(mission_params.commodity_search_term)
     if mission_params.commodity_search_term in constants.commodities_common:
-        # the user typed in the name perfectly or used autocomplete so we don't need to bother querying the commodities db
+        # the user typed in the name perfectly or used autocomplete so we don't need to bother searching
         mission_params.commodity_name = mission_params.commodity_search_term
+    elif exact_commodity:
+        # the user typed a full name or a known alias, e.g. a CAPI name
+        mission_params.commodity_name = exact_commodity.name
     else: # check if commodity can be found based on user's search term, exit gracefully if not
         await find_commodity(mission_params, interaction)
         if not mission_params.returnflag:
@@ -715,6 +720,14 @@ async def check_profit_margin_on_external_send(interaction, mission_params):
 
 
 async def send_mission_to_subreddit(interaction, mission_params):
+    """
+    Queues the mission's Reddit post in the Reddit outbox, which posts it in the background and reports back to this
+    channel, so mission generation doesn't wait on Reddit. Call once the mission is in the database, so its post can
+    be recorded against it.
+
+    :param discord.Interaction interaction: The mission generation interaction
+    :param MissionParams mission_params: The mission
+    """
     print("User used option r")
     await check_profit_margin_on_external_send(interaction, mission_params)
 
@@ -724,110 +737,35 @@ async def send_mission_to_subreddit(interaction, mission_params):
     else:
         print("Profit OK, proceeding")
 
-    message_send = await interaction.channel.send("**Sending to Reddit...**")
-
     if not mission_params.reddit_title: await define_reddit_texts(mission_params)
 
     try:
-        # post to reddit
-        print("Defining Reddit elements")
-        reddit = await get_reddit()
-        subreddit = await reddit.subreddit(mission_params.channel_defs.sub_reddit_actual)
-        try:
-            async def _post_submission_to_reddit():
-                print("⏳ Attempting Reddit post...")
-                await subreddit.submit_image(mission_params.reddit_title, image_path=mission_params.reddit_img_name,
-                                                flair_id=mission_params.channel_defs.reddit_flair_in_progress,
-                                                without_websockets=True) # temporary ? workaround for PRAW error
-                return
-                
-            await asyncio.wait_for(_post_submission_to_reddit(), timeout=reddit_timeout())
-
-        except asyncio.TimeoutError:
-            print("❌⏲ Reddit post send timed out.")
-            await message_send.delete()
-            error = "Timed out while trying to send to Reddit."
-            try:
-                raise AsyncioTimeoutError(error, False)
-            except Exception as e:
-                await on_generic_error(interaction, e)
-            return
-
-        except Exception as e:
-            print(f"❌ Error posting to Reddit: {e}")
-            traceback.print_exc()
-
-        try:
-            print("⏳ Attempting to retrieve Reddit post...") 
-            async def _get_new_reddit_post(): # temporary ? workaround for PRAW error
-                submission = None
-                while True:
-                    async for new_post in subreddit.new():
-                        print(f"⏳ Testing submission {new_post}")
-                        if new_post.title == mission_params.reddit_title:
-                            print(f'✅ Found the matching submission: {new_post.title}')
-                            submission = new_post
-                            break
-                    if submission:
-                        break
-                    await asyncio.sleep(5)  # how long to wait before trying again
-                return submission
-
-            submission = await asyncio.wait_for(_get_new_reddit_post(), timeout=reddit_timeout())
-
-        except asyncio.TimeoutError:
-            print("❌⏲ Reddit post retrieval timed out")
-            await message_send.delete()
-            error = "Timed out while trying to get Reddit post link. Reddit URL will not be saved to missions database."
-            try:
-                raise AsyncioTimeoutError(error, False)
-            except Exception as e:
-                await on_generic_error(interaction, e)
-            return
-
-
-        mission_params.reddit_post_url = submission.permalink
-        mission_params.reddit_post_id = submission.id
-
-        try:
-            async def post_comment_to_reddit():
-                print("⏳ Attempting to reply to Reddit post...")
-                if mission_params.cco_message_text:
-                    comment = await submission.reply(f"> {mission_params.cco_message_text}\n\n&#x200B;\n\n{mission_params.reddit_body}")
-                else:
-                    comment = await submission.reply(mission_params.reddit_body)
-                mission_params.reddit_comment_url = comment.permalink
-                mission_params.reddit_comment_id = comment.id
-                print(f"✅ Submitted Reddit comment {comment}")
-
-            await asyncio.wait_for(post_comment_to_reddit(), timeout=reddit_timeout())
-
-        except Exception as e:
-            print(f"❌ Reddit comment post failed: {e}")
-            reddit_error_embed = discord.Embed(
-                description=f"❌ Couldn't reply to Reddit post with trade details.",
-                color=constants.EMBED_COLOUR_ERROR
-            )
-            reddit_error_embed.set_footer(text="Attempting to continue with other sends.")
-            await interaction.channel.send(embed=reddit_error_embed)
+        if mission_params.cco_message_text:
+            comment = f"> {mission_params.cco_message_text}\n\n&#x200B;\n\n{mission_params.reddit_body}"
+        else:
+            comment = mission_params.reddit_body
+
+        await reddit_outbox.queue(POST_MISSION, mission_params.carrier_data.pid, mission_params.carrier_data.carrier_long_name, {
+            'subreddit': mission_params.channel_defs.sub_reddit_actual,
+            'title': mission_params.reddit_title,
+            'image_path': mission_params.reddit_img_name,
+            'flair_id': mission_params.channel_defs.reddit_flair_in_progress,
+            'comment': comment,
+            'mission_timestamp': mission_params.timestamp,
+            'status_channel_id': interaction.channel.id,
+            'upvotes_channel_id': mission_params.channel_defs.upvotes_channel_actual,
+        })
+        # the outbox removes the image once it's posted
+        mission_params.reddit_img_name = None
 
         embed = discord.Embed(
-            title=f"Reddit trade alert sent for {mission_params.carrier_data.carrier_long_name}",
-            description=f"https://www.reddit.com{mission_params.reddit_post_url}",
-            color=constants.EMBED_COLOUR_REDDIT)
-        embed.set_thumbnail(url=constants.ICON_REDDIT)
+            description=f"⏳ Sending to Reddit in the background. The link will be posted here once it's up.",
+            color=constants.EMBED_COLOUR_REDDIT
+        )
         await interaction.channel.send(embed=embed)
-        await message_send.delete()
-        embed = discord.Embed(title=f"{mission_params.carrier_data.carrier_long_name} REQUIRES YOUR UPDOOTS",
-                            description=f"https://www.reddit.com{mission_params.reddit_post_url}",
-                            color=constants.EMBED_COLOUR_REDDIT)
-        channel = bot.get_channel(mission_params.channel_defs.upvotes_channel_actual)
-        upvote_message = await channel.send(embed=embed)
-        emoji = bot.get_emoji(upvote_emoji())
-        await upvote_message.add_reaction(emoji)
-        return
+
     except Exception as e:
-        print(f"Error posting to Reddit: {e}")
+        print(f"Error queueing Reddit post: {e}")
         traceback.print_exc()
         reddit_error_embed = discord.Embed(
             description=f"❌ Could not send to Reddit. {e}",
@@ -835,7 +773,6 @@ async def send_mission_to_subreddit(interaction, mission_params):
         )
         reddit_error_embed.set_footer(text="Attempting to continue with other sends.")
         await interaction.channel.send(embed=reddit_error_embed)
-        await message_send.delete()
 
 
 async def send_mission_to_webhook(interaction: discord.Interaction, mission_params: MissionParams):
@@ -1141,7 +1078,7 @@ async def prepare_for_gen_mission(interaction: discord.Interaction, mission_para
     print(f"Returnflag status: {mission_params.returnflag}")
 
     # check if the carrier can be found, exit gracefully if not
-    carrier_data = flexible_carrier_search_term(mission_params.carrier_name_search_term)
+    carrier_data = await flexible_carrier_search_term(mission_params.carrier_name_search_term)
     
     if not carrier_data:  # error condition
         carrier_error_embed = discord.Embed(
@@ -1155,7 +1092,7 @@ async def prepare_for_gen_mission(interaction: discord.Interaction, mission_para
     print(f"Returnflag status: {mission_params.returnflag}")
 
     # check carrier isn't already on a mission TODO change to ID lookup
-    mission_data = find_mission(carrier_data.carrier_long_name, "carrier")
+    mission_data = await find_mission_for_carrier_async(carrier_data)
     if mission_data:
         mission_error_embed = discord.Embed(
             description=f"{mission_data.carrier_name} is already on a mission, please "
@@ -1220,7 +1157,7 @@ async def prepare_for_gen_mission(interaction: discord.Interaction, mission_para
             # this only returns true if commodity is wine AND the BC channels are open, otherwise it is false
 
     # add any webhooks to mission_params
-    webhook_data = find_webhook_from_owner(carrier_data.ownerid)
+    webhook_data = await find_webhook_from_owner_async(carrier_data.ownerid)
     if webhook_data:
         for webhook in webhook_data:
             mission_params.webhook_urls.append(webhook.webhook_url)
@@ -1282,10 +1219,6 @@ async def gen_mission(interaction: discord.Interaction, owner: discord.Member, m
                     if mission_params.mission_temp_channel_id:
                         await remove_carrier_channel(interaction, mission_params.mission_temp_channel_id, seconds_short())
 
-            if "r" in mission_params.sendflags and not mission_params.edmc_off: # send to subreddit
-                async with interaction.channel.typing():
-                    await send_mission_to_subreddit(interaction, mission_params)
-
             if "w" in mission_params.sendflags and "d" in mission_params.sendflags and not mission_params.edmc_off: # send to webhook
                 async with interaction.channel.typing():
                     await send_mission_to_webhook(interaction, mission_params)
@@ -1316,6 +1249,9 @@ async def gen_mission(interaction: discord.Interaction, owner: discord.Member, m
 
         if submit_mission:
             await mission_add(mission_params)
+            if "r" in mission_params.sendflags and not mission_params.edmc_off: # send to subreddit, once the mission exists to record the post against
+                async with interaction.channel.typing():
+                    await send_mission_to_subreddit(interaction, mission_params)
             await mission_generation_complete(interaction, mission_params)
         try:
             print("Calling cleanup for temp files")
@@ -1333,7 +1269,7 @@ async def gen_mission(interaction: discord.Interaction, owner: discord.Member, m
         traceback.print_exc()
         mission_data = None
         try:
-            mission_data = find_mission(mission_params.carrier_data.carrier_long_name, "carrier")
+            mission_data = await find_mission_for_carrier_async(mission_params.carrier_data)
             print("Mission data found, mission was added to the database before exception")
         except:
             print("No mission data found, mission was not added to database")
@@ -1505,20 +1441,11 @@ async def mission_add(mission_params):
     print("Called mission_add")
     backup_database('missions')  # backup the missions database before going any further
 
-    # pickle the mission_params
-    print("Pickle the params")
     attrs = vars(mission_params)
     print(attrs)
-    pickled_mission_params = pickle.dumps(mission_params)
 
     print("Called mission_add to write to database")
-    mission_db.execute(''' INSERT INTO missions VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ''', (
-        mission_params.carrier_data.carrier_long_name, mission_params.carrier_data.carrier_identifier, mission_params.mission_temp_channel_id,
-        mission_params.commodity_name.title(), mission_params.mission_type.lower(), mission_params.system.title(), mission_params.station.title(),
-        mission_params.profit, mission_params.pads.upper(), mission_params.demand, mission_params.cco_message_text, mission_params.reddit_post_id,
-        mission_params.reddit_post_url, mission_params.reddit_comment_id, mission_params.reddit_comment_url, mission_params.discord_alert_id, pickled_mission_params
-    ))
-    missions_conn.commit()
+    await add_mission_to_database(mission_params)
     print("Mission added to db")
 
     print("Updating last trade timestamp for carrier")
@@ -1567,7 +1494,7 @@ async def mission_generation_complete(interaction: discord.Interaction, mission_
 
     # fetch data we just committed back
 
-    mission_data = find_mission(mission_params.carrier_data.carrier_long_name, 'carrier')
+    mission_data = await find_mission_for_carrier_async(mission_params.carrier_data)
 
     # return result to user
 
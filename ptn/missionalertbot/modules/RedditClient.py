@@ -0,0 +1,121 @@
+"""
+A module for the bot's shared Reddit client.
+
+An asyncpraw client holds an HTTP session and an OAuth token, so the whole bot shares one, created on first use and
+closed on shutdown, rather than every Reddit operation authenticating afresh and leaving its session open.
+
+Depends on: none
+
+"""
+
+# import libraries
+import asyncio
+import time
+
+# import asyncpraw
+import asyncpraw
+from asyncprawcore import Requestor
+
+
+# the shared client, created on first use so it belongs to the bot's event loop
+_reddit: asyncpraw.Reddit = None
+
+# what the shared client has done since startup
+reddit_counters = {
+    'requests': 0,  # API requests
+    'token_requests': 0,  # OAuth token fetches and refreshes
+    'failed': 0,  # requests that never got a response
+    'clients_created': 0,
+}
+_reddit_created_at = None
+
+# how much our clock and Reddit's may disagree when matching a new post by its creation time. Kept small, since a post
+# with the same title made within this long before ours would be mistaken for it
+SUBMISSION_CLOCK_SLACK_SECONDS = 5
+
+# how many of our newest posts to look through for one we've just made
+SUBMISSION_SEARCH_LIMIT = 10
+
+
+# counts the requests made by the shared client, telling OAuth token fetches apart from API requests
+class CountingRequestor(Requestor):
+
+    async def request(self, *args, timeout=None, **kwargs):
+        url = args[1] if len(args) > 1 else kwargs.get('url', '')
+        if '/api/v1/access_token' in str(url):
+            reddit_counters['token_requests'] += 1
+        else:
+            reddit_counters['requests'] += 1
+        try:
+            return await super().request(*args, timeout=timeout, **kwargs)
+        except Exception:
+            reddit_counters['failed'] += 1
+            raise
+
+
+async def get_reddit():
+    """
+    Returns the shared Reddit client, creating it if needed. Callers mustn't close it; that's done on shutdown.
+    discord.py complains if an async resource is not initialized inside async.
+
+    :rtype: asyncpraw.Reddit
+    """
+    global _reddit, _reddit_created_at
+    if _reddit is None:
+        print("Creating shared Reddit client")
+        _reddit = asyncpraw.Reddit('bot1', requestor_class=CountingRequestor)
+        _reddit_created_at = time.time()
+        reddit_counters['clients_created'] += 1
+    return _reddit
+
+
+async def close_reddit():
+    """
+    Closes the shared Reddit client and its HTTP session. Called on shutdown.
+    """
+    global _reddit
+    if _reddit is not None:
+        print("Closing shared Reddit client")
+        await _reddit.close()
+        _reddit = None
+
+
+async def find_own_submission(subreddit, title, since, exclude_ids=()):
+    """
+    Finds a post we've just made, e.g. an image post, which Reddit doesn't identify when it's made without websockets.
+    Looks through our own newest posts for the newest in the subreddit with the title, created since we posted, so an
+    older post with the same title is never mistaken for it. Posts we already know about, e.g. the one being replaced when
+    a mission is edited, can be excluded by ID. Our own listing shows a new post straight away, unlike the
+    subreddit's, so this normally takes a single request. Keeps looking until it's found, so callers should give it a
+    timeout.
+
+    :param asyncpraw.models.Subreddit subreddit: The subreddit the post was made to
+    :param str title: The post's title
+    :param float since: POSIX time from just before the post was made
+    :param exclude_ids: IDs of our posts which are known not to be the new one
+    :rtype: asyncpraw.models.Submission
+    """
+    reddit = await get_reddit()
+    me = await reddit.user.me()
+    delay = 1
+    while True:
+        async for submission in me.submissions.new(limit=SUBMISSION_SEARCH_LIMIT):
+            if submission.created_utc < since - SUBMISSION_CLOCK_SLACK_SECONDS:
+                # newest first, so the rest are older still
+                break
+            if submission.id in exclude_ids:
+                continue
+            if submission.subreddit.display_name.lower() == subreddit.display_name.lower() and submission.title == title:
+                print(f"✅ Found our new submission {submission.id}: {submission.title}")
+                return submission
+        print(f"⏳ New submission not listed yet, checking again in {delay}s")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 5)
+
+
+def reddit_stats():
+    """
+    :returns: The shared client's counters, whether it's open and when it was created
+    :rtype: dict
+    """
+    return dict(reddit_counters, open=_reddit is not None, created_at=_reddit_created_at)
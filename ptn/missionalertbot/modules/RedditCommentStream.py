@@ -0,0 +1,214 @@
+"""
+A module for following a subreddit's comments from where we left off.
+
+asyncpraw's comment stream starts from whatever is newest each time it's opened, so every comment made while the bot was
+down or reconnecting was lost, and it gives us nothing to back off with when Reddit is failing. This stream records the
+last comment handled in the missions database and carries on from it after a reconnect or restart, backing off through a
+circuit breaker while Reddit is failing.
+
+Depends on: constants, database, CircuitBreaker, RedditClient
+
+"""
+
+# import libraries
+import asyncio
+from collections import deque
+import time
+import traceback
+
+# import local constants
+import ptn.missionalertbot.constants as constants
+
+# import local modules
+from ptn.missionalertbot.database.database import find_reddit_stream_checkpoint_async, _update_reddit_stream_checkpoint
+from ptn.missionalertbot.modules.CircuitBreaker import CircuitBreaker
+from ptn.missionalertbot.modules.RedditClient import get_reddit
+
+
+# the most a Reddit listing will return, so the furthest back we can catch up
+REDDIT_LISTING_MAX = 1000
+
+# how far back the throughput figure looks
+THROUGHPUT_WINDOW_SECONDS = 3600
+
+
+# Reddit IDs are base 36 and increase with each new comment
+def _comment_number(comment_id):
+    return int(comment_id, 36)
+
+
+class RedditCommentStream:
+
+    def __init__(self, subreddit_name):
+        """
+        Class follows one subreddit's new comments, oldest first, resuming from a checkpoint kept in the database.
+
+        Comments are handed to a handler one at a time and the checkpoint moves on once each is handled, so a comment is
+        never skipped because we were down or reconnecting, only ones older than REDDIT_COMMENT_MAX_CATCHUP_HOURS. A
+        comment whose handler keeps failing is retried REDDIT_COMMENT_HANDLE_ATTEMPTS times, then skipped.
+
+        :param str subreddit_name: The subreddit to follow
+        """
+        self.subreddit_name = subreddit_name
+        self.name = f"r/{subreddit_name}/comments"
+        self.breaker = CircuitBreaker(
+            f"Reddit {self.name}",
+            failure_threshold=1,
+            backoff_base=constants.REDDIT_STREAM_BACKOFF_BASE_SECONDS,
+            backoff_max=constants.REDDIT_STREAM_BACKOFF_MAX_SECONDS
+        )
+
+        self._last_number = None  # the checkpoint comment's ID as a number
+        self.last_fullname = None
+        self._loaded = False
+
+        # metrics
+        self.started_at = None
+        self.polls = 0
+        self.last_poll_at = None
+        self.backlog = 0  # comments fetched but not yet handled
+        self.processed = 0
+        self.skipped_stale = 0
+        self.handler_failures = 0
+        self.last_lag = None
+        self.max_lag = None
+        self._processed_times = deque()  # monotonic time each comment was handled
+
+    async def _load_checkpoint(self):
+        checkpoint = await find_reddit_stream_checkpoint_async(self.name)
+        if checkpoint:
+            self.last_fullname = checkpoint['last_fullname']
+            self._last_number = _comment_number(self.last_fullname.split('_', 1)[-1])
+            print(f"{self.name} resuming after {self.last_fullname}")
+        else:
+            print(f"{self.name} has no checkpoint, starting from the newest comment")
+        self._loaded = True
+
+    async def _fetch_new(self):
+        """
+        Fetches every comment newer than the checkpoint, as far back as Reddit lists.
+
+        :returns: The new comments, oldest first
+        :rtype: list[asyncpraw.models.Comment]
+        """
+        reddit = await get_reddit()
+        subreddit = await reddit.subreddit(self.subreddit_name)
+        comments = []
+        # pages of 100 are only fetched as we iterate, so once we're caught up this is a single request
+        async for comment in subreddit.comments(limit=REDDIT_LISTING_MAX):
+            if self._last_number is not None and _comment_number(comment.id) <= self._last_number:
+                break
+            comments.append(comment)
+        else:
+            # ran out of listing before reaching the checkpoint
+            if self._last_number is not None and comments:
+                print(f"⚠ {self.name} couldn't reach its checkpoint, any comments before {comments[-1].fullname} were missed")
+        comments.reverse()
+        return comments
+
+    async def commit(self, comment):
+        """
+        Moves the checkpoint on to a comment we're done with.
+
+        :param asyncpraw.models.Comment comment: The comment
+        """
+        self._last_number = _comment_number(comment.id)
+        self.last_fullname = comment.fullname
+        await _update_reddit_stream_checkpoint(self.name, comment.fullname, comment.created_utc)
+
+    async def _handle(self, handler, comment):
+        for attempt in range(1, constants.REDDIT_COMMENT_HANDLE_ATTEMPTS + 1):
+            try:
+                await handler(comment)
+                return
+            except Exception as e:
+                print(f"❌ Error handling Reddit comment {comment.fullname} (attempt {attempt}): {e}")
+                traceback.print_exc()
+                if attempt < constants.REDDIT_COMMENT_HANDLE_ATTEMPTS:
+                    await asyncio.sleep(2 ** attempt)
+        print(f"❌ Giving up on Reddit comment {comment.fullname}")
+        self.handler_failures += 1
+
+    async def run(self, handler):
+        """
+        Follows the subreddit forever, passing each new comment to the handler, oldest first.
+
+        :param handler: Coroutine function taking an asyncpraw Comment
+        """
+        if not self._loaded:
+            await self._load_checkpoint()
+        self.started_at = self.started_at or time.time()
+
+        while True:
+            if not self.breaker.allow():
+                await asyncio.sleep(self.breaker.retry_in() or 1)
+                continue
+
+            try:
+                self.polls += 1
+                self.last_poll_at = time.time()
+                comments = await self._fetch_new()
+            except asyncio.CancelledError:
+                self.breaker.abandon()
+                raise
+            except Exception as e:
+                print(f"❌ Error fetching comments for {self.name}: {e}")
+                self.breaker.record_failure(e)
+                continue
+            self.breaker.record_success()
+
+            if self._last_number is None:
+                # first run: start from the newest comment rather than relaying everything Reddit lists
+                if comments:
+                    await self.commit(comments[-1])
+                comments = []
+
+            self.backlog = len(comments)
+            for comment in comments:
+                lag = time.time() - comment.created_utc
+                if lag > constants.REDDIT_COMMENT_MAX_CATCHUP_HOURS * 3600:
+                    self.skipped_stale += 1
+                else:
+                    await self._handle(handler, comment)
+                    self._record_processed(lag)
+                await self.commit(comment)
+                self.backlog -= 1
+
+            await asyncio.sleep(constants.REDDIT_COMMENT_POLL_SECONDS)
+
+    def _record_processed(self, lag):
+        now = time.monotonic()
+        self.processed += 1
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag or 0, lag)
+        self._processed_times.append(now)
+        while self._processed_times and now - self._processed_times[0] > THROUGHPUT_WINDOW_SECONDS:
+            self._processed_times.popleft()
+
+    def throughput(self):
+        """
+        :returns: Comments handled in the last hour
+        :rtype: int
+        """
+        now = time.monotonic()
+        return sum(1 for handled_at in self._processed_times if now - handled_at <= THROUGHPUT_WINDOW_SECONDS)
+
+    def stats(self):
+        """
+        :returns: The stream's checkpoint, lag, throughput and counters, and its circuit's state
+        :rtype: dict
+        """
+        return {
+            'checkpoint': self.last_fullname,
+            'started_at': self.started_at,
+            'polls': self.polls,
+            'last_poll_at': self.last_poll_at,
+            'backlog': self.backlog,
+            'processed': self.processed,
+            'per_hour': self.throughput(),
+            'last_lag': self.last_lag,
+            'max_lag': self.max_lag,
+            'skipped_stale': self.skipped_stale,
+            'handler_failures': self.handler_failures,
+            'circuit': self.breaker.stats(),
+        }
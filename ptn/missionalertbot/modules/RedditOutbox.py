@@ -0,0 +1,391 @@
+"""
+A module for carrying out mission Reddit operations in the background.
+
+Posting a mission to Reddit, and marking it complete there, used to be awaited by the CCO's command, so a slow or
+failing Reddit held up mission generation and completion. These operations are now written to the reddit_outbox table
+and carried out by a background worker which retries them with backoff. The worker saves each step as it goes, so a
+retry or restart picks up where the last attempt left off rather than posting twice, records the results in the
+mission, and reports to the mission gen channel.
+
+Depends on: constants, database, ErrorHandler, RedditClient
+
+"""
+
+# import libraries
+import asyncio
+from datetime import datetime, timezone
+import json
+import os
+import random
+import time
+import traceback
+
+# import discord.py
+import discord
+
+# import local constants
+import ptn.missionalertbot.constants as constants
+from ptn.missionalertbot.constants import bot, reddit_timeout, upvote_emoji
+
+# import local modules
+from ptn.missionalertbot.database.database import add_reddit_outbox_entry, find_pending_reddit_outbox_entries_async, \
+    find_latest_reddit_outbox_entry_async, _update_reddit_outbox_entry, delete_finished_reddit_outbox_entries, \
+    find_mission_exact_async, _update_mission_in_database
+from ptn.missionalertbot.modules.ErrorHandler import CustomError
+from ptn.missionalertbot.modules.RedditClient import get_reddit, find_own_submission
+
+
+# operations the outbox knows how to carry out
+POST_MISSION = 'post_mission'
+COMPLETE_MISSION = 'complete_mission'
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+# longest the worker sleeps without checking for due entries, in case it missed a wakeup
+OUTBOX_IDLE_SECONDS = 300
+
+
+def _now():
+    return int(datetime.now(tz=timezone.utc).timestamp())
+
+
+# remove a mission's Reddit image once it's no longer needed
+def _remove_image(payload):
+    image_path = payload.get('image_path')
+    if image_path and os.path.isfile(image_path):
+        print(f'Deleting the temp file at: {image_path}')
+        try:
+            os.remove(image_path)
+        except Exception as e:
+            print(f'There was a problem removing the temp image file located {image_path}: {e}')
+
+
+class WaitingForEntry(Exception):
+    """
+    Raised by an operation which can't go ahead until an earlier entry is done. It's tried again later without counting
+    as a failed attempt.
+    """
+
+
+class RedditOutbox:
+
+    def __init__(self):
+        """
+        Class carries out queued Reddit operations, oldest first, retrying those that fail with exponential backoff
+        until REDDIT_OUTBOX_MAX_ATTEMPTS is reached.
+        """
+        self._wakeup: asyncio.Event = None
+
+        # metrics
+        self.pending = 0
+        self.done = 0
+        self.retried = 0
+        self.failed = 0
+        self.last_error = None
+        self.last_done_at = None
+
+    async def queue(self, operation, carrier_pid, carrier_name, payload):
+        """
+        Adds an operation to the outbox and wakes the worker to carry it out.
+
+        :param str operation: POST_MISSION or COMPLETE_MISSION
+        :param int carrier_pid: The mission's carrier p_ID, or None
+        :param str carrier_name: The mission's carrier name
+        :param dict payload: Everything the operation needs
+        :returns: The entry's ID
+        :rtype: int
+        """
+        entry_id = await add_reddit_outbox_entry(operation, carrier_pid, carrier_name, payload)
+        self.pending += 1
+        self.wake()
+        return entry_id
+
+    def wake(self):
+        """
+        Tells the worker to look for due entries now.
+        """
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+
+    async def run(self):
+        """
+        Carries out due entries forever, sleeping until the next is due or one is queued.
+        """
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+
+        removed = await delete_finished_reddit_outbox_entries(_now() - constants.REDDIT_OUTBOX_KEEP_DAYS * 86400)
+        print(f"Reddit outbox started, removed {removed} old finished entries")
+
+        while True:
+            self._wakeup.clear()
+            entries = await find_pending_reddit_outbox_entries_async()
+            self.pending = len(entries)
+
+            for entry in entries:
+                if entry['next_attempt_at'] <= _now():
+                    await self._attempt(entry)
+
+            # entries may have been rescheduled, so look again for when the next one is due
+            entries = await find_pending_reddit_outbox_entries_async()
+            self.pending = len(entries)
+            next_due = min((entry['next_attempt_at'] for entry in entries), default=None)
+            sleep_for = OUTBOX_IDLE_SECONDS if next_due is None else min(max(next_due - _now(), 0), OUTBOX_IDLE_SECONDS)
+            if not sleep_for:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=sleep_for)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _attempt(self, entry):
+        entry_id, operation = entry['entry_id'], entry['operation']
+        payload = json.loads(entry['payload'])
+        attempts = entry['attempts'] + 1
+        print(f"⏳ Reddit outbox entry {entry_id}: {operation} for {entry['carrier']}, attempt {attempts}")
+
+        try:
+            if operation == POST_MISSION:
+                result = await self._post_mission(entry, payload)
+            elif operation == COMPLETE_MISSION:
+                result = await self._complete_mission(entry, payload)
+            else:
+                raise CustomError(f"Unknown Reddit operation {operation}")
+
+        except WaitingForEntry as e:
+            print(f"Reddit outbox entry {entry_id} is waiting: {e}")
+            await _update_reddit_outbox_entry(entry_id, PENDING, entry['attempts'],
+                                              _now() + constants.REDDIT_OUTBOX_RETRY_BASE_SECONDS, payload, str(e))
+            return
+
+        except Exception as e:
+            print(f"❌ Reddit outbox entry {entry_id} failed: {e}")
+            traceback.print_exc()
+            self.last_error = f"{operation} for {entry['carrier']}: {e}"
+
+            if attempts < constants.REDDIT_OUTBOX_MAX_ATTEMPTS:
+                backoff = min(constants.REDDIT_OUTBOX_RETRY_MAX_SECONDS,
+                              constants.REDDIT_OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+                # jitter over the upper half, so entries failing together aren't all retried together
+                backoff = random.uniform(backoff / 2, backoff)
+                print(f"Retrying Reddit outbox entry {entry_id} in {backoff:.0f}s")
+                await _update_reddit_outbox_entry(entry_id, PENDING, attempts, _now() + int(backoff), payload, str(e))
+                self.retried += 1
+                return
+
+            print(f"❌ Giving up on Reddit outbox entry {entry_id} after {attempts} attempts")
+            await _update_reddit_outbox_entry(entry_id, FAILED, attempts, entry['next_attempt_at'], payload, str(e))
+            self.failed += 1
+            await self._report_failure(entry, payload, e)
+            return
+
+        await _update_reddit_outbox_entry(entry_id, DONE, attempts, entry['next_attempt_at'], payload, None, result)
+        self.done += 1
+        self.last_done_at = time.time()
+        print(f"✅ Reddit outbox entry {entry_id} done")
+
+        if operation == POST_MISSION:
+            await self._report_post(entry, payload)
+
+    async def _save_progress(self, entry, payload):
+        await _update_reddit_outbox_entry(entry['entry_id'], PENDING, entry['attempts'], entry['next_attempt_at'], payload)
+
+    async def _post_mission(self, entry, payload):
+        """
+        Posts a mission's image to its subreddit, replies to it with the mission details, and records both in the
+        mission.
+        """
+        reddit = await get_reddit()
+        subreddit = await reddit.subreddit(payload['subreddit'])
+
+        if not payload.get('post_id'):
+            submission = None
+            if payload.get('posted_at'):
+                # an earlier attempt may have made the post before failing, so don't post it twice
+                try:
+                    submission = await asyncio.wait_for(
+                        find_own_submission(subreddit, payload['title'], payload['posted_at']), timeout=reddit_timeout())
+                    print("Found the post made by an earlier attempt")
+                except asyncio.TimeoutError:
+                    print("No post from an earlier attempt, posting again")
+
+            if not submission:
+                if not os.path.isfile(payload['image_path']):
+                    raise CustomError(f"Mission image {payload['image_path']} no longer exists")
+
+                payload['posted_at'] = time.time()
+                await self._save_progress(entry, payload)
+                print("⏳ Attempting Reddit post...")
+                try:
+                    await asyncio.wait_for(
+                        subreddit.submit_image(payload['title'], image_path=payload['image_path'], flair_id=payload['flair_id'],
+                                               without_websockets=True), # temporary ? workaround for PRAW error
+                        timeout=reddit_timeout())
+                except asyncio.TimeoutError:
+                    raise
+                except Exception as e:
+                    # the post is sometimes made anyway, so look for it before giving up on this attempt
+                    print(f"❌ Error posting to Reddit: {e}")
+
+                print("⏳ Attempting to retrieve Reddit post...")
+                submission = await asyncio.wait_for(
+                    find_own_submission(subreddit, payload['title'], payload['posted_at']), timeout=reddit_timeout())
+
+            payload['post_id'] = submission.id
+            payload['post_url'] = submission.permalink
+            await self._save_progress(entry, payload)
+            _remove_image(payload)
+
+        if not payload.get('comment_id'):
+            print("⏳ Attempting to reply to Reddit post...")
+            submission = await reddit.submission(payload['post_id'])
+            comment = await asyncio.wait_for(submission.reply(payload['comment']), timeout=reddit_timeout())
+            print(f"✅ Submitted Reddit comment {comment}")
+            payload['comment_id'] = comment.id
+            payload['comment_url'] = comment.permalink
+            await self._save_progress(entry, payload)
+
+        payload['recorded'] = await self._record_post(entry, payload)
+        return {key: payload.get(key) for key in ('post_id', 'post_url', 'comment_id', 'comment_url')}
+
+    async def _record_post(self, entry, payload):
+        """
+        Stores a mission's Reddit post and comment in its mission, if it's still the same mission.
+
+        :returns: Whether the mission was still there to record them in
+        :rtype: bool
+        """
+        if entry['carrier_pid'] is not None:
+            mission_data = await find_mission_exact_async(entry['carrier_pid'], 'carrier_pid')
+        else:
+            mission_data = await find_mission_exact_async(entry['carrier'], 'carrier')
+
+        mission_params = mission_data.mission_params if mission_data else None
+        if not mission_params or str(mission_params.timestamp) != str(payload['mission_timestamp']):
+            print(f"Mission for {entry['carrier']} has ended, not recording its Reddit post")
+            return False
+
+        mission_params.reddit_post_id = payload.get('post_id')
+        mission_params.reddit_post_url = payload.get('post_url')
+        mission_params.reddit_comment_id = payload.get('comment_id')
+        mission_params.reddit_comment_url = payload.get('comment_url')
+        await _update_mission_in_database(mission_params)
+        print(f"Recorded Reddit post {mission_params.reddit_post_id} for {entry['carrier']}")
+        return True
+
+    async def _complete_mission(self, entry, payload):
+        """
+        Replies to a mission's Reddit post to say it's over, then changes its flair and marks it as a spoiler.
+        """
+        if not payload.get('post_id'):
+            # the mission ended before its post was made, so use the post once it has been
+            post_entry = await find_latest_reddit_outbox_entry_async(POST_MISSION, entry['carrier_pid'], entry['entry_id'])
+            if post_entry and post_entry['status'] == PENDING:
+                raise WaitingForEntry(f"mission's Reddit post is still queued as entry {post_entry['entry_id']}")
+            if not post_entry or post_entry['status'] != DONE:
+                print(f"Mission for {entry['carrier']} was never posted to Reddit, nothing to complete")
+                return {'skipped': True}
+            payload['post_id'] = json.loads(post_entry['result'])['post_id']
+            await self._save_progress(entry, payload)
+
+        reddit = await get_reddit()
+        submission = await reddit.submission(payload['post_id'])
+
+        if not payload.get('commented'):
+            await asyncio.wait_for(submission.reply(payload['comment']), timeout=reddit_timeout())
+            payload['commented'] = True
+            await self._save_progress(entry, payload)
+
+        # mark original post as spoiler, change its flair
+        if not payload.get('flaired'):
+            await asyncio.wait_for(submission.flair.select(payload['flair_id']), timeout=reddit_timeout())
+            payload['flaired'] = True
+            await self._save_progress(entry, payload)
+
+        if not payload.get('spoilered'):
+            await asyncio.wait_for(submission.mod.spoiler(), timeout=reddit_timeout())
+            payload['spoilered'] = True
+
+        return {'post_id': payload['post_id']}
+
+    async def _report_post(self, entry, payload):
+        """
+        Tells the mission gen channel a mission's Reddit post is up, and asks for upvotes if the mission's still going.
+        """
+        try:
+            if not payload.get('comment_id'):
+                await self._send_status(payload, discord.Embed(
+                    description=f"❌ Couldn't reply to Reddit post for {entry['carrier']} with trade details.",
+                    color=constants.EMBED_COLOUR_ERROR
+                ))
+
+            embed = discord.Embed(
+                title=f"Reddit trade alert sent for {entry['carrier']}",
+                description=f"https://www.reddit.com{payload['post_url']}",
+                color=constants.EMBED_COLOUR_REDDIT)
+            embed.set_thumbnail(url=constants.ICON_REDDIT)
+            await self._send_status(payload, embed)
+
+            if not payload.get('recorded'):
+                return
+
+            embed = discord.Embed(title=f"{entry['carrier']} REQUIRES YOUR UPDOOTS",
+                                  description=f"https://www.reddit.com{payload['post_url']}",
+                                  color=constants.EMBED_COLOUR_REDDIT)
+            channel = bot.get_channel(payload['upvotes_channel_id'])
+            upvote_message = await channel.send(embed=embed)
+            emoji = bot.get_emoji(upvote_emoji())
+            await upvote_message.add_reaction(emoji)
+        except Exception as e:
+            print(f"Couldn't report Reddit post for {entry['carrier']}: {e}")
+
+    async def _report_failure(self, entry, payload, error):
+        """
+        Tells the mission gen channel an operation has been given up on. A mission whose post was made but couldn't be
+        replied to still has its post recorded and announced.
+        """
+        if entry['operation'] == POST_MISSION:
+            _remove_image(payload)
+            if payload.get('post_id'):
+                try:
+                    payload['recorded'] = await self._record_post(entry, payload)
+                except Exception as e:
+                    print(f"Couldn't record Reddit post for {entry['carrier']}: {e}")
+                await self._report_post(entry, payload)
+                return
+            description = f"❌ Could not send {entry['carrier']}'s mission to Reddit. {error}"
+        else:
+            description = f"❌ Failed updating Reddit for {entry['carrier']}'s completed mission. {error}"
+
+        try:
+            embed = discord.Embed(description=description, color=constants.EMBED_COLOUR_ERROR)
+            embed.set_footer(text=f"Gave up after {constants.REDDIT_OUTBOX_MAX_ATTEMPTS} attempts.")
+            await self._send_status(payload, embed)
+        except Exception as e:
+            print(f"Couldn't report Reddit failure for {entry['carrier']}: {e}")
+
+    @staticmethod
+    async def _send_status(payload, embed):
+        channel = bot.get_channel(payload['status_channel_id'])
+        await channel.send(embed=embed)
+
+    def stats(self):
+        """
+        :returns: The number of entries waiting and how many have been done, retried and given up on
+        :rtype: dict
+        """
+        return {
+            'pending': self.pending,
+            'done': self.done,
+            'retried': self.retried,
+            'failed': self.failed,
+            'last_error': self.last_error,
+            'last_done_at': self.last_done_at,
+        }
+
+
+# the bot's Reddit outbox, run by a background task
+reddit_outbox = RedditOutbox()
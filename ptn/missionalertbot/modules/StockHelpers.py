@@ -1,15 +1,16 @@
 """
 A module for helper functions specifically for the Stock Tracker function.
 
-Depends on: constants, ErrorHandler
+Depends on: constants, CircuitBreaker, ErrorHandler, InaraParser, MarketCache
 
 """
 
 # import libraries
+import aiohttp
+import asyncio
+from datetime import datetime, timezone
 import json
-from bs4 import BeautifulSoup
 import requests
-import traceback
 
 # import discord.py
 import discord
@@ -24,24 +25,22 @@ import ptn.missionalertbot.constants as constants
 from ptn.missionalertbot.constants import bot, API_TOKEN, API_HOST, channel_cco_wmm_talk
 
 # import local modules
+from ptn.missionalertbot.modules.CircuitBreaker import CircuitBreaker
 from ptn.missionalertbot.modules.ErrorHandler import CommandChannelError, CommandRoleError, CustomError, GenericError, on_generic_error
+from ptn.missionalertbot.modules.InaraParser import parse_station_market_page
+from ptn.missionalertbot.modules.MarketCache import MarketCache
 
 
 def inara_find_fc_system(fcid):
     #print("Searching inara for carrier %s" % ( fcid ))
-    URL = "https://inara.cz/elite/station-market/?search=%s" % (fcid)
+    URL = "%s/elite/station-market/?search=%s" % (constants.INARA_URL, fcid)
     try:
         page = requests.get(URL, headers={'User-Agent': 'PTNStockBot'})
-        soup = BeautifulSoup(page.content, "html.parser")
-        header = soup.find_all("div", class_="headercontent")
-        header_info = header[0].find("h2")
-        carrier_system_info = header_info.find_all('a', href=True)
-        carrier = carrier_system_info[0].text
-        system = carrier_system_info[1].text
-
-        if fcid in carrier:
+        station_market = parse_station_market_page(page.content, fcid)
+
+        if fcid in station_market.carrier_name:
             # print("Carrier: %s (stationid %s) is at system: %s" % (carrier.text, stationid['href'][9:-1], system))
-            return {'system': system, 'stationid': carrier_system_info[0]['href'][15:-1], 'full_name': carrier}
+            return station_market.to_system_info()
         else:
             print("Could not find exact match, aborting inara search")
             return False
@@ -50,67 +49,33 @@ def inara_find_fc_system(fcid):
         return False
 
 
-def inara_fc_market_data(fcid):
-    print("Searching inara market data for station: %s " % ( fcid ))
+# parse an Inara station market page into the same shape as our cAPI data
+def _parse_inara_market_page(content, fcid):
+    station_market = parse_station_market_page(content, fcid)
+    if station_market.commodities is None:
+        print("❌ Failed")
+        raise ValueError(f"No market found in Inara page for {fcid}")
+    print("✅ Success")
+    return station_market.to_market_data()
+
+
+# read when Inara last saw a market
+def inara_market_time(market_updated):
+    """
+    Reads the time from Inara's market update text, e.g. "5 hours ago (17 Oct 2026, 3:04pm)".
+
+    :param str market_updated: The market update text from the page
+    :returns: The time, in UTC, or None if it doesn't have one
+    :rtype: datetime
+    """
     try:
-        url = "https://inara.cz/elite/station-market/?search=%s" % (fcid)
-        print(url)
-        page = requests.get(url, headers={'User-Agent': 'PTNStockBot'})
-        soup = BeautifulSoup(page.content, "html.parser")
-        mainblock = soup.find_all('div', class_='mainblock')
-
-        # Find carrier and system info
-        header = soup.find_all("div", class_="headercontent")
-        header_info = header[0].find("h2")
-        carrier_system_info = header_info.find_all('a', href=True)
-        carrier = carrier_system_info[0].text
-        system = carrier_system_info[1].text
-
-        # Find market info
-        updated = soup.find("div", text="Market update").next_sibling.get_text()
-        # main_content = soup.find('div', class_="maincontent0")
-        table = mainblock[1].find('table')
-        tbody = table.find("tbody")
-        rows = tbody.find_all('tr')
-        marketdata = []
-        for row in rows:
-            rowclass = row.attrs.get("class") or []
-            if "subheader" in rowclass:
-                continue
-            cells = row.find_all("td")
-            rn = cells[0].get_text()
-            commodity = {
-                'id': rn,
-                'name': rn,
-                'sellPrice': int(cells[1].get_text().replace('-', '0').replace(',', '').replace(' Cr', '')),
-                'buyPrice': int(cells[3].get_text().replace('-', '0').replace(',', '').replace(' Cr', '')),
-                'demand': int(cells[2].get_text().replace('-', '0').replace(',', '')),
-                'stock': int(cells[4].get_text().replace('-', '0').replace(',', ''))
-            }
-            marketdata.append(commodity)
-        data = {}
-        data['name'] = system
-        data['currentStarSystem'] = system
-        data['full_name'] = carrier
-        data['sName'] = fcid
-        data['market_updated'] = updated
-        data['commodities'] = marketdata
-        print("✅ Success") if data else print("❌ Failed")
-        return data
-    except Exception as e:
-        print("Exception getting inara data for carrier: %s" % fcid)
-        print(e)
-        traceback.print_exc()
-        return False
+        return datetime.strptime(market_updated.split('(')[1][0:-1], "%d %b %Y, %I:%M%p").replace(tzinfo=timezone.utc)
+    except (AttributeError, IndexError, ValueError):
+        return None
 
 
-def capi_fc_market_data(fcid):
-    # get stocks from capi and format as inara data.
-    capi_response = capi(fcid)
-    if capi_response.status_code != 200:
-        print(f"Error from CAPI for {fcid}: {capi_response.status_code}")
-        return False
-    stn_data = capi_response.json()
+# format a cAPI response as inara data
+def _format_capi_market_data(stn_data, fcid):
     if 'market' not in stn_data:
         print(f"No market data for {fcid}")
         return False
@@ -126,34 +91,236 @@ def capi_fc_market_data(fcid):
     return stn_data
 
 
-def get_fc_stock(fccode, source='inara'):
-    if source == 'inara':
-        print("⏳ Attempting to fetch inara stock data for %s", ( fccode ))
-        stn_data = inara_fc_market_data(fccode)
-        if not stn_data:
-            return False
-    elif source == 'capi':
-        print("⏳ Attempting to fetch capi stock data for %s", ( fccode ))
-        stn_data = capi_fc_market_data(fccode)
-        if not stn_data:
-            return False
-    return stn_data
+# shared HTTP client for async stock fetches, created on first use
+_http_session: aiohttp.ClientSession = None
+
+# limits on requests in flight to each stock source, created on first use so they belong to the bot's event loop
+_source_semaphores = {}
+
+# requests made to each stock source by the async fetches since startup
+http_request_counts = {'capi': 0, 'inara': 0}
+
+
+def get_http_session():
+    """
+    Returns the shared HTTP client session, creating it if needed. Must be called from the event loop.
+
+    :rtype: aiohttp.ClientSession
+    """
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = aiohttp.ClientSession(
+            headers={'User-Agent': 'PTNStockBot'},
+            timeout=aiohttp.ClientTimeout(total=constants.STOCK_HTTP_TIMEOUT_SECONDS)
+        )
+    return _http_session
 
 
-def oauth_new(carrierid, force=False):
+async def close_http_session():
+    """
+    Closes the shared HTTP client session. Called on shutdown.
+    """
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+
+
+# circuit breakers for each stock source, so one that's failing is left alone to recover
+capi_breaker = CircuitBreaker('cAPI')
+inara_breaker = CircuitBreaker('Inara')
+
+# the status capi_async gives when the cAPI circuit is open and no request was made
+CIRCUIT_OPEN_STATUS = 503
+
+
+# whether a response means the endpoint itself is in trouble, rather than anything to do with the carrier asked about
+def _is_endpoint_failure(status):
+    return status == 418 or status == 429 or status >= 500
+
+
+def _source_semaphore(source):
+    if source not in _source_semaphores:
+        limits = {'capi': constants.CAPI_MAX_CONCURRENCY, 'inara': constants.INARA_MAX_CONCURRENCY}
+        _source_semaphores[source] = asyncio.Semaphore(limits[source])
+    return _source_semaphores[source]
+
+
+async def capi_async(carrierid):
+    """
+    Fetches a carrier's data from the stockbot cAPI proxy without blocking the event loop.
+
+    :param str carrierid: The carrier's identifier
+    :returns: The response status and its JSON body, or its text if the body isn't JSON. The status is
+        CIRCUIT_OPEN_STATUS if cAPI has been failing and no request was made.
+    :rtype: tuple
+    """
+    if not capi_breaker.allow():
+        return CIRCUIT_OPEN_STATUS, "cAPI has been failing, not asking again until it's due a retry"
+    try:
+        async with _source_semaphore('capi'):
+            http_request_counts['capi'] += 1
+            async with get_http_session().get(f"{API_HOST}/capi/{carrierid}", params={'token': API_TOKEN}) as response:
+                try:
+                    stn_data = await response.json(content_type=None)
+                except ValueError:
+                    stn_data = await response.text()
+                status = response.status
+    except asyncio.CancelledError:
+        capi_breaker.abandon()
+        raise
+    except Exception as e:
+        capi_breaker.record_failure(e)
+        raise
+
+    if _is_endpoint_failure(status):
+        capi_breaker.record_failure(f"HTTP {status}")
+    else:
+        capi_breaker.record_success()
+    return status, stn_data
+
+
+async def oauth_new_async(carrierid, force=False):
+    """
+    Asks the stockbot cAPI proxy for a new Frontier account link for a carrier, without blocking the event loop.
+
+    :param str carrierid: The carrier's identifier
+    :param bool force: Ask for a new link even if the carrier already has one
+    :returns: The response status and its JSON body
+    :rtype: tuple
+    """
     pmeters = {'token': API_TOKEN}
     if force:
         pmeters['force'] = "true"
-    r = requests.get(f"{API_HOST}/generate/{carrierid}",params=pmeters)
-    return r
+    async with get_http_session().get(f"{API_HOST}/generate/{carrierid}", params=pmeters) as response:
+        return response.status, await response.json(content_type=None)
 
 
-def capi(carrierid, dev=False):
-    pmeters = {'token': API_TOKEN}
-    if dev:
-        pmeters['dev'] = "true"
-    r = requests.get(f"{API_HOST}/capi/{carrierid}",params=pmeters)
-    return r
+async def inara_fc_market_data_async(fcid):
+    """
+    Fetches a carrier's market from Inara without blocking the event loop.
+
+    :param str fcid: The carrier's identifier
+    :returns: The market data, or False if it couldn't be fetched
+    :rtype: dict
+    """
+    print("Searching inara market data for station: %s " % ( fcid ))
+    if not inara_breaker.allow():
+        print(f"Inara has been failing, not searching for {fcid} until it's due a retry")
+        return False
+    try:
+        url = "%s/elite/station-market/?search=%s" % (constants.INARA_URL, fcid)
+        try:
+            async with _source_semaphore('inara'):
+                http_request_counts['inara'] += 1
+                async with get_http_session().get(url) as response:
+                    content = await response.read()
+                    status = response.status
+        except asyncio.CancelledError:
+            inara_breaker.abandon()
+            raise
+        except Exception as e:
+            inara_breaker.record_failure(e)
+            raise
+
+        if _is_endpoint_failure(status):
+            inara_breaker.record_failure(f"HTTP {status}")
+            print(f"Error from Inara for {fcid}: {status}")
+            return False
+        inara_breaker.record_success()
+
+        # parsing the page is slow enough to hold up the bot, so do it in a thread
+        return await asyncio.to_thread(_parse_inara_market_page, content, fcid)
+    except Exception as e:
+        print("Exception getting inara data for carrier: %s" % fcid)
+        print(e)
+        return False
+
+
+# market data shared by /stock, the WMM stock cycle and the cAPI commands
+market_cache = MarketCache()
+
+
+async def capi_cached(carrierid):
+    """
+    capi_async, served from the market cache when we have a successful response younger than CAPI_CACHE_TTL_SECONDS.
+
+    :param str carrierid: The carrier's identifier
+    :returns: The response status, its body, and its age in seconds if it came from the cache or None
+    :rtype: tuple
+    """
+    (status, stn_data), age = await market_cache.get(
+        carrierid, 'capi', lambda: capi_async(carrierid), constants.CAPI_CACHE_TTL_SECONDS,
+        cacheable=lambda response: response[0] == 200
+    )
+    return status, stn_data, age
+
+
+async def inara_fc_market_data_cached(fcid):
+    """
+    inara_fc_market_data_async, served from the market cache when we have data younger than INARA_CACHE_TTL_SECONDS.
+
+    :param str fcid: The carrier's identifier
+    :returns: The market data or False, and its age in seconds if it came from the cache or None
+    :rtype: tuple
+    """
+    return await market_cache.get(
+        fcid, 'inara', lambda: inara_fc_market_data_async(fcid), constants.INARA_CACHE_TTL_SECONDS
+    )
+
+
+async def get_fc_stock_async(fccode, source='inara'):
+    """
+    Fetches a carrier's market from cAPI or Inara, served from the market cache when possible.
+
+    :param str fccode: The carrier's identifier
+    :param str source: 'capi' or 'inara'
+    :returns: The market data or False, and its age in seconds if it came from the cache or None
+    :rtype: tuple
+    """
+    if source == 'capi':
+        print("⏳ Attempting to fetch capi stock data for %s" % ( fccode ))
+        status, stn_data, age = await capi_cached(fccode)
+        if status != 200:
+            print(f"Error from CAPI for {fccode}: {status}")
+            return False, age
+        return _format_capi_market_data(stn_data, fccode), age
+    print("⏳ Attempting to fetch inara stock data for %s" % ( fccode ))
+    return await inara_fc_market_data_cached(fccode)
+
+
+# fetch everything the WMM stock cycle needs for one carrier
+async def _fetch_wmm_carrier_stock(carrier_data: WMMData, result):
+    if carrier_data.capi:
+        result['capi_status'], result['capi_data'], _ = await capi_cached(carrier_data.carrier_identifier)
+        # on auth failure, or while cAPI is in trouble, the cycle falls back to Inara, so fetch that now too
+        if result['capi_status'] == 200:
+            return
+    result['inara_data'], _ = await inara_fc_market_data_cached(carrier_data.carrier_identifier)
+
+
+async def fetch_wmm_carrier_stocks(carriers):
+    """
+    Fetches the market for every WMM carrier concurrently, limited by WMM_FETCH_CONCURRENCY and each source's own limit.
+
+    :param list[WMMData] carriers: The carriers to fetch
+    :returns: For each carrier identifier, a dict of capi_status, capi_data, inara_data and error, which is set if the
+        carrier's fetches failed or took longer than WMM_CARRIER_TIMEOUT_SECONDS
+    :rtype: dict
+    """
+    limit = asyncio.Semaphore(constants.WMM_FETCH_CONCURRENCY)
+
+    async def fetch(carrier_data: WMMData):
+        result = {'capi_status': None, 'capi_data': None, 'inara_data': None, 'error': None}
+        async with limit:
+            try:
+                await asyncio.wait_for(_fetch_wmm_carrier_stock(carrier_data, result), constants.WMM_CARRIER_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                result['error'] = f"timed out after {constants.WMM_CARRIER_TIMEOUT_SECONDS:g} seconds"
+            except Exception as e:
+                result['error'] = e
+        return result
+
+    results = await asyncio.gather(*[fetch(carrier_data) for carrier_data in carriers])
+    return {carrier_data.carrier_identifier: result for carrier_data, result in zip(carriers, results)}
 
 
 # function taken from FCMS
@@ -177,16 +344,45 @@ def chunk(chunk_list, max_size=10):
         yield chunk_list[i:i + max_size]
 
 
+# WMM owners we've looked up, so repeat notifications don't each cost a REST call
+_wmm_owners = {}
+
+
+async def get_wmm_owner(owner_id):
+    """
+    Looks up a WMM carrier owner, from the bot's own user cache or ours before asking Discord.
+
+    :param int owner_id: The owner's user ID
+    :rtype: discord.User
+    """
+    owner_id = int(owner_id)
+    owner = bot.get_user(owner_id) or _wmm_owners.get(owner_id)
+    if owner is None:
+        owner = await bot.fetch_user(owner_id)
+        _wmm_owners[owner_id] = owner
+    return owner
+
+
 # notify WMM owner
 async def notify_wmm_owner(carrier_data: WMMData, embed, message):
-    # notify the owner
-    owner = await bot.fetch_user(carrier_data.carrier_owner)
+    await send_wmm_owner_dm(carrier_data.carrier_owner, [embed], [message])
+
+
+async def send_wmm_owner_dm(owner_id, embeds, messages):
+    """
+    DMs a WMM carrier owner, or pings them in the CCO WMM channel if they don't accept DMs.
+
+    :param int owner_id: The owner's user ID
+    :param list[discord.Embed] embeds: Sent together as one DM, at most 10
+    :param list[str] messages: Sent to the channel instead, one message each
+    """
+    owner = await get_wmm_owner(owner_id)
     try:
-        await owner.send(embed=embed)
+        await owner.send(embeds=embeds)
         print(f"Low stock DM sent to {owner}")
     except Forbidden:
         print(f"Unable to DM {owner}, error 403. Pinging in channel instead.")
         # ping the owner in-channel
         cco_channel = bot.get_channel(channel_cco_wmm_talk())
-        await cco_channel.send(message)
-
+        for message in messages:
+            await cco_channel.send(message)
@@ -0,0 +1,184 @@
+"""
+A module for aggregating WMM carrier markets into per-carrier stock, per-station totals, shortfalls and low stock flags.
+
+Each cycle's markets are loaded into flat arrays indexed by carrier and commodity, so the totals and flags are worked out
+in one pass over the arrays instead of by building and walking nested dicts of commodity names.
+
+Depends on: constants
+
+"""
+
+# import libraries
+from array import array
+
+# import local constants
+import ptn.missionalertbot.constants as constants
+
+
+# lowercase the names in a threshold mapping, so lookups don't depend on how they were configured
+def _normalise_thresholds(thresholds):
+    return {name.lower(): int(threshold) for name, threshold in thresholds.items()}
+
+
+def low_stock_threshold(commodity, location):
+    """
+    Looks up the low stock threshold for a WMM commodity at a WMM station. A threshold set for the station in
+    WMM_LOCATION_THRESHOLDS wins over one set for the commodity in WMM_COMMODITY_THRESHOLDS, which wins over
+    WMM_LOW_STOCK_THRESHOLD.
+
+    :param str commodity: The commodity's name, in any case
+    :param str location: The WMM station, in any case
+    :returns: Stock below this is low
+    :rtype: int
+    """
+    location_thresholds = {name.lower(): _normalise_thresholds(thresholds)
+                           for name, thresholds in constants.WMM_LOCATION_THRESHOLDS.items()}
+    commodity_thresholds = _normalise_thresholds(constants.WMM_COMMODITY_THRESHOLDS)
+
+    commodity = commodity.lower()
+    return location_thresholds.get(location.lower(), {}).get(commodity,
+           commodity_thresholds.get(commodity, constants.WMM_LOW_STOCK_THRESHOLD))
+
+
+class WMMStockAggregate:
+
+    def __init__(self, commodities=None):
+        """
+        Class holds one WMM stock cycle's markets as flat arrays, with one row per carrier and one column per WMM
+        commodity. Add each carrier's market with add_market(), then call compute() before reading the results.
+
+        :param list[str] commodities: The commodities to track, defaults to commodities_wmm
+        """
+        self.commodities = [commodity.title() for commodity in (commodities or constants.commodities_wmm)]
+        self._columns = {commodity.lower(): column for column, commodity in enumerate(self.commodities)}
+
+        # per carrier row
+        self.carriers = []  # dicts of carrier, system, location, carrier_name, market_updated and empty
+        self.stock = array('q')  # row * len(commodities) + column
+        self.price = array('q')
+        self.market_names = []  # the commodity name as the market gave it, or None if it's not stocked
+        self.threshold = array('q')
+        self.low = array('b')
+
+        # per station, a carrier location in a system
+        self.stations = []  # (system, location) in the order first seen
+        self._station_rows = {}  # (system, location): station index
+        self.station_of_row = array('l')  # station index of each carrier row, -1 if its market was empty
+        self.station_stock = array('q')  # station * len(commodities) + column
+        self.station_threshold = array('q')
+        self.station_shortfall = array('q')
+
+    def add_market(self, carrier, system, carrier_name, market_updated, commodities):
+        """
+        Loads a carrier's market into the next row. Commodities that aren't tracked are ignored.
+
+        :param WMMData carrier: The carrier
+        :param str system: The system the market says the carrier is in
+        :param str carrier_name: The carrier's name as displayed
+        :param str market_updated: When the market was updated, as displayed
+        :param list[dict] commodities: The market's commodities, with at least name, stock and buyPrice
+        :returns: The carrier's row
+        :rtype: int
+        """
+        columns = len(self.commodities)
+        row = len(self.carriers)
+        self.carriers.append({
+            'carrier': carrier,
+            'system': system,
+            'location': carrier.carrier_location,
+            'carrier_name': carrier_name,
+            'market_updated': market_updated,
+            'empty': not commodities,
+        })
+        self.stock.extend(array('q', bytes(8 * columns)))
+        self.price.extend(array('q', bytes(8 * columns)))
+        self.market_names.extend([None] * columns)
+
+        if commodities:
+            key = (system, carrier.carrier_location)
+            if key not in self._station_rows:
+                self._station_rows[key] = len(self.stations)
+                self.stations.append(key)
+            self.station_of_row.append(self._station_rows[key])
+        else:
+            # an empty market has nothing to add to its station
+            self.station_of_row.append(-1)
+
+        offset = row * columns
+        for commodity in commodities or []:
+            column = self._columns.get(commodity['name'].lower())
+            if column is None or not int(commodity['stock']):
+                continue
+            self.stock[offset + column] += int(commodity['stock'])
+            self.price[offset + column] = int(commodity['buyPrice'])
+            self.market_names[offset + column] = commodity['name']
+
+        return row
+
+    def compute(self):
+        """
+        Works out every carrier's low stock flags and every station's totals and shortfalls in one pass over the rows.
+        """
+        columns = len(self.commodities)
+        thresholds = {}  # location: threshold of each column
+        for carrier in self.carriers:
+            if carrier['location'] not in thresholds:
+                thresholds[carrier['location']] = array('q', [low_stock_threshold(commodity, carrier['location'])
+                                                              for commodity in self.commodities])
+
+        self.threshold = array('q')
+        for carrier in self.carriers:
+            self.threshold.extend(thresholds[carrier['location']])
+        self.low = array('b', [0 < stock < threshold for stock, threshold in zip(self.stock, self.threshold)])
+
+        self.station_stock = array('q', bytes(8 * columns * len(self.stations)))
+        for row, station in enumerate(self.station_of_row):
+            if station < 0:
+                continue
+            for column in range(columns):
+                self.station_stock[station * columns + column] += self.stock[row * columns + column]
+
+        self.station_threshold = array('q')
+        for _, location in self.stations:
+            self.station_threshold.extend(thresholds[location])
+        self.station_shortfall = array('q', [max(0, threshold - stock)
+                                             for stock, threshold in zip(self.station_stock, self.station_threshold)])
+
+    def carrier_stock(self, row):
+        """
+        :param int row: The carrier's row
+        :returns: The carrier's stock of each commodity it holds, keyed by lowercase name
+        :rtype: dict
+        """
+        columns = len(self.commodities)
+        return {commodity.lower(): self.stock[row * columns + column]
+                for column, commodity in enumerate(self.commodities) if self.stock[row * columns + column]}
+
+    def carrier_thresholds(self, row):
+        """
+        :param int row: The carrier's row
+        :returns: The low stock threshold of each commodity at the carrier's location, keyed by lowercase name
+        :rtype: dict
+        """
+        columns = len(self.commodities)
+        return {commodity.lower(): self.threshold[row * columns + column] for column, commodity in enumerate(self.commodities)}
+
+    def carrier_lines(self, row):
+        """
+        :param int row: The carrier's row
+        :returns: (market name, stock, price, low) for each commodity the carrier holds, in commodity order
+        :rtype: list[tuple]
+        """
+        columns = len(self.commodities)
+        return [(self.market_names[index], self.stock[index], self.price[index], bool(self.low[index]))
+                for index in range(row * columns, (row + 1) * columns) if self.stock[index]]
+
+    def station_lines(self, station):
+        """
+        :param int station: The station's index in stations
+        :returns: (commodity, total stock, shortfall) for each commodity, in commodity order
+        :rtype: list[tuple]
+        """
+        columns = len(self.commodities)
+        return [(commodity, self.station_stock[station * columns + column], self.station_shortfall[station * columns + column])
+                for column, commodity in enumerate(self.commodities)]
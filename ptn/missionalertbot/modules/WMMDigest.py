@@ -0,0 +1,76 @@
+"""
+A module for collecting a WMM stock cycle's low stock notifications and sending each owner a single digest of them.
+
+Depends on: constants, StockHelpers
+
+"""
+
+# import discord.py
+import discord
+
+# import local constants
+import ptn.missionalertbot.constants as constants
+from ptn.missionalertbot.constants import bot
+
+# import local modules
+from ptn.missionalertbot.modules.StockHelpers import chunk, send_wmm_owner_dm
+
+
+# embed descriptions are capped at 4096 characters and messages at 2000, so long digests are split over several
+DIGEST_LINES_PER_EMBED = 20
+DIGEST_LINES_PER_MESSAGE = 10
+
+# a DM can carry at most 10 embeds
+DIGEST_MAX_EMBEDS = 10
+
+
+class WMMNotificationDigest:
+
+    def __init__(self):
+        """
+        Class collects low stock notifications during a WMM stock cycle, grouped by owner, so each owner gets one DM
+        however many of their carriers are low on however many commodities.
+        """
+        self._lines = {}  # owner ID: notification lines, in the order they were added
+
+    def add_low_stock(self, carrier, commodity, stock, depletion_rate=None):
+        """
+        Adds a low stock notification for the carrier's owner.
+
+        :param WMMData carrier: The carrier running low
+        :param str commodity: The commodity's name
+        :param int stock: How much is left
+        :param float depletion_rate: Units per hour it's been selling at, if known
+        """
+        depletion_string = f" At the current rate it will run out in about {int(stock / depletion_rate) or 1} hour(s)." \
+            if depletion_rate else ""
+        line = f"{carrier.carrier_name} ({carrier.carrier_identifier}) is low on {commodity} - {stock} remaining.{depletion_string}"
+        self._lines.setdefault(carrier.carrier_owner, []).append(line)
+
+    def __len__(self):
+        return sum(len(lines) for lines in self._lines.values())
+
+    async def send(self):
+        """
+        Sends each owner their digest and empties it. An owner we can't reach doesn't stop the others being notified.
+        """
+        print(f"Sending {len(self)} low stock notification(s) to {len(self._lines)} owner(s)")
+        for owner_id, lines in self._lines.items():
+            embeds = []
+            for page in chunk([f"📉 {line}" for line in lines], DIGEST_LINES_PER_EMBED):
+                embeds.append(discord.Embed(
+                    description="\n".join(page),
+                    color=constants.EMBED_COLOUR_WARNING
+                ))
+            embeds[0].title = "Your fleet carriers are running low" if len(lines) > 1 else "Your fleet carrier is running low"
+
+            messages = []
+            for page in chunk(lines, DIGEST_LINES_PER_MESSAGE):
+                messages.append(f"<@{owner_id}>: Your fleet carrier stock is running low:\n" + "\n".join(f"• {line}" for line in page))
+            messages[-1] += f"\n\n*Please enable direct messages from <@{bot.user.id}> to receive these alerts via DM.*"
+
+            try:
+                await send_wmm_owner_dm(owner_id, embeds[:DIGEST_MAX_EMBEDS], messages)
+            except Exception as e:
+                print(f"Unable to notify {owner_id} of low stock: {e}")
+        self._lines = {}
@@ -0,0 +1,125 @@
+"""
+A module for laying out a WMM stock cycle's results as the pages of the WMM stock and CCO supplies channels.
+
+These only format text, so they can be timed or checked without Discord.
+
+Depends on: StockHelpers, WMMAggregator
+
+"""
+
+# import local modules
+from ptn.missionalertbot.modules.StockHelpers import chunk
+from ptn.missionalertbot.modules.WMMAggregator import WMMStockAggregate
+
+
+def wmm_stock_pages(wmm_aggregate: WMMStockAggregate, wmm_systems, wmm_updated):
+    """
+    Lays out every carrier's stock, grouped by location, as the WMM stock channel's messages.
+
+    :param WMMStockAggregate wmm_aggregate: The cycle's computed stock
+    :param list[str] wmm_systems: Every location with a tracked carrier, in display order
+    :param str wmm_updated: When the stock was checked, as displayed
+    :returns: The content of each message
+    :rtype: list[str]
+    """
+    # each carrier's stock, grouped by location
+    wmm_stock = {}
+    for row, entry in enumerate(wmm_aggregate.carriers):
+        lines = wmm_stock.setdefault(entry['location'], [])
+        system, location, carrier_name, market_updated = entry['system'], entry['location'], entry['carrier_name'], entry['market_updated']
+
+        # check for if market is empty
+        if entry['empty']:
+            # TODO: how should this look?
+            lines.append("**%s** - %s (%s) has no current market data. please visit the carrier with EDMC running" % (
+                entry['carrier'].carrier_name, system, location )
+            )
+            continue
+
+        carrier_lines = wmm_aggregate.carrier_lines(row)
+        for name, stock, price, low in carrier_lines:
+            # if commodity stock is low
+            if low:
+                lines.append("%s x %s - %s (%s) - **%s** - Price: %s - LOW STOCK %s" % (
+                    name, format(stock, ','), system, location, carrier_name, format(price, ','), market_updated )
+                )
+            # has stock, not low
+            else:
+                lines.append("%s x %s - %s (%s) - **%s** - Price: %s %s" % (
+                    name, format(stock, ','), system.upper(), location, carrier_name, format(price, ','), market_updated )
+                )
+
+        # no stock at all
+        if not carrier_lines:
+            lines.append("**%s** - %s (%s) has no stock of any WMM commodity! %s" % (
+                carrier_name, system.upper(), location, market_updated )
+            )
+
+    content = {}
+    for system in wmm_systems:
+        content[system] = []
+        content[system].append('-')
+        if system not in wmm_stock:
+            content[system].append("Could not find any carriers with stock in %s" % system)
+        else:
+            for line in wmm_stock[system]:
+                content[system].append(line)
+
+    # for each station, use a new message.
+    # and split messages over 10 lines.
+    # each line is between 120-200 chars
+    # using max: 2000 / 200 = 10
+    wmm_pages = []
+    for (system, stncontent) in content.items():
+        if len(stncontent) == 1:
+            # this station has no carriers, dont bother printing it.
+            continue
+        pages = [page for page in chunk(stncontent, 10)]
+        for page in pages:
+            page.insert(0, ':')
+            wmm_pages.append('\n'.join(page))
+
+    footer = []
+    footer.append(':')
+    footer.append("-\nCarrier stocks last checked %s" % ( wmm_updated ))
+    footer.append("Carriers with no timestamp are fetched from cAPI and are accurate to within an hour.")
+    footer.append("Carriers with (As of ...) are fetched from Inara. Ensure EDMC is running to update stock levels!")
+    wmm_pages.append('\n'.join(footer))
+
+    return wmm_pages
+
+
+def cco_supplies_pages(wmm_aggregate: WMMStockAggregate):
+    """
+    Lays out each station's total stock and shortfalls as the CCO supplies channel's messages.
+
+    :param WMMStockAggregate wmm_aggregate: The cycle's computed stock
+    :returns: The content of each message
+    :rtype: list[str]
+    """
+    ccocontent = {}
+    for station, (system, location) in enumerate(wmm_aggregate.stations):
+        ccocontent.setdefault(system, []).append('-')
+        for commodity, stock, shortfall in wmm_aggregate.station_lines(station):
+            if not stock:
+                ccocontent[system].append(f"{commodity} x NO STOCK !! - {system} ({location})")
+            elif shortfall:
+                ccocontent[system].append(f"{commodity} x {format(stock, ',')} - {system} ({location}) - LOW, {format(shortfall, ',')} short")
+            else:
+                ccocontent[system].append(f"{commodity} x {format(stock, ',')} - {system} ({location})")
+
+    # for each station, use a new message.
+    # and split messages over 10 lines.
+    # each line is roughly 50 chars
+    # using max: 2000 / 50 = 40
+    cco_pages = []
+    for (system, stncontent) in ccocontent.items():
+        if len(stncontent) == 1:
+            # this station has no carriers, dont bother printing it.
+            continue
+        pages = [page for page in chunk(stncontent, 40)]
+        for page in pages:
+            page.insert(0, ':')
+            cco_pages.append('\n'.join(page))
+
+    return cco_pages
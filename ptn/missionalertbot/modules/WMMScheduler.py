@@ -0,0 +1,116 @@
+"""
+A module for scheduling WMM stock refreshes per carrier, so each carrier is only fetched when its stock is likely to have
+changed.
+
+Depends on: constants
+
+"""
+
+# import libraries
+import heapq
+import time
+
+# import local constants
+import ptn.missionalertbot.constants as constants
+
+
+def next_refresh_interval(source, market_age, stock_levels, depletion_rates, thresholds=None):
+    """
+    Works out how long to wait before refreshing a carrier again. Carriers closing in on the low stock threshold are
+    checked sooner, never more often than WMM_MIN_REFRESH_SECONDS and never less often than the WMM interval.
+
+    :param str source: Where the carrier's market came from, 'capi' or 'inara'
+    :param float market_age: Seconds since the market was last updated at its source, or None if unknown
+    :param dict stock_levels: The carrier's stock of each WMM commodity it holds, keyed by lowercase name
+    :param dict depletion_rates: Units per hour sold of each commodity, keyed by lowercase name
+    :param dict thresholds: The low stock threshold of each commodity at the carrier's location, keyed by lowercase
+        name; defaults to WMM_LOW_STOCK_THRESHOLD
+    :returns: Seconds until the carrier should next be refreshed
+    :rtype: float
+    """
+    longest = constants.wmm_interval
+    shortest = min(constants.WMM_MIN_REFRESH_SECONDS, longest)
+    interval = longest
+
+    thresholds = thresholds or {}
+    for commodity, stock in stock_levels.items():
+        threshold = thresholds.get(commodity, constants.WMM_LOW_STOCK_THRESHOLD)
+        headroom = stock - threshold
+        depletion_rate = depletion_rates.get(commodity)
+        if headroom > 0 and depletion_rate:
+            # check again by the time it could be halfway to the threshold
+            interval = min(interval, headroom / depletion_rate * 3600 / 2)
+        elif headroom < threshold:
+            # low or nearly low and we can't tell how fast it's going, so keep a closer eye on it
+            interval = min(interval, longest / 2)
+
+    if source == 'capi':
+        # the stockbot refreshes cAPI markets on its own schedule, asking sooner just returns the same data
+        interval = max(interval, constants.WMM_CAPI_REFRESH_SECONDS)
+    elif market_age is not None and market_age > constants.WMM_STALE_MARKET_SECONDS:
+        # nobody has updated this market on Inara for a while, so it's unlikely to change soon
+        interval = longest
+
+    return max(shortest, min(interval, longest))
+
+
+class WMMScheduler:
+
+    def __init__(self):
+        """
+        Class holds when each WMM carrier is next due a refresh, in a priority queue ordered by due time.
+        """
+        self._queue = []  # (due time, carrier identifier)
+        self._due_at = {}  # carrier identifier: due time; queue entries that don't match are stale
+
+    def schedule(self, cid, due_at):
+        """
+        Sets when a carrier is next due a refresh, replacing any earlier schedule.
+
+        :param str cid: The carrier's identifier
+        :param float due_at: POSIX time the carrier is due
+        """
+        self._due_at[cid] = due_at
+        heapq.heappush(self._queue, (due_at, cid))
+
+    def pop_due(self, cids, now=None):
+        """
+        Returns the carriers due a refresh and unschedules them; they should be scheduled again once refreshed.
+        Carriers never scheduled are always due, and carriers no longer tracked are forgotten.
+
+        :param list[str] cids: The identifiers of every carrier being tracked
+        :param float now: POSIX time to compare against, defaults to now
+        :returns: The identifiers of the due carriers
+        :rtype: set
+        """
+        now = now or time.time()
+        tracked = set(cids)
+        for cid in [cid for cid in self._due_at if cid not in tracked]:
+            del self._due_at[cid]
+
+        due = {cid for cid in tracked if cid not in self._due_at}
+        while self._queue and self._queue[0][0] <= now:
+            due_at, cid = heapq.heappop(self._queue)
+            if self._due_at.get(cid) == due_at:
+                del self._due_at[cid]
+                due.add(cid)
+        return due
+
+    def force_all(self):
+        """
+        Makes every carrier due now, e.g. for /cco wmm update.
+        """
+        self._queue = []
+        self._due_at = {}
+
+    def next_due(self):
+        """
+        :returns: POSIX time the next carrier is due, or None if none are scheduled
+        :rtype: float
+        """
+        while self._queue and self._due_at.get(self._queue[0][1]) != self._queue[0][0]:
+            heapq.heappop(self._queue)
+        return self._queue[0][0] if self._queue else None
+
+    def __len__(self):
+        return len(self._due_at)
@@ -31,8 +31,8 @@ from ptn.missionalertbot.constants import bot, cc_role, get_overwrite_perms, get
     reddit_flair_mission_start, reddit_flair_mission_stop
 
 # import local modules
-from ptn.missionalertbot.database.database import find_community_carrier, CCDbFields, carrier_db, carrier_db_lock, carriers_conn, delete_community_carrier_from_db, \
-    find_carrier, CarrierDbFields
+from ptn.missionalertbot.database.database import find_community_carrier, CCDbFields, carrier_db, add_community_carrier_to_database, delete_community_carrier_from_db, \
+    find_carrier_exact_async, search_carriers_async, CarrierDbFields
 from ptn.missionalertbot.modules.ErrorHandler import CommandChannelError, CommandRoleError, CustomError, on_generic_error
 
 
@@ -309,20 +309,11 @@ async def _cc_assign_permissions(interaction, owner, new_channel):
 
 async def _cc_db_enter(interaction, owner, new_channel, new_role):
     # now we enter everything into the community carriers table
-    print("Locking carrier db...")
-    await carrier_db_lock.acquire()
-    print("Carrier DB locked.")
     try:
-        carrier_db.execute(''' INSERT INTO community_carriers VALUES(?, ?, ?) ''',
-                           (owner.id, new_channel.id, new_role.id))
-        carriers_conn.commit()
+        await add_community_carrier_to_database(owner.id, new_channel.id, new_role.id)
         print("Added new community carrier to database")
     except:
         raise EnvironmentError("Error: failed to update community channels database.")
-    finally:
-        print("Unlocking carrier db...")
-        carrier_db_lock.release()
-        print("Carrier DB unlocked.")
 
     # tell the user what's going on
     embed = discord.Embed(description=f"<@{owner.id}> is now a <@&{cc_role()}> and owns <#{new_channel.id}> with notification role <@&{new_role.id}>."
@@ -744,36 +735,39 @@ def extract_carrier_ident_strings(message: discord.Message):
     return extracted_strings
 
 
-# find a carrier by successively searching ID, long name, and short name
-def flexible_carrier_search_term(search_term):
+# find a carrier by ID, database entry ID, or name
+async def flexible_carrier_search_term(search_term):
+    """
+    Finds the single best carrier match for a user-supplied search term: exact matches via the NOCASE indexes first,
+    then the top-ranked fragment match from the carrier search index.
+
+    :param str search_term: A carrier ID, database entry ID, or full/partial name
+    :returns: A single CarrierData object, or None if nothing matched
+    """
     # check if the carrier can be found, exit gracefully if not
-    int_search_term = None
     carrier_data = None
+    search_term = search_term.strip()
 
-    if re.match(r"\w{3}-\w{3}", search_term):
+    if re.fullmatch(r"\w{3}-\w{3}", search_term):
         print("⏳ Carrier Registration format matched, searching by cid...")
-        carrier_data = find_carrier(search_term, CarrierDbFields.cid.name)
+        carrier_data = await find_carrier_exact_async(search_term, CarrierDbFields.cid.value)
 
-    else:
-        try:
-            # check if its an int that can represent a database entry ID
-            int_search_term = int(search_term)
-        except ValueError:
-            print("❕ Searchterm is not a db ID")
-            pass
+    elif search_term.isdigit():
+        # an int can represent a database entry ID
+        print("⏳ Searching for carrier by database entry ID")
+        carrier_data = await find_carrier_exact_async(int(search_term), CarrierDbFields.p_id.value)
 
-        if int_search_term:
-            print("⏳ Searching for carrier by database entry ID")
-            carrier_data = find_carrier(search_term, CarrierDbFields.p_id.name)
+    if not carrier_data:
+        print("⏳ Searching for carrier by exact name or channel")
+        carrier_data = await find_carrier_exact_async(search_term, (CarrierDbFields.longname.value, CarrierDbFields.shortname.value,
+                                                                    CarrierDbFields.channelname.value))
 
-        else:
-            print("⏳ Searching for carrier by full name fragment")
-            carrier_data = find_carrier(search_term, CarrierDbFields.longname.name)
-            if not carrier_data:
-                print("⏳ Not found. Searching again by shortname...")
-                carrier_data = find_carrier(search_term, CarrierDbFields.shortname.name)
+    if not carrier_data:
+        print("⏳ Not found. Searching by name fragment...")
+        results = await search_carriers_async(search_term, limit=1)
+        carrier_data = results[0] if results else None
 
-    return carrier_data
+    return carrier_data if carrier_data else None
 
 # clear WMM channel
 async def clear_history(channel, limit=20):
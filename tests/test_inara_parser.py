@@ -0,0 +1,172 @@
+"""
+Tests for InaraParser against saved Inara station market pages.
+
+Each page in fixtures/inara is saved alongside the market data the BeautifulSoup parser InaraParser replaced gave for
+it, or null where that parser found no market. When bs4 is installed the old parser is also run on the pages directly,
+and its speed compared with InaraParser's when pytest-benchmark is installed.
+
+Run from the repository root with: python -m pytest tests
+
+"""
+
+# import libraries
+import importlib.util
+import json
+from pathlib import Path
+
+import pytest
+
+# import local modules
+from ptn.missionalertbot.modules.InaraParser import parse_station_market_page
+
+
+FIXTURES = Path(__file__).parent / 'fixtures' / 'inara'
+
+PAGES = sorted(path.stem for path in FIXTURES.glob('*.html'))
+
+FCIDS = {
+    'market': 'K8Y-T2G',
+    'market_update_text': 'QHV-50N',
+    'no_market': 'X7Z-91B',
+    'no_results': 'ABC-123',
+}
+
+HAS_BS4 = importlib.util.find_spec('bs4') is not None
+HAS_BENCHMARK = importlib.util.find_spec('pytest_benchmark') is not None
+
+
+def load_page(name):
+    return (FIXTURES / f'{name}.html').read_bytes()
+
+
+def load_expected(name):
+    return json.loads((FIXTURES / f'{name}.json').read_text(encoding='utf-8'))
+
+
+# the market data InaraParser gives for a page, as inara_fc_market_data_async returns it, or None for no market
+def inara_parser_market_data(content, fcid):
+    try:
+        station_market = parse_station_market_page(content, fcid)
+    except ValueError:
+        return None
+    if station_market.commodities is None:
+        return None
+    return station_market.to_market_data()
+
+
+# the page parsing from the old inara_fc_market_data, which used BeautifulSoup, or None where it failed
+def bs4_market_data(content, fcid):
+    from bs4 import BeautifulSoup
+
+    try:
+        soup = BeautifulSoup(content, "html.parser")
+        mainblock = soup.find_all('div', class_='mainblock')
+
+        # Find carrier and system info
+        header = soup.find_all("div", class_="headercontent")
+        header_info = header[0].find("h2")
+        carrier_system_info = header_info.find_all('a', href=True)
+        carrier = carrier_system_info[0].text
+        system = carrier_system_info[1].text
+
+        # Find market info
+        updated = soup.find("div", string="Market update").next_sibling.get_text()
+        table = mainblock[1].find('table')
+        tbody = table.find("tbody")
+        rows = tbody.find_all('tr')
+        marketdata = []
+        for row in rows:
+            rowclass = row.attrs.get("class") or []
+            if "subheader" in rowclass:
+                continue
+            cells = row.find_all("td")
+            rn = cells[0].get_text()
+            commodity = {
+                'id': rn,
+                'name': rn,
+                'sellPrice': int(cells[1].get_text().replace('-', '0').replace(',', '').replace(' Cr', '')),
+                'buyPrice': int(cells[3].get_text().replace('-', '0').replace(',', '').replace(' Cr', '')),
+                'demand': int(cells[2].get_text().replace('-', '0').replace(',', '')),
+                'stock': int(cells[4].get_text().replace('-', '0').replace(',', ''))
+            }
+            marketdata.append(commodity)
+        data = {}
+        data['name'] = system
+        data['currentStarSystem'] = system
+        data['full_name'] = carrier
+        data['sName'] = fcid
+        data['market_updated'] = updated
+        data['commodities'] = marketdata
+        return data
+    except Exception:
+        return None
+
+
+def test_every_page_has_expected_data():
+    assert PAGES == sorted(FCIDS)
+    for name in PAGES:
+        assert (FIXTURES / f'{name}.json').is_file()
+
+
+@pytest.mark.parametrize('name', PAGES)
+def test_matches_saved_bs4_output(name):
+    assert inara_parser_market_data(load_page(name), FCIDS[name]) == load_expected(name)
+
+
+@pytest.mark.skipif(not HAS_BS4, reason="bs4 is not installed")
+@pytest.mark.parametrize('name', PAGES)
+def test_matches_bs4(name):
+    content = load_page(name)
+    assert inara_parser_market_data(content, FCIDS[name]) == bs4_market_data(content, FCIDS[name])
+
+
+def test_header():
+    station_market = parse_station_market_page(load_page('market'), 'K8Y-T2G')
+    # the first header on the page, with character references decoded
+    assert station_market.carrier_name == "P.T.N. NOBODY'S HOME (K8Y-T2G)"
+    assert station_market.system == 'HIP 58832'
+    assert station_market.station_id == '2091583'
+    assert station_market.to_system_info() == {
+        'system': 'HIP 58832', 'stationid': '2091583', 'full_name': "P.T.N. NOBODY'S HOME (K8Y-T2G)"
+    }
+
+
+@pytest.mark.parametrize('name, market_updated', [
+    ('market', '2 hours ago (17 Oct 2026, 1:04pm)'),  # in the element after the label
+    ('market_update_text', '5 days ago (12 Oct 2026, 10:41am)'),  # as text after the label
+])
+def test_market_update(name, market_updated):
+    assert parse_station_market_page(load_page(name), FCIDS[name]).market_updated == market_updated
+
+
+def test_subheader_rows_skipped():
+    commodities = parse_station_market_page(load_page('market'), 'K8Y-T2G').commodities
+    names = [commodity['name'] for commodity in commodities]
+    assert 'Chemicals' not in names and 'Metals' not in names
+    assert len(commodities) == 12
+    # only the first table in the second mainblock is the market
+    assert 'Rare commodity' not in names
+
+
+def test_missing_table():
+    station_market = parse_station_market_page(load_page('no_market'), 'X7Z-91B')
+    assert station_market.carrier_name == 'P.T.N. EMPTY HOLD (X7Z-91B)'
+    assert station_market.commodities is None
+
+
+def test_no_results():
+    with pytest.raises(ValueError):
+        parse_station_market_page(load_page('no_results'), 'ABC-123')
+
+
+@pytest.mark.skipif(not HAS_BENCHMARK, reason="pytest-benchmark is not installed")
+@pytest.mark.parametrize('parser', [
+    'inara_parser',
+    pytest.param('bs4', marks=pytest.mark.skipif(not HAS_BS4, reason="bs4 is not installed")),
+])
+def test_benchmark_market_page(benchmark, parser):
+    content = load_page('market')
+    parse = inara_parser_market_data if parser == 'inara_parser' else bs4_market_data
+    benchmark.group = 'inara market page'
+    data = benchmark(parse, content, 'K8Y-T2G')
+    assert data == load_expected('market')
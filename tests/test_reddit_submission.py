@@ -0,0 +1,165 @@
+"""
+Tests for find_own_submission against a stub Reddit, comparing it with the subreddit.new() polling it replaced.
+
+The stub lists a new post in our own submissions straight away and in the subreddit's new listing only after a delay,
+as Reddit does, and counts the listing requests made. Time is simulated: each request takes REQUEST_LATENCY and
+asyncio.sleep advances the clock rather than waiting, so the old polling's 5s sleeps cost nothing to run. Needs
+asyncpraw installed, so is skipped without it.
+
+"""
+
+# import libraries
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('asyncpraw')
+
+# import local modules
+from ptn.missionalertbot.modules import RedditClient
+from ptn.missionalertbot.modules.RedditClient import find_own_submission
+
+
+REQUEST_LATENCY = 0.3
+
+# when we made our post, and how long making it took
+POSTED_AT = 1_800_000_000.0
+POSTING_SECONDS = 1.0
+
+TITLE = 'P.T.N. NOBODY\'S HOME (K8Y-T2G) loading Gold in HIP 58832'
+
+# the real asyncio.sleep, since the stub's replaces it
+_yield_to_loop = asyncio.sleep
+
+
+class StubReddit:
+
+    def __init__(self, submissions, subreddit_listing_delay=0.0):
+        """
+        Class stands in for the shared Reddit client, listing the given submissions, all ours, newest first.
+
+        :param list submissions: Our submissions
+        :param float subreddit_listing_delay: Seconds after a post is made that the subreddit's listing shows it
+        """
+        self.submissions = sorted(submissions, key=lambda submission: submission.created_utc, reverse=True)
+        self.subreddit_listing_delay = subreddit_listing_delay
+        # the lookup starts once the post is made
+        self.now = POSTED_AT + POSTING_SECONDS
+        self.requests = 0
+        self.user = SimpleNamespace(me=self.me)
+        self.subreddit = SimpleNamespace(display_name='PilotsTradeNetwork', new=self.subreddit_new)
+
+    async def sleep(self, delay, result=None):
+        self.now += delay
+        # still let the loop run, so timeouts can fire
+        await _yield_to_loop(0)
+        return result
+
+    async def me(self):
+        return SimpleNamespace(submissions=SimpleNamespace(new=self.own_new))
+
+    async def own_new(self, limit=None):
+        self.requests += 1
+        self.now += REQUEST_LATENCY
+        listed = [submission for submission in self.submissions if submission.created_utc <= self.now]
+        for submission in listed[:limit]:
+            yield submission
+
+    async def subreddit_new(self, limit=100):
+        self.requests += 1
+        self.now += REQUEST_LATENCY
+        listed = [submission for submission in self.submissions
+                  if submission.created_utc + self.subreddit_listing_delay <= self.now]
+        for submission in listed[:limit]:
+            yield submission
+
+
+def submission(post_id, created_utc, title=TITLE, subreddit='PilotsTradeNetwork'):
+    return SimpleNamespace(id=post_id, title=title, created_utc=created_utc,
+                           subreddit=SimpleNamespace(display_name=subreddit))
+
+
+@pytest.fixture
+def stub_reddit(monkeypatch):
+    def make(submissions, subreddit_listing_delay=0.0):
+        reddit = StubReddit(submissions, subreddit_listing_delay)
+
+        async def get_reddit():
+            return reddit
+
+        monkeypatch.setattr(RedditClient, 'get_reddit', get_reddit)
+        monkeypatch.setattr(asyncio, 'sleep', reddit.sleep)
+        return reddit
+    return make
+
+
+# the polling find_own_submission replaced, from MissionGenerator
+async def poll_subreddit(subreddit, title):
+    while True:
+        async for new_post in subreddit.new():
+            if new_post.title == title:
+                return new_post
+        await asyncio.sleep(5)
+
+
+# the polling took a request, then another every 5s until the subreddit listed the post
+@pytest.mark.parametrize('subreddit_listing_delay, polled_requests', [(0, 1), (12, 4), (40, 9)])
+def test_one_request_against_polling(stub_reddit, subreddit_listing_delay, polled_requests):
+    new_post = submission('new', POSTED_AT + 0.5)
+    reddit = stub_reddit([new_post], subreddit_listing_delay)
+    assert asyncio.run(find_own_submission(reddit.subreddit, TITLE, POSTED_AT)) is new_post
+    assert reddit.requests == 1
+    assert reddit.now - POSTED_AT - POSTING_SECONDS == pytest.approx(REQUEST_LATENCY)
+
+    reddit = stub_reddit([new_post], subreddit_listing_delay)
+    assert asyncio.run(poll_subreddit(reddit.subreddit, TITLE)) is new_post
+    assert reddit.requests == polled_requests
+    assert reddit.now - POSTED_AT - POSTING_SECONDS == pytest.approx(
+        polled_requests * REQUEST_LATENCY + (polled_requests - 1) * 5)
+
+
+def test_older_post_with_same_title(stub_reddit):
+    old_post = submission('old', POSTED_AT - 3600)
+    new_post = submission('new', POSTED_AT + 0.5)
+    reddit = stub_reddit([old_post, new_post], subreddit_listing_delay=12)
+    # the subreddit doesn't list the new post yet, so the old polling took the old one
+    assert asyncio.run(poll_subreddit(reddit.subreddit, TITLE)) is old_post
+
+    reddit = stub_reddit([old_post, new_post], subreddit_listing_delay=12)
+    assert asyncio.run(find_own_submission(reddit.subreddit, TITLE, POSTED_AT)) is new_post
+    assert reddit.requests == 1
+
+
+def test_other_subreddit_or_title(stub_reddit):
+    new_post = submission('new', POSTED_AT + 0.5)
+    reddit = stub_reddit([
+        new_post,
+        submission('other_subreddit', POSTED_AT + 0.6, subreddit='ptnsandbox'),
+        submission('other_title', POSTED_AT + 0.7, title='P.T.N. EMPTY HOLD (X7Z-91B) loading Gold in HIP 58832'),
+    ])
+    assert asyncio.run(find_own_submission(reddit.subreddit, TITLE, POSTED_AT)) is new_post
+    assert reddit.requests == 1
+
+
+def test_excluded_post_never_returned(stub_reddit):
+    # the post being replaced when a mission is edited, made moments before its replacement
+    replaced_post = submission('replaced', POSTED_AT - 1)
+    new_post = submission('new', POSTED_AT + POSTING_SECONDS + 2 * REQUEST_LATENCY)
+    reddit = stub_reddit([replaced_post, new_post])
+    # listed only after the first request, so found on the next
+    found = asyncio.run(find_own_submission(reddit.subreddit, TITLE, POSTED_AT, exclude_ids={'replaced'}))
+    assert found is new_post
+    assert reddit.requests == 2
+
+
+def test_only_excluded_post_listed(stub_reddit):
+    reddit = stub_reddit([submission('replaced', POSTED_AT - 1)])
+
+    async def find_with_timeout():
+        return await asyncio.wait_for(
+            find_own_submission(reddit.subreddit, TITLE, POSTED_AT, exclude_ids={'replaced'}), timeout=0.2)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(find_with_timeout())
+    assert reddit.requests > 1
@@ -0,0 +1,65 @@
+"""
+Runs the offline WMM replay in bench/wmm_replay.py for a few carriers, checking the cycle's HTTP and Discord calls and
+what it publishes. Needs the bot's dependencies installed, so is skipped without them.
+
+"""
+
+# import libraries
+import asyncio
+
+import pytest
+
+pytest.importorskip('aiohttp')
+pytest.importorskip('discord')
+
+# the replay points the bot at its stubs, so has to be imported before the bot's modules
+from bench.wmm_replay import StubServers, FakeChannel, synthetic_carriers, replay_cycle
+from ptn.missionalertbot.modules.ChannelRenderer import ChannelRenderer
+from ptn.missionalertbot.modules.StockHelpers import close_http_session, market_cache
+
+
+async def replay_two_cycles(count):
+    stubs = StubServers()
+    stubs.start()
+    try:
+        carriers = synthetic_carriers(count)
+        for carrier in carriers:
+            market_cache.invalidate(carrier.carrier_identifier)
+        channels = [FakeChannel(1), FakeChannel(2)]
+        renderers = [ChannelRenderer('test WMM stock'), ChannelRenderer('test CCO supplies')]
+        cold = await replay_cycle(carriers, stubs, channels, renderers)
+        repeat = await replay_cycle(carriers, stubs, channels, renderers)
+        return cold, repeat, channels
+    finally:
+        await close_http_session()
+        stubs.stop()
+
+
+def test_replay():
+    # one event loop for everything, since the stock fetches' semaphores and cache belong to the loop they're used on
+    cold, repeat, (wmm_channel, cco_channel) = asyncio.run(replay_two_cycles(10))
+
+    # every fourth carrier is tracked through Inara, the rest through cAPI
+    assert cold['errors'] == 0
+    assert cold['http_calls'] == cold['http_calls_counted'] == 10
+    # each channel is cleared, then every page is sent
+    assert cold['discord_calls'] == 2 + cold['pages']
+    assert wmm_channel.calls['send'] + cco_channel.calls['send'] == cold['pages']
+
+    # the repeat is served from the market cache, and only the footer's timestamp can have changed
+    assert repeat['http_calls'] == 0
+    assert repeat['discord_calls'] <= 1
+
+    wmm_stock = [line for message in wmm_channel.messages for line in message.content.split('\n')]
+    # a cAPI carrier, with its low Indite
+    capi_line = next(line for line in wmm_stock if 'Replay 1 (R00-001)' in line and line.startswith('Indite'))
+    assert capi_line.startswith("Indite x 650 - HIP 58832 (Malerba) - ")
+    assert "Price: 11,093 - LOW STOCK" in capi_line
+    # an Inara carrier, as of when Inara saw its market
+    inara_line = next(line for line in wmm_stock if '(R00-000)' in line)
+    assert inara_line.startswith("Gold x 22,020 - HIP 58832 (Swanson) - ")
+    assert "NOBODY'S HOME (R00-000)" in inara_line
+    assert "Price: 0 (As of <t:" in inara_line
+
+    cco_supplies = '\n'.join(message.content for message in cco_channel.messages)
+    assert "Indite x 1,300 - HIP 58832 (Malerba)" in cco_supplies